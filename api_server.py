@@ -1,3 +1,4 @@
+from typing import List
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.responses import StreamingResponse
 import asyncio
@@ -6,18 +7,14 @@ from dotenv import set_key
 import os
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from tempfile import NamedTemporaryFile
 from pathlib import Path
-from PIL import Image
-import requests
-from io import BytesIO
-import shutil
 import json
 import yaml
 from src.utils.logger import get_logger
-from src.loaders.mineru_loader import load_json_by_mineru
-from src.preprocessing.cleaner import clean_documents
-from src.preprocessing.filterer import chunk_and_filter
+from src.pipeline import JobManager, JobQueueFull
+from src.pipeline.dedup import FileHashIndex
+from src.pipeline.ingest import ingest_pdf
+from src.pipeline.batch import BatchIngestor
 from src.rag.embedding import EmbeddingManager
 from src.rag.retriever import RetrieverManager
 from src.graph import GraphBuilder
@@ -25,6 +22,11 @@ from src.graph.relation_builder import RelationBuilder
 from src.datamodel import ParagraphChunk
 from src.solver import MathSolver, ConversationMemory
 from src.utils.preprocess import sanitize_prompt
+from src.utils.upload import save_upload, read_upload, UploadTooLarge
+from src.loaders.mineru_loader import ocr_image
+from src.utils.embedding_cache import get_embedding_cache
+from src.utils.llm_cache import get_llm_cache
+from src.utils.rate_limit import limiter_stats
 
 logger = get_logger(__name__)
 
@@ -37,6 +39,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+os.makedirs("data", exist_ok=True)
 app.mount("/files", StaticFiles(directory="data"), name="files")
 
 # 加载 RAG 与 Agent 配置
@@ -51,10 +54,45 @@ file_managers: dict[str, RetrieverManager] = {}
 file_docs: dict[str, list[ParagraphChunk]] = {}
 file_memories: dict[str, ConversationMemory] = {}
 
+# 后台任务池：入库等耗时操作在线程池中执行，不阻塞检索与解题请求
+job_cfg = cfg.get("jobs", {})
+job_manager = JobManager(
+    max_workers=job_cfg.get("max_workers", 2),
+    max_pending=job_cfg.get("max_pending", 32),
+)
+# 上传大小限制与分块大小
+upload_cfg = cfg.get("upload", {})
+MAX_PDF_BYTES = upload_cfg.get("max_pdf_mb", 300) * 1024 * 1024
+MAX_IMAGE_BYTES = upload_cfg.get("max_image_mb", 20) * 1024 * 1024
+UPLOAD_CHUNK = upload_cfg.get("chunk_kb", 1024) * 1024
+
+# PDF 内容哈希 -> file_id，重复上传直接复用已有结果
+file_index = FileHashIndex(Path("data") / "file_index.json")
+
 class EnvUpdate(BaseModel):
     SILICONFLOW_API_KEY: str | None = None
     OPENAI_COMPATIBILITY_API_KEY: str | None = None
 
+@app.get("/health")
+async def health():
+    """存活检查：不触发模型、分词器或向量库的加载"""
+    return {"status": "ok"}
+
+@app.get("/llm_cache")
+async def llm_cache_stats():
+    """LLM 响应缓存的命中统计与容量"""
+    return get_llm_cache().stats()
+
+@app.get("/embedding_cache")
+async def embedding_cache_stats():
+    """向量缓存的命中统计与容量"""
+    return get_embedding_cache().stats()
+
+@app.get("/rate_limit")
+async def rate_limit_stats():
+    """各服务商限流器的当前并发上限、排队数与 429 次数"""
+    return limiter_stats()
+
 @app.post("/update_env")
 async def update_env(data: EnvUpdate):
     """更新服务器环境变量并写入 .env 文件"""
@@ -68,36 +106,87 @@ async def update_env(data: EnvUpdate):
     logger.info("Environment variables updated")
     return {"status": "ok"}
 
+def _cache_file(file_id: str, docs: list[ParagraphChunk], emb_mgr: EmbeddingManager) -> None:
+    """缓存切片与检索器；流式入库时每批 chunk 入索引后即可检索"""
+    file_docs[file_id] = docs
+    file_memories.setdefault(file_id, ConversationMemory())
+    if file_id not in file_managers:
+        file_managers[file_id] = RetrieverManager(emb_mgr, cfg["retriever"])
+
+
+def _run_ingest(report, tmp_path: str) -> dict:
+    """后台执行入库流程，并缓存结果供后续请求使用"""
+    file_id, docs, emb_mgr = ingest_pdf(
+        tmp_path, cfg["embedding"], report=report, index=file_index,
+        on_partial=_cache_file,
+    )
+    _cache_file(file_id, docs, emb_mgr)
+    return {"indexed": len(docs), "file_id": file_id}
+
+
 @app.post("/ingest")
 async def ingest(file: UploadFile = File(...)):
-    """上传并索引单个 PDF 文件"""
+    """上传单个 PDF 文件并提交后台索引任务，立即返回 job_id"""
     logger.info("Received file upload: %s", file.filename)
-    with NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
-
-    # 解析并切分文档
-    file_id, docs = load_json_by_mineru(tmp_path)
-    docs = clean_documents(docs)
-    docs = chunk_and_filter(docs)
-    file_docs[file_id] = docs
-    file_memories[file_id] = ConversationMemory()
-
-    # 保存切片以便后续构建关系图
-    save_dir = Path("data/relation_store") / file_id
-    save_dir.mkdir(parents=True, exist_ok=True)
-    with (save_dir / "chunks.json").open("w", encoding="utf-8") as f:
-        json.dump([c.to_json() for c in docs], f, ensure_ascii=False, indent=2)
-
-    # 构建针对该文件的向量索引
-    emb_mgr = EmbeddingManager(cfg["embedding"], file_id)
-    emb_mgr.build_or_load(docs, force_rebuild=True)
-    retr_mgr = RetrieverManager(emb_mgr, cfg["retriever"])
-    file_managers[file_id] = retr_mgr
-    logger.info("Indexed %d chunks for %s", len(docs), file_id)
-
-    shutil.move(tmp_path, Path("data") / f"{file_id}.pdf")
-    return {"indexed": len(docs), "file_id": file_id}
+    try:
+        tmp_path = await save_upload(
+            file, Path(file.filename).suffix, MAX_PDF_BYTES, UPLOAD_CHUNK
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    try:
+        job = job_manager.submit("ingest", _run_ingest, tmp_path)
+    except JobQueueFull as e:
+        os.remove(tmp_path)
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"job_id": job.id, "status": job.status}
+
+
+def _run_ingest_batch(report, tmp_paths: list[str]) -> dict:
+    """后台流水线批量入库，完成一个文档即可被检索"""
+    def on_done(doc, docs, emb_mgr):
+        _cache_file(doc.file_id, docs, emb_mgr)
+
+    batch_cfg = cfg.get("batch", {})
+    ingestor = BatchIngestor(
+        cfg["embedding"],
+        index=file_index,
+        parse_workers=batch_cfg.get("parse_workers", 2),
+        filter_workers=batch_cfg.get("filter_workers", 4),
+        embed_workers=batch_cfg.get("embed_workers", 2),
+        on_done=on_done,
+    )
+    documents = ingestor.run(tmp_paths, report)
+    return {"documents": documents}
+
+
+@app.post("/ingest_batch")
+async def ingest_batch(files: List[UploadFile] = File(...)):
+    """上传多个 PDF，提交一个流水线批量索引任务，立即返回 job_id"""
+    logger.info("Received batch upload of %d files", len(files))
+    tmp_paths: list[str] = []
+    try:
+        for file in files:
+            tmp_paths.append(await save_upload(
+                file, Path(file.filename).suffix, MAX_PDF_BYTES, UPLOAD_CHUNK
+            ))
+        job = job_manager.submit("ingest_batch", _run_ingest_batch, tmp_paths)
+    except (UploadTooLarge, JobQueueFull) as e:
+        for p in tmp_paths:
+            os.remove(p)
+        code = 413 if isinstance(e, UploadTooLarge) else 429
+        raise HTTPException(status_code=code, detail=str(e))
+    return {"job_id": job.id, "status": job.status, "files": len(tmp_paths)}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询后台任务的状态、阶段、进度及错误信息"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
 
 
 @app.get("/search")
@@ -117,7 +206,8 @@ async def search(q: str, file_id: str, top_k: int = 5):
         retr = RetrieverManager(emb_mgr, cfg["retriever"])
         file_managers[file_id] = retr
 
-    results = retr.retrieve(q, top_k=top_k)
+    # 查询编码可能在限流器中等待，放到线程池执行，不阻塞事件循环
+    results = await asyncio.to_thread(retr.retrieve, q, top_k=top_k)
     logger.info("Found %d results", len(results))
     return {"results": results}
 
@@ -133,28 +223,12 @@ async def list_files():
 async def image_ocr(file: UploadFile = File(...)):
     """识别上传图片中的数学公式并返回 LaTeX"""
     logger.info("OCR image uploaded: %s", file.filename)
-    with NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
     try:
-        image = Image.open(tmp_path).convert("RGB")
-        pdf_buffer = BytesIO()
-        image.save(pdf_buffer, format="PDF")
-        pdf_buffer.seek(0)
-
-        res = requests.post(
-            "http://localhost:8000/parse",
-            files={"file": ("image.pdf", pdf_buffer.getvalue(), "application/pdf")},
-            data={"dump_md": False, "draw_layout": False},
-            timeout=60,
-        )
-        res.raise_for_status()
-        blocks = res.json()
-        equations = [b["text"] for b in blocks if "text" in b]
-        latex = "\n".join(equations) if equations else ""
-        return {"latex": latex}
-    finally:
-        os.remove(tmp_path)
+        data = await read_upload(file, MAX_IMAGE_BYTES, UPLOAD_CHUNK)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    latex = await asyncio.to_thread(ocr_image, data, file.filename or "image.png")
+    return {"latex": latex}
 
 
 @app.post("/build_graph")
@@ -190,7 +264,7 @@ async def build_graph(file_id: str, top_k: int = 5):
         top_k=top_k,
         base_dir="data/relation_store",
     )
-    relations = gb.build_and_save(chunks)
+    relations = await asyncio.to_thread(gb.build_and_save, chunks)
     logger.info("Graph built with %d relations", len(relations))
     return {"relations": relations}
 
@@ -333,7 +407,8 @@ async def solve(req: SolveRequest):
         file_memories[req.file_id] = memory
     solver = MathSolver(retr, docs, memory)
     question = sanitize_prompt(req.question)
-    answer = solver.solve(question)
+    # 解答请求可能在限流器中等待配额或 429 暂停，放到线程池执行，避免阻塞其他请求
+    answer = await asyncio.to_thread(solver.solve, question)
     logger.info("Answer generated")
     return {"answer": answer}
 
@@ -368,10 +443,11 @@ async def solve_stream(req: SolveRequest):
         file_memories[req.file_id] = memory
     solver = MathSolver(retr, docs, memory)
     question = sanitize_prompt(req.question)
-    async def gen():
+
+    # 同步生成器由 StreamingResponse 在线程池中迭代，等待限流或模型输出时不阻塞事件循环
+    def gen():
         for chunk in solver.stream_solve(question):
             yield chunk.encode("utf-8")
-            await asyncio.sleep(0)
 
     headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     return StreamingResponse(gen(), media_type="text/plain; charset=utf-8", headers=headers)
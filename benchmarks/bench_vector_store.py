@@ -0,0 +1,106 @@
+# benchmarks/bench_vector_store.py
+"""对比本地 Qdrant 与 src.rag.flat_store（none / int8 / binary）的写入、加载、内存与查询延迟，并统计召回率。
+
+向量为随机生成的归一化向量，召回率以精确余弦 top-k 为基准。
+
+用法：python -m benchmarks.bench_vector_store [--n 5000] [--dim 1024] [--queries 200] [--top-k 5]
+"""
+
+import argparse
+import gc
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from camel.storages.vectordb_storages import VectorDBQuery, VectorRecord
+
+from src.rag.flat_store import FlatVectorStorage
+
+
+def make_qdrant(dim: int, path: str):
+    from camel.storages import QdrantStorage
+    from camel.types import VectorDistance
+
+    return QdrantStorage(vector_dim=dim, path=path, collection_name="bench", distance=VectorDistance.COSINE)
+
+
+def make_flat(quantization: str, rescore: int):
+    def factory(dim: int, path: str):
+        return FlatVectorStorage(dim, path, "bench", quantization=quantization, rescore=rescore)
+
+    return factory
+
+
+def rss_mb() -> float:
+    """进程的峰值常驻内存（MB，Linux 下 ru_maxrss 单位为 KB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run(name, factory, vecs, queries, top_k, truth):
+    dim = vecs.shape[1]
+    with tempfile.TemporaryDirectory() as path:
+        store = factory(dim, path)
+        records = [VectorRecord(id=f"{i:032x}", vector=v.tolist(), payload={"i": i}) for i, v in enumerate(vecs)]
+        _, t_write = timed(lambda: [store.add(records[i : i + 256]) for i in range(0, len(records), 256)])
+        del store, records
+        gc.collect()
+
+        # 重新打开并执行首个查询，计入加载耗时与 Python 堆上新分配的内存
+        tracemalloc.start()
+        start = time.perf_counter()
+        store = factory(dim, path)
+        store.query(VectorDBQuery(query_vector=queries[0].tolist(), top_k=top_k))
+        t_load = time.perf_counter() - start
+        heap = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+        latencies, recall = [], []
+        for q, want in zip(queries, truth):
+            hits, t = timed(store.query, VectorDBQuery(query_vector=q.tolist(), top_k=top_k))
+            latencies.append(t * 1000)
+            got = {int(h.record.payload["i"]) for h in hits}
+            recall.append(len(got & want) / top_k)
+        p50, p95 = np.percentile(latencies, [50, 95])
+        print(f"  {name:<14} write {t_write:6.2f}s  load {t_load * 1000:8.1f}ms  heap {heap:7.1f}MB  "
+              f"p50 {p50:6.2f}ms  p95 {p95:6.2f}ms  recall@{top_k} {np.mean(recall):.3f}  "
+              f"(peak rss {rss_mb():.0f}MB)")
+        del store
+        gc.collect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rescore", type=int, default=4)
+    parser.add_argument("--skip-qdrant", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((args.n, args.dim)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    # 查询取自库中向量加噪声，使 top-k 有意义
+    picks = rng.integers(args.n, size=args.queries)
+    queries = vecs[picks] + 0.5 * rng.standard_normal((args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+    scores = queries @ vecs.T
+    truth = [set(np.argsort(-s)[: args.top_k].tolist()) for s in scores]
+
+    stores = [] if args.skip_qdrant else [("qdrant", make_qdrant)]
+    stores += [(f"flat-{q}", make_flat(q, args.rescore)) for q in ("none", "int8", "binary")]
+    print(f"{args.n} vectors x {args.dim} dims, {args.queries} queries, top_k={args.top_k}")
+    for name, factory in stores:
+        run(name, factory, vecs, queries, args.top_k, truth)
+
+
+if __name__ == "__main__":
+    main()
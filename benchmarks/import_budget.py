@@ -0,0 +1,69 @@
+# benchmarks/import_budget.py
+"""导入耗时预算检查：在子进程中以 -X importtime 导入模块，列出最慢的导入并校验总耗时。
+
+用法：python -m benchmarks.import_budget [--module api_server] [--budget 1.0] [--top 15]
+超出预算或导入了 HEAVY_MODULES 中的依赖时以非零状态退出，可用于 CI。
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# 只应在首次调用时才加载的重量级依赖
+HEAVY_MODULES = ("camel", "qdrant_client", "tiktoken", "unstructured", "openai", "pypdf", "torch")
+
+
+def measure(module: str, cwd: str | os.PathLike = ROOT) -> List[Tuple[int, int, str]]:
+    """返回 [(累计微秒, 自身微秒, 模块名)]，按累计耗时降序"""
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cum_us = int(parts[0]), int(parts[1])
+        except ValueError:  # 表头
+            continue
+        rows.append((cum_us, self_us, parts[2].strip()))
+    return sorted(rows, reverse=True)
+
+
+def heavy_imports(rows: List[Tuple[int, int, str]]) -> List[str]:
+    return sorted({name.split(".")[0] for _, _, name in rows if name.split(".")[0] in HEAVY_MODULES})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="api_server")
+    parser.add_argument("--budget", type=float, default=1.0, help="总导入耗时上限（秒）")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    total = next((cum for cum, _, name in rows if name == args.module), rows[0][0]) / 1e6
+    print(f"import {args.module}: {total:.3f}s (budget {args.budget:.3f}s)")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cum, own, name in rows[: args.top]:
+        print(f"{cum / 1e3:10.1f}ms {own / 1e3:8.1f}ms  {name}")
+
+    heavy = heavy_imports(rows)
+    if heavy:
+        print(f"heavy modules imported eagerly: {', '.join(heavy)}")
+    if heavy or total > args.budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
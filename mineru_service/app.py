@@ -1,16 +1,30 @@
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
 import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import List
 
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-from magic_pdf.data.data_reader_writer import FileBasedDataWriter, FileBasedDataReader
-from magic_pdf.data.dataset import PymuDocDataset
-from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
-from magic_pdf.config.enums import SupportedPdfParseMethod
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 常驻解析进程数（每个进程加载一份模型）与排队上限，可通过环境变量调整
+WORKERS = int(os.environ.get("MINERU_WORKERS", "1"))
+MAX_QUEUE = int(os.environ.get("MINERU_MAX_QUEUE", "8"))
+# 解析结果缓存上限（MB），0 表示关闭缓存
+CACHE_MB = int(os.environ.get("MINERU_CACHE_MB", "2048"))
+# 图片公式识别：并发请求攒批的最大张数、最长等待（毫秒）与排队上限
+OCR_BATCH = int(os.environ.get("MINERU_OCR_BATCH", "8"))
+OCR_WAIT_MS = int(os.environ.get("MINERU_OCR_WAIT_MS", "20"))
+OCR_MAX_PENDING = int(os.environ.get("MINERU_OCR_MAX_PENDING", "64"))
 
 app = FastAPI()
-@app.get("/health")
-def health():
-    return {"status": "ok"}
 
 # prepare env
 local_image_dir, local_md_dir = "/data/mineru/images", "/data/mineru"
@@ -18,19 +32,27 @@ image_dir = str(os.path.basename(local_image_dir))
 
 os.makedirs(local_image_dir, exist_ok=True)
 
-image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(
-    local_md_dir
-)
 
-@app.post("/parse")
-async def parse(
-    file: UploadFile = File(...),
-    dump_md: bool = Form(False),
-    draw_layout: bool = Form(False)
-):
-    name_without_suff = file.filename.split(".")[0]
+def _warm_up():
+    """子进程启动时预加载模型，避免首个请求承担加载开销"""
+    try:
+        from magic_pdf.model.doc_analyze_by_custom_model import ModelSingleton
+        ModelSingleton().get_model(ocr=True, show_log=False)
+        ModelSingleton().get_model(ocr=False, show_log=False)
+    except Exception as e:  # 版本差异时退化为首次解析时加载
+        print(f"model warm up skipped: {e}")
 
-    pdf_bytes = await file.read()              # 读取上传文件
+
+def _parse_pdf(pdf_bytes: bytes, name_without_suff: str, dump_md: bool, draw_layout: bool):
+    """在解析进程中执行版面分析与 OCR，返回 content list"""
+    from magic_pdf.data.data_reader_writer import FileBasedDataWriter
+    from magic_pdf.data.dataset import PymuDocDataset
+    from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
+    from magic_pdf.config.enums import SupportedPdfParseMethod
+
+    image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(
+        local_md_dir
+    )
     ds = PymuDocDataset(pdf_bytes)
 
     # 判定 TXT / OCR，决定是否打开 OCR
@@ -51,5 +73,474 @@ async def parse(
     # 导出中间格式（含 para_blocks、bbox 等）
     content_list_content = pipe_result.get_content_list(image_dir)
     pipe_result.dump_content_list(md_writer, f"{name_without_suff}_content_list.json", image_dir)
+    return content_list_content
+
+
+def _formula_models():
+    """取出已加载模型中的公式检测（MFD）与公式识别（MFR）子模型"""
+    from magic_pdf.model.doc_analyze_by_custom_model import ModelSingleton
+    model = ModelSingleton().get_model(ocr=True, show_log=False)
+    return model.mfd_model, model.mfr_model
+
+
+def _ocr_images(images: List[bytes]) -> List[dict]:
+    """在解析进程中对一批图片直接做公式检测与识别，跳过 PDF 分类与版面分析。
+
+    返回与输入等长的列表，每项为 {"formulas": [...]}（按阅读顺序）或 {"error": ...}。
+    """
+    import numpy as np
+    from PIL import Image
+
+    results: List[dict] = [{} for _ in images]
+    arrays, index = [], []
+    for i, data in enumerate(images):
+        try:
+            arrays.append(np.asarray(Image.open(BytesIO(data)).convert("RGB")))
+            index.append(i)
+        except Exception as e:
+            results[i] = {"error": f"{type(e).__name__}: {e}"}
+    if not arrays:
+        return results
+
+    mfd, mfr = _formula_models()
+    if hasattr(mfd, "batch_predict") and hasattr(mfr, "batch_predict"):
+        detections = mfd.batch_predict(arrays, len(arrays))
+        formula_lists = mfr.batch_predict(detections, arrays, batch_size=len(arrays))
+    else:  # 旧版本模型只提供逐张接口
+        formula_lists = [mfr.predict(mfd.predict(a), a) for a in arrays]
+
+    for i, formulas in zip(index, formula_lists):
+        # poly 为四点坐标 [x0, y0, x1, y0, x1, y1, x0, y1]，按行再按列排序
+        formulas = sorted(formulas, key=lambda f: (round(f["poly"][1] / 10), f["poly"][0]))
+        results[i] = {
+            "formulas": [
+                {
+                    "latex": f.get("latex", ""),
+                    "bbox": [f["poly"][0], f["poly"][1], f["poly"][4], f["poly"][5]],
+                    "score": round(float(f.get("score", 0)), 4),
+                }
+                for f in formulas
+            ]
+        }
+    return results
+
+
+class ParseQueue:
+    """解析进程池 + 有界队列：超过容量时拒绝请求并给出重试建议"""
+
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0  # 已接收、尚未完成的文件数（含正在解析的）
+        self.avg_seconds = 30.0  # 单个文件解析耗时的滑动平均，用于估算重试时间
+        self.pool: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up,
+        )
+
+    def stop(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def retry_after(self) -> int:
+        waves = (self.pending - self.workers) / self.workers + 1
+        return max(1, math.ceil(self.avg_seconds * waves))
+
+    def admit(self, n: int = 1) -> None:
+        """为 n 个文件占用队列名额，容量不足时抛出 429"""
+        if self.pending + n > self.workers + self.max_queue:
+            raise HTTPException(
+                status_code=429,
+                detail="parse queue is full",
+                headers={"Retry-After": str(self.retry_after())},
+            )
+        self.pending += n
+
+    def try_admit(self) -> bool:
+        """有空闲名额时占用一个并返回 True，否则返回 False（不抛出 429）"""
+        if self.pending + 1 > self.workers + self.max_queue:
+            return False
+        self.pending += 1
+        return True
+
+    def release(self, n: int = 1) -> None:
+        self.pending -= n
+
+    async def run(self, *args):
+        """在进程池中解析（调用前须已 admit，名额由调用方释放）"""
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        try:
+            return await loop.run_in_executor(self.pool, _parse_pdf, *args)
+        finally:
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (time.monotonic() - start)
+
+    def status(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "busy": min(self.pending, self.workers),
+            "waiting": max(0, self.pending - self.workers),
+            "avg_parse_seconds": round(self.avg_seconds, 2),
+        }
+
+
+class ParseCache:
+    """按 PDF 内容哈希缓存 content list，超过容量时按最近最少使用淘汰"""
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.dir = directory
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()  # key -> 文件大小，按访问先后排列
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        files = [f for f in os.scandir(directory) if f.name.endswith(".json")]
+        for f in sorted(files, key=lambda f: f.stat().st_mtime):
+            size = f.stat().st_size
+            self.entries[f.name[:-5]] = size
+            self.total += size
+
+    @staticmethod
+    def key(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.dir, f"{key}.json")
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = json.load(f)
+            os.utime(path)
+            return content
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.total -= self.entries.pop(key, 0)
+            return None
+
+    def put(self, key: str, content) -> None:
+        if self.max_bytes <= 0:
+            return
+        path = self._path(key)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(content, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.total += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            while self.total > self.max_bytes and len(self.entries) > 1:
+                old, old_size = self.entries.popitem(last=False)
+                self.total -= old_size
+                try:
+                    os.remove(self._path(old))
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class OcrBatcher:
+    """把并发到达的图片识别请求攒成一批提交到解析进程池。
+
+    凑满 max_batch 张或等待 max_wait 秒后立即提交；排队超过 max_pending 时返回 429。
+    """
+
+    def __init__(self, max_batch: int, max_wait: float, max_pending: int) -> None:
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.pending = 0
+        self.batches = 0
+        self.images = 0
+        self._items: list = []  # [(图片字节, Future)]
+        self._timer: asyncio.TimerHandle | None = None
+
+    async def submit(self, data: bytes) -> dict:
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=429,
+                detail="ocr queue is full",
+                headers={"Retry-After": "1"},
+            )
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._items.append((data, fut))
+        self.pending += 1
+        if len(self._items) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        try:
+            return await fut
+        finally:
+            self.pending -= 1
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._items = self._items, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: list) -> None:
+        loop = asyncio.get_running_loop()
+        self.batches += 1
+        self.images += len(batch)
+        try:
+            results = await loop.run_in_executor(
+                parse_queue.pool, _ocr_images, [data for data, _ in batch]
+            )
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+
+    def status(self) -> dict:
+        return {
+            "pending": self.pending,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "avg_batch_size": round(self.images / self.batches, 2) if self.batches else 0,
+        }
+
 
+parse_queue = ParseQueue(WORKERS, MAX_QUEUE)
+parse_cache = ParseCache(os.path.join(local_md_dir, "cache"), CACHE_MB * 1024 * 1024)
+ocr_batcher = OcrBatcher(OCR_BATCH, OCR_WAIT_MS / 1000, OCR_MAX_PENDING)
+
+
+async def _parse_cached(pdf_bytes: bytes, name: str, dump_md: bool, draw_layout: bool, admitted: bool = False):
+    """命中缓存直接返回；否则进入解析队列并写入缓存。
+
+    需要导出 md / 版面图时绕过缓存，保证产物生成。``admitted`` 表示调用方已占用队列名额；
+    无论成功、命中缓存还是出错，返回前都会释放该名额。
+    """
+    if not admitted:
+        parse_queue.admit()
+    try:
+        use_cache = CACHE_MB > 0 and not dump_md and not draw_layout
+        key = parse_cache.key(pdf_bytes) if use_cache else None
+        if use_cache:
+            cached = await asyncio.to_thread(parse_cache.get, key)
+            if cached is not None:
+                return cached
+        content = await parse_queue.run(pdf_bytes, name, dump_md, draw_layout)
+    finally:
+        parse_queue.release()
+    if use_cache:
+        await asyncio.to_thread(parse_cache.put, key, content)
+    return content
+
+
+@app.on_event("startup")
+def _startup():
+    parse_queue.start()
+
+
+@app.on_event("shutdown")
+def _shutdown():
+    parse_queue.stop()
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/queue")
+def queue():
+    """当前解析队列深度、worker 占用情况及缓存命中统计"""
+    return {**parse_queue.status(), "cache": parse_cache.stats(), "ocr": ocr_batcher.status()}
+
+
+@app.post("/parse")
+async def parse(
+    file: UploadFile = File(...),
+    dump_md: bool = Form(False),
+    draw_layout: bool = Form(False)
+):
+    name_without_suff = file.filename.split(".")[0]
+    pdf_bytes = await file.read()              # 读取上传文件
+    content_list_content = await _parse_cached(pdf_bytes, name_without_suff, dump_md, draw_layout)
     return JSONResponse(content=content_list_content)
+
+
+@app.post("/parse_batch")
+async def parse_batch(
+    files: List[UploadFile] = File(...),
+    dump_md: bool = Form(False),
+    draw_layout: bool = Form(False)
+):
+    """一次提交多个文件，由进程池并行解析，按提交顺序返回各自结果或错误"""
+    payloads = [(await f.read(), f.filename.split(".")[0]) for f in files]
+    # 整批一次性占用名额（命中缓存的条目随后释放），避免批次被拆开部分执行
+    parse_queue.admit(len(files))
+    started = 0  # 已交给 _parse_cached 的条目，其名额由 _parse_cached 释放
+
+    async def one(pdf_bytes, name):
+        nonlocal started
+        started += 1
+        try:
+            content = await _parse_cached(pdf_bytes, name, dump_md, draw_layout, admitted=True)
+            return {"filename": name, "content_list": content}
+        except Exception as e:
+            return {"filename": name, "error": f"{type(e).__name__}: {e}"}
+
+    try:
+        results = await asyncio.gather(*(one(b, n) for b, n in payloads))
+    finally:
+        # 请求被取消时尚未开始的条目不会进入 _parse_cached，在此归还其名额
+        parse_queue.release(len(files) - started)
+    return JSONResponse(content=results)
+
+
+@app.post("/ocr_image")
+async def ocr_image(file: UploadFile = File(...)):
+    """直接识别图片中的公式：{"formulas": [{"latex", "bbox", "score"}, ...]}
+
+    图片在内存中解码后交给公式检测/识别模型，不经过 PDF 转换与版面分析；
+    并发请求合并成批推理，结果按图片内容哈希缓存。
+    """
+    data = await file.read()
+    key = "img-" + parse_cache.key(data)
+    if CACHE_MB > 0:
+        cached = await asyncio.to_thread(parse_cache.get, key)
+        if cached is not None:
+            return JSONResponse(content=cached)
+    result = await ocr_batcher.submit(data)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    if CACHE_MB > 0:
+        await asyncio.to_thread(parse_cache.put, key, result)
+    return JSONResponse(content=result)
+
+
+def _open_pdf(pdf_bytes: bytes):
+    import fitz
+    return fitz.open(stream=pdf_bytes, filetype="pdf")
+
+
+def _extract_pages(doc, start: int, end: int) -> bytes:
+    import fitz
+    sub = fitz.open()
+    sub.insert_pdf(doc, from_page=start, to_page=end - 1)
+    data = sub.tobytes()
+    sub.close()
+    return data
+
+
+@app.post("/parse_stream")
+async def parse_stream(
+    file: UploadFile = File(...),
+    window_pages: int = Form(8),
+):
+    """按页窗口解析并以 NDJSON 逐页返回：每行 {"page_idx": 页码, "blocks": [...]}
+
+    窗口依次提交到进程池（最多 workers 个同时进行），先完成的页先返回，
+    下游无需等待整本解析结束即可开始切分与索引。出错时输出一行 {"error": ...} 并结束。
+
+    每个在途窗口占用一个队列名额：首个名额在接收请求时占用（队列满时返回 429），
+    其余窗口只在队列有空闲名额时并行，/queue 的深度与 429 反映真实负载。
+    """
+    name_without_suff = file.filename.split(".")[0]
+    pdf_bytes = await file.read()
+    parse_queue.admit()
+    try:
+        doc = await asyncio.to_thread(_open_pdf, pdf_bytes)
+    except BaseException:
+        parse_queue.release()
+        raise
+    doc_key = parse_cache.key(pdf_bytes)
+    window_pages = max(1, window_pages)
+    windows = [(s, min(s + window_pages, doc.page_count)) for s in range(0, doc.page_count, window_pages)]
+    split_lock = asyncio.Lock()
+    loop = asyncio.get_running_loop()
+
+    async def parse_window(start: int, end: int):
+        key = f"{doc_key}-{start}-{end}"
+        if CACHE_MB > 0:
+            cached = await asyncio.to_thread(parse_cache.get, key)
+            if cached is not None:
+                return cached
+        async with split_lock:
+            data = await asyncio.to_thread(_extract_pages, doc, start, end)
+        content = await loop.run_in_executor(
+            parse_queue.pool, _parse_pdf, data, f"{name_without_suff}_p{start}", False, False
+        )
+        if CACHE_MB > 0:
+            await asyncio.to_thread(parse_cache.put, key, content)
+        return content
+
+    async def gen():
+        todo = deque(windows)
+        running = deque()
+        held = 1  # 本请求占用的队列名额数
+
+        def schedule() -> None:
+            nonlocal held
+            while todo and len(running) < parse_queue.workers:
+                if len(running) >= held:
+                    if not parse_queue.try_admit():
+                        break
+                    held += 1
+                win = todo.popleft()
+                running.append((win, asyncio.ensure_future(parse_window(*win))))
+
+        try:
+            schedule()
+            while running:
+                (start, end), task = running.popleft()
+                try:
+                    blocks = await task
+                except Exception as e:
+                    yield json.dumps({"error": f"{type(e).__name__}: {e}"}) + "\n"
+                    return
+                schedule()
+                # 剩余窗口不足以用满已占名额时归还多余的部分（至少保留一个直到结束）
+                surplus = held - max(1, len(running))
+                if surplus > 0:
+                    parse_queue.release(surplus)
+                    held -= surplus
+                pages = {p: [] for p in range(start, end)}
+                for b in blocks:
+                    b["page_idx"] = b.get("page_idx", 0) + start
+                    pages.setdefault(b["page_idx"], []).append(b)
+                for p in sorted(pages):
+                    yield json.dumps({"page_idx": p, "blocks": pages[p]}, ensure_ascii=False) + "\n"
+        finally:
+            for _, task in running:
+                task.cancel()
+            parse_queue.release(held)
+            doc.close()
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
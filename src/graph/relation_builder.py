@@ -1,16 +1,16 @@
 # src/graph/relation_builder.py
 
-import json, backoff
+import json
 from typing import Dict
 from textwrap import dedent
 from jsonschema import validate, ValidationError
 from dotenv import load_dotenv
-from camel.agents import ChatAgent
-from camel.models import ModelFactory
-from camel.types import ModelPlatformType
-from camel.messages import BaseMessage
 
 from src.datamodel import ParagraphChunk
+from src.utils.http import use_shared_client
+from src.utils.llm_cache import get_llm_cache, prompt_version
+from src.utils.rate_limit import Priority, get_limiter
+from src.utils.tokens import count_tokens
 
 load_dotenv()
 
@@ -27,9 +27,7 @@ REL_SCHEMA = {
     },
 }
 
-sys_msg = BaseMessage.make_assistant_message(
-    role_name="math_editor",
-    content=dedent(
+SYSTEM_PROMPT = dedent(
         """
         你是一名严谨的数学编辑。
         输入：一对<b>数学文本</b>（都是定理/引理/命题），假设两段文本分别为 text1 和 text2，格式如下：
@@ -48,9 +46,20 @@ sys_msg = BaseMessage.make_assistant_message(
            b. 将 `relation_type` 字段和 `summary` 字段设为空字符串。
         5. 最终输出一个 JSON 对象。
         """
-    )
 )
 
+
+# 与原先 ChatAgent(output_language="中文") 附加在系统消息后的语言要求一致
+SYSTEM_CONTENT = SYSTEM_PROMPT + "\nRegardless of the input language, you must output text in 中文."
+
+def _is_valid(data) -> bool:
+    try:
+        validate(data, REL_SCHEMA)
+    except ValidationError:
+        return False
+    return True
+
+
 def _make_user_prompt(pair, chunks):
     """构造单个候选对的用户提示"""
     h, t, _ = pair
@@ -74,36 +83,55 @@ class RelationBuilder:
             }
         }
 
+        from camel.models import ModelFactory
+        from camel.types import ModelPlatformType
+
         self.model = ModelFactory.create(
             model_platform=ModelPlatformType[config["model_platform"]],
             model_type=config["model_type"],
             model_config_dict=model_config,
         )
-
-    @backoff.on_exception(backoff.expo, Exception, max_tries=5)
-    def _call_llm(self, user_msg):
-        agent = ChatAgent(
-            system_message=sys_msg,
-            model=self.model,
-            output_language="中文",
+        use_shared_client(self.model)
+        self.model_type = config["model_type"]
+        self.prompt_version = prompt_version(SYSTEM_PROMPT, model_config)
+        self.cache = get_llm_cache()
+        # 建图是后台任务，排在解答与入库请求之后；429 与可重试错误由限流器统一退避
+        self.limiter = get_limiter(config["model_platform"], config["model_type"])
+
+    def _call_llm(self, content: str) -> str:
+        messages = self.model.preprocess_messages([
+            {"role": "system", "content": SYSTEM_CONTENT},
+            {"role": "user", "content": content},
+        ])
+        req_cfg = self.model.model_config_dict.copy()
+        req_cfg.pop("stream", None)
+        rsp = self.limiter.call(
+            lambda: self.model._client.chat.completions.create(
+                messages=messages, model=self.model.model_type, **req_cfg
+            ),
+            tokens=count_tokens(SYSTEM_CONTENT) + count_tokens(content),
+            priority=Priority.BACKGROUND,
         )
-        return agent.step(user_msg).msgs[0].content
+        return rsp.choices[0].message.content
 
     def build_relations(self, chunks: Dict[str, ParagraphChunk], candidate_pairs):
-        """逐个调用 LLM 构建关系"""
+        """逐个调用 LLM 构建关系；通过校验的响应写入共享的 LLM 缓存，重建图时直接复用"""
         triples = []
         for pair in candidate_pairs:
-            user_msg = BaseMessage.make_user_message(
-                role_name="pairs_provider",
-                content="\n\n输入数据：\n" + _make_user_prompt(pair, chunks)
-            )
-            rsp = self._call_llm(user_msg)
-            try:
-                data = json.loads(rsp)
-                validate(data, REL_SCHEMA)
-            except (json.JSONDecodeError, ValidationError):
-                print("Schema 校验失败")
-                continue
+            content = "\n\n输入数据：\n" + _make_user_prompt(pair, chunks)
+            key = self.cache.key("relation", self.model_type, self.prompt_version, content)
+            data = self.cache.get(key)
+            if data is not None and not _is_valid(data):
+                data = None  # 缓存中未通过校验的响应不再复用，重新请求
+            if data is None:
+                rsp = self._call_llm(content)
+                try:
+                    data = json.loads(rsp)
+                    validate(data, REL_SCHEMA)
+                except (json.JSONDecodeError, ValidationError):
+                    print("Schema 校验失败")
+                    continue
+                self.cache.put(key, data)
 
             if data.get("related"):
                 triples.append({
@@ -1,35 +1,273 @@
 # src/loaders/mineru_loader.py
 
+import json
+import queue
+import threading
+import time
 import uuid
-import requests
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Tuple, TYPE_CHECKING
 from src.datamodel import ParagraphChunk
+from src.utils.config import load_config
+from src.utils.http import get_http_client
+from src.utils.logger import get_logger
+
+if TYPE_CHECKING:
+    from pypdf import PdfReader
+
+logger = get_logger(__name__)
+
+# 解析大文件耗时较长，只限制连接建立时间
+PARSE_TIMEOUT = httpx.Timeout(None, connect=10.0)
+MAX_BUSY_WAIT = 60.0
+
+def mineru_config() -> dict:
+    """rag_config.yaml 中的 mineru 配置（服务地址、分片页数、并发数）"""
+    return load_config("rag_config").get("mineru", {})
+
+def _post_pdf(url: str, name: str, fp: BinaryIO, dump_md: bool, draw_layout: bool,
+              max_busy_retries: int = 10) -> list:
+    # 以文件对象作为 multipart 字段时 httpx 分块读取发送，不会整体载入内存
+    for _ in range(max_busy_retries + 1):
+        fp.seek(0)
+        res = get_http_client().post(
+            url,
+            files={"file": (name, fp, "application/pdf")},
+            data={
+                "dump_md": str(dump_md),
+                "draw_layout": str(draw_layout)
+            },
+            timeout=PARSE_TIMEOUT,
+        )
+        if res.status_code != 429:
+            break
+        # 解析服务队列已满，按其建议的时间后重试
+        wait = min(float(res.headers.get("Retry-After", 5)), MAX_BUSY_WAIT)
+        logger.info("MinerU busy, retrying %s in %.0fs", name, wait)
+        time.sleep(wait)
+    res.raise_for_status()
+    return res.json()
+
+def page_windows(num_pages: int, shard_pages: int) -> List[Tuple[int, int]]:
+    """将 [0, num_pages) 划分为长度不超过 shard_pages 的页窗口"""
+    return [(s, min(s + shard_pages, num_pages)) for s in range(0, num_pages, shard_pages)]
+
+def _extract_pages(reader: "PdfReader", start: int, end: int) -> BytesIO:
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for i in range(start, end):
+        writer.add_page(reader.pages[i])
+    buf = BytesIO()
+    writer.write(buf)
+    buf.seek(0)
+    return buf
+
+def _open_reader(file_path: Path) -> Tuple["PdfReader | None", int]:
+    """打开 PDF 以便按页拆分，返回 (reader, 页数)；无法拆分（加密、损坏等）时为 (None, 0)"""
+    try:
+        from pypdf import PdfReader
+
+        reader = PdfReader(str(file_path))
+        return reader, len(reader.pages)
+    except Exception as e:
+        logger.warning("Cannot split %s, parsing whole file: %s", file_path.name, e)
+        return None, 0
 
 def MineruLoader(
     path: str,
     dump_md: bool = False,
     draw_layout: bool = False,
-    url="http://localhost:8000/parse"
+    url=None,
+    shard_pages: int | None = None,
+    max_workers: int | None = None,
 ):
+    """调用 MinerU 解析 PDF，返回 content list。
+
+    页数超过 ``shard_pages`` 时按页窗口拆分，并发发送到 ``url``（可为多个 worker 地址，轮询分配），
+    最后按页序合并并修正 ``page_idx``。参数缺省时取 rag_config.yaml 的 mineru 配置。
+    """
+    cfg = mineru_config()
+    urls = url or cfg.get("urls", ["http://localhost:8000/parse"])
+    if isinstance(urls, str):
+        urls = [urls]
+    shard_pages = shard_pages if shard_pages is not None else cfg.get("shard_pages", 0)
+    max_workers = max_workers or cfg.get("max_parallel", len(urls))
+
     file_path = Path(path).resolve()
-    with file_path.open("rb") as f:
-        res = requests.post(
-            url=url,
-            files={"file": f},
-            data={
-                "dump_md": dump_md,
-                "draw_layout": draw_layout
-            }
-        )
-    res.raise_for_status()
-    return res.json()
+    reader, num_pages = _open_reader(file_path) if shard_pages else (None, 0)
 
-def load_json_by_mineru(path: str):
-    json_list = MineruLoader(path)
-    result = []
+    if reader is None or num_pages <= shard_pages:
+        with file_path.open("rb") as f:
+            return _post_pdf(urls[0], file_path.name, f, dump_md, draw_layout)
 
-    file_id = uuid.uuid4().hex
+    windows = page_windows(num_pages, shard_pages)
+    logger.info("Parsing %s in %d shards over %d workers", file_path.name, len(windows), len(urls))
 
+    # PdfReader 共享底层文件流，拆页需串行；上传与解析在各线程中并发进行
+    split_lock = threading.Lock()
+
+    def parse_window(args):
+        idx, (start, end) = args
+        with split_lock:
+            buf = _extract_pages(reader, start, end)
+        name = f"{file_path.stem}_p{start}-{end - 1}.pdf"
+        blocks = _post_pdf(urls[idx % len(urls)], name, buf, dump_md, draw_layout)
+        for b in blocks:
+            b["page_idx"] = b.get("page_idx", 0) + start
+        return blocks
+
+    result: list = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mineru") as pool:
+        for blocks in pool.map(parse_window, enumerate(windows)):
+            result.extend(blocks)
+    return result
+
+def _image_to_pdf(data: bytes) -> bytes:
+    from PIL import Image
+    image = Image.open(BytesIO(data)).convert("RGB")
+    buf = BytesIO()
+    # 固定 PDF 元数据中的时间，使同一图片生成相同字节，从而命中解析服务的缓存
+    epoch = time.gmtime(0)
+    image.save(buf, format="PDF", creationDate=epoch, modDate=epoch)
+    return buf.getvalue()
+
+def ocr_image(data: bytes, name: str = "image.png") -> str:
+    """识别图片中的公式并返回 LaTeX（多条公式按阅读顺序以换行连接）。
+
+    优先调用解析服务的 /ocr_image 直接识别；服务不支持该接口或未检出公式时，
+    退回到转成单页 PDF 走完整解析流程，以保留纯文字图片的识别结果。
+    """
+    cfg = mineru_config()
+    image_url = cfg.get("image_url", "http://localhost:8000/ocr_image")
+    res = get_http_client().post(image_url, files={"file": (name, data)}, timeout=60)
+    if res.status_code not in (404, 405):
+        res.raise_for_status()
+        latex = [f["latex"] for f in res.json().get("formulas", []) if f.get("latex")]
+        if latex:
+            return "\n".join(latex)
+
+    pdf_url = cfg.get("urls", ["http://localhost:8000/parse"])[0]
+    blocks = _post_pdf(pdf_url, "image.pdf", BytesIO(_image_to_pdf(data)), False, False)
+    return "\n".join(b["text"] for b in blocks if "text" in b)
+
+def _stream_pdf(url: str, name: str, fp: BinaryIO, window_pages: int,
+                max_busy_retries: int = 10) -> Iterator[dict]:
+    """调用解析服务的 /parse_stream，按页逐块产出 content list 条目（NDJSON，每行一页）"""
+    for _ in range(max_busy_retries + 1):
+        fp.seek(0)
+        with get_http_client().stream(
+            "POST",
+            url,
+            files={"file": (name, fp, "application/pdf")},
+            data={"window_pages": str(window_pages)},
+            timeout=PARSE_TIMEOUT,
+        ) as res:
+            if res.status_code == 429:
+                wait = min(float(res.headers.get("Retry-After", 5)), MAX_BUSY_WAIT)
+                logger.info("MinerU busy, retrying %s in %.0fs", name, wait)
+                time.sleep(wait)
+                continue
+            res.raise_for_status()
+            for line in res.iter_lines():
+                if not line.strip():
+                    continue
+                page = json.loads(line)
+                if "error" in page:
+                    raise RuntimeError(f"MinerU stream failed: {page['error']}")
+                yield from page["blocks"]
+            return
+    raise RuntimeError(f"MinerU stayed busy for {name}")
+
+_SHARD_DONE = object()
+
+def _stream_shards(reader: "PdfReader", name: str, windows: List[Tuple[int, int]], urls: List[str],
+                   window_pages: int, max_workers: int, max_busy_retries: int) -> Iterator[dict]:
+    """各页窗口并发流式解析（轮询分配到 ``urls``），按页序产出：首个窗口的结果边到边产出，
+    后续窗口先在队列中缓存，轮到时再产出"""
+    split_lock = threading.Lock()
+    stop = threading.Event()
+    queues = [queue.SimpleQueue() for _ in windows]
+
+    def produce(idx: int) -> None:
+        start, end = windows[idx]
+        out = queues[idx]
+        try:
+            with split_lock:
+                buf = _extract_pages(reader, start, end)
+            shard_name = f"{Path(name).stem}_p{start}-{end - 1}.pdf"
+            for b in _stream_pdf(urls[idx % len(urls)], shard_name, buf, window_pages, max_busy_retries):
+                if stop.is_set():
+                    return
+                b["page_idx"] = b.get("page_idx", 0) + start
+                out.put(b)
+            out.put(_SHARD_DONE)
+        except BaseException as e:
+            out.put(e)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mineru-stream")
+    try:
+        for idx in range(len(windows)):
+            pool.submit(produce, idx)
+        for out in queues:
+            while (item := out.get()) is not _SHARD_DONE:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+    finally:
+        # 下游中途停止或出错时，其余窗口不再继续读取
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def iter_mineru_blocks(
+    path: str,
+    url=None,
+    window_pages: int | None = None,
+    start_page: int = 0,
+    shard_pages: int | None = None,
+    max_workers: int | None = None,
+    max_busy_retries: int = 10,
+) -> Iterator[dict]:
+    """流式解析 PDF，按页序逐块产出 content list 条目。
+
+    ``start_page`` 大于 0 时只解析其后的页（续跑中断的流式入库），产出的 ``page_idx`` 仍为原文页码。
+    配置了多个 ``stream_urls`` 且页数超过 ``shard_pages`` 时按页窗口拆分，并发发送到各服务；
+    只有一个服务时由服务端把页窗口分配到各解析进程，不再拆分。参数缺省时取 mineru 配置。
+    """
+    cfg = mineru_config()
+    urls = url or cfg.get("stream_urls") or [cfg.get("stream_url", "http://localhost:8000/parse_stream")]
+    if isinstance(urls, str):
+        urls = [urls]
+    window_pages = window_pages or cfg.get("stream_window_pages", 8)
+    shard_pages = shard_pages if shard_pages is not None else cfg.get("shard_pages", 0)
+    max_workers = max_workers or cfg.get("max_parallel", len(urls))
+    file_path = Path(path).resolve()
+
+    split = start_page > 0 or (shard_pages and len(urls) > 1)
+    reader, num_pages = _open_reader(file_path) if split else (None, 0)
+    if reader is None:
+        if start_page > 0:
+            # 无法拆页时从头解析，跳过已收到的页
+            logger.warning("Cannot resume %s at page %d, re-parsing from the start", file_path.name, start_page)
+        with file_path.open("rb") as f:
+            for b in _stream_pdf(urls[0], file_path.name, f, window_pages, max_busy_retries):
+                if b.get("page_idx", 0) >= start_page:
+                    yield b
+        return
+
+    if len(urls) > 1 and shard_pages:
+        windows = [(s + start_page, e + start_page) for s, e in page_windows(num_pages - start_page, shard_pages)]
+    else:
+        windows = [(start_page, num_pages)] if start_page < num_pages else []
+    if len(windows) > 1:
+        logger.info("Streaming %s in %d shards over %d workers", file_path.name, len(windows), len(urls))
+    yield from _stream_shards(reader, file_path.name, windows, urls, window_pages, max_workers, max_busy_retries)
+
+def iter_paragraphs(json_list: Iterable[dict], file_id: str) -> Iterator[ParagraphChunk]:
+    """将 MinerU 的 content list 条目逐个转为段落级 ParagraphChunk"""
     for chunk in json_list:
         if chunk["type"] == "text" or chunk["type"] == "equation" or chunk["type"] == "table":
             content = ""
@@ -37,13 +275,20 @@ def load_json_by_mineru(path: str):
                 content = chunk["table_body"]
             else:
                 content = chunk["text"]
-            result.append(ParagraphChunk(
+            yield ParagraphChunk(
                 id=uuid.uuid4().hex,
                 page_content=content,
                 metadata={
                     "page_num": chunk["page_idx"],
                     "file_id": file_id
                 }
-            ))
+            )
 
-    return (file_id, result)
\ No newline at end of file
+def parse_content_list(json_list, file_id: str):
+    """将 MinerU 的 content list 转为段落级 ParagraphChunk 列表"""
+    return list(iter_paragraphs(json_list, file_id))
+
+def load_json_by_mineru(path: str, file_id: str | None = None):
+    json_list = MineruLoader(path)
+    file_id = file_id or uuid.uuid4().hex
+    return (file_id, parse_content_list(json_list, file_id))
\ No newline at end of file
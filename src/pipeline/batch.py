@@ -0,0 +1,236 @@
+# src/pipeline/batch.py
+
+"""多文档批量入库：解析、过滤、嵌入三个阶段流水线并行，各阶段独立限流。
+
+命令行用法::
+
+    python -m src.pipeline.batch books/ extra.pdf --parse-workers 2 --filter-workers 4
+"""
+
+import argparse
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import yaml
+
+from src.datamodel import ParagraphChunk
+from src.pipeline.dedup import FileHashIndex, hash_file
+from src.pipeline.ingest import (
+    Reporter, find_existing, parse_stage, filter_stage, embed_stage,
+)
+from src.rag.embedding import EmbeddingManager
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 各阶段开始时对应的单文档进度
+STAGE_PROGRESS = {"queued": 0.0, "parse": 0.0, "filter": 0.35, "embed": 0.8,
+                  "done": 1.0, "failed": 1.0}
+
+
+@dataclass
+class DocProgress:
+    path: str
+    name: str
+    stage: str = "queued"
+    file_id: Optional[str] = None
+    chunks: int = 0
+    deduplicated: bool = False
+    embed_tokens_per_s: float = 0.0
+    error: Optional[str] = None
+
+
+def _noop_report(stage: str, progress: Optional[float] = None, details=None) -> None:
+    pass
+
+
+class BatchIngestor:
+    """将一批 PDF 以流水线方式入库：文档 N+1 解析的同时，文档 N 在过滤、文档 N-1 在嵌入。"""
+
+    def __init__(
+        self,
+        emb_cfg: dict,
+        index: Optional[FileHashIndex] = None,
+        data_dir: str = "data",
+        parse_workers: int = 2,
+        filter_workers: int = 4,
+        embed_workers: int = 2,
+        consume_source: bool = True,
+        on_done: Optional[Callable[[DocProgress, List[ParagraphChunk], EmbeddingManager], None]] = None,
+    ) -> None:
+        self.emb_cfg = emb_cfg
+        self.index = index
+        self.data_dir = data_dir
+        self.parse_workers = parse_workers
+        self.filter_workers = filter_workers
+        self.embed_workers = embed_workers
+        self.consume_source = consume_source
+        self.on_done = on_done
+
+    def run(self, paths: List[str], report: Reporter = _noop_report) -> List[dict]:
+        """阻塞执行整批入库，返回每个文档的最终状态"""
+        docs = [DocProgress(path=str(p), name=Path(p).name) for p in paths]
+        if not docs:
+            return []
+        cond = threading.Condition()
+        remaining = [len(docs)]
+        pools = {
+            "parse": ThreadPoolExecutor(self.parse_workers, thread_name_prefix="parse"),
+            "filter": ThreadPoolExecutor(self.filter_workers, thread_name_prefix="filter"),
+            "embed": ThreadPoolExecutor(self.embed_workers, thread_name_prefix="embed"),
+        }
+
+        def publish() -> None:
+            with cond:
+                snapshot = [asdict(d) for d in docs]
+            finished = sum(1 for d in snapshot if d["stage"] in ("done", "failed"))
+            progress = sum(STAGE_PROGRESS[d["stage"]] for d in snapshot) / len(snapshot)
+            report(f"{finished}/{len(snapshot)} documents", progress, snapshot)
+
+        def set_stage(doc: DocProgress, stage: str) -> None:
+            with cond:
+                doc.stage = stage
+            publish()
+
+        # 每个文档持有的内容哈希锁，跨阶段（跨线程）持有直至完成
+        held: dict[int, threading.Lock] = {}
+        # 同一批次中内容相同的文档只处理第一个，其余暂存在此，待其完成后再提交（届时直接复用结果），
+        # 不在解析线程中等待内容哈希锁
+        waiting: dict[str, List[DocProgress]] = {}
+        digests: dict[int, str] = {}
+
+        def finish(doc: DocProgress, error: Optional[Exception] = None) -> None:
+            lock = held.pop(id(doc), None)
+            if lock is not None:
+                lock.release()
+            with cond:
+                followers = waiting.pop(digests.pop(id(doc), None), [])
+            for follower in followers:
+                pools["parse"].submit(do_parse, follower)
+            if error is not None:
+                logger.error("Batch ingest failed for %s: %s", doc.name, error)
+                with cond:
+                    doc.error = f"{type(error).__name__}: {error}"
+                # 入库成功时上传的临时文件已移入 data 目录；失败时删除，避免堆积
+                if self.consume_source and os.path.exists(doc.path):
+                    os.remove(doc.path)
+            set_stage(doc, "failed" if error is not None else "done")
+            with cond:
+                remaining[0] -= 1
+                cond.notify_all()
+
+        def guarded(fn):
+            def wrapper(doc, *args):
+                try:
+                    fn(doc, *args)
+                except Exception as e:
+                    finish(doc, e)
+            return wrapper
+
+        @guarded
+        def do_parse(doc: DocProgress) -> None:
+            if self.index is not None:
+                digest = hash_file(doc.path)
+                with cond:
+                    if digest in waiting:
+                        waiting[digest].append(doc)
+                        return
+                    waiting[digest] = []
+                    digests[id(doc)] = digest
+                # 与其他批次、单文件入库中同一内容的文档串行处理
+                lock = self.index.lock_for(digest)
+                lock.acquire()
+                held[id(doc)] = lock
+                file_id, existing = find_existing(digest, self.index, self.data_dir)
+                doc.file_id = file_id
+                if existing is not None:
+                    doc.deduplicated = True
+                    doc.chunks = len(existing)
+                    if self.consume_source:
+                        os.remove(doc.path)
+                    if self.on_done is not None:
+                        self.on_done(doc, existing, EmbeddingManager(self.emb_cfg, file_id))
+                    finish(doc)
+                    return
+            else:
+                doc.file_id = uuid.uuid4().hex
+            set_stage(doc, "parse")
+            paragraphs = parse_stage(doc.path, doc.file_id, self.data_dir)
+            pools["filter"].submit(do_filter, doc, paragraphs)
+
+        @guarded
+        def do_filter(doc: DocProgress, paragraphs: List[ParagraphChunk]) -> None:
+            set_stage(doc, "filter")
+            chunks = filter_stage(paragraphs, doc.file_id, self.data_dir)
+            doc.chunks = len(chunks)
+            pools["embed"].submit(do_embed, doc, chunks)
+
+        @guarded
+        def do_embed(doc: DocProgress, chunks: List[ParagraphChunk]) -> None:
+            set_stage(doc, "embed")
+            emb_mgr = embed_stage(doc.path, doc.file_id, chunks, self.emb_cfg,
+                                  self.data_dir, consume_source=self.consume_source)
+            doc.embed_tokens_per_s = emb_mgr.stats["tokens_per_s"]
+            if self.on_done is not None:
+                self.on_done(doc, chunks, emb_mgr)
+            finish(doc)
+
+        publish()
+        for doc in docs:
+            pools["parse"].submit(do_parse, doc)
+        with cond:
+            cond.wait_for(lambda: remaining[0] == 0)
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+        return [asdict(d) for d in docs]
+
+
+def _collect_pdfs(inputs: List[str]) -> List[str]:
+    paths: List[str] = []
+    for item in inputs:
+        p = Path(item)
+        if p.is_dir():
+            paths.extend(str(x) for x in sorted(p.rglob("*.pdf")))
+        else:
+            paths.append(str(p))
+    return paths
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    root = Path(__file__).resolve().parent.parent.parent
+    with open(root / "config" / "rag_config.yaml", "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    batch_cfg = cfg.get("batch", {})
+
+    parser = argparse.ArgumentParser(description="批量入库 PDF 文档")
+    parser.add_argument("inputs", nargs="+", help="PDF 文件或包含 PDF 的目录")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--parse-workers", type=int, default=batch_cfg.get("parse_workers", 2))
+    parser.add_argument("--filter-workers", type=int, default=batch_cfg.get("filter_workers", 4))
+    parser.add_argument("--embed-workers", type=int, default=batch_cfg.get("embed_workers", 2))
+    args = parser.parse_args(argv)
+
+    paths = _collect_pdfs(args.inputs)
+    index = FileHashIndex(str(Path(args.data_dir) / "file_index.json"))
+    ingestor = BatchIngestor(
+        cfg["embedding"], index=index, data_dir=args.data_dir,
+        parse_workers=args.parse_workers, filter_workers=args.filter_workers,
+        embed_workers=args.embed_workers, consume_source=False,
+    )
+
+    def report(stage, progress=None, details=None):
+        print(f"[{progress or 0:6.1%}] {stage}", flush=True)
+
+    results = ingestor.run(paths, report)
+    for r in results:
+        status = r["error"] or ("reused" if r["deduplicated"] else f"{r['chunks']} chunks")
+        print(f"{r['stage']:7} {r['file_id'] or '-':32} {r['name']}: {status}")
+
+
+if __name__ == "__main__":
+    main()
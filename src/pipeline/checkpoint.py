@@ -0,0 +1,144 @@
+# src/pipeline/checkpoint.py
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.datamodel import ParagraphChunk
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 各阶段产物文件名（均位于 relation_store/<file_id>/ 下）
+CONTENT_LIST = "content_list"    # MinerU 原始 content list
+PARAGRAPHS = "paragraphs"        # 清洗后的段落
+RAW_CHUNKS = "chunks_raw"        # 切分器输出，尚未经过 LLM 过滤
+FILTER_LOG = "filter_results.jsonl"
+STREAM_BLOCKS = "stream_blocks.jsonl"  # 流式解析已收到的 content list 条目，解析完成后删除
+
+
+class StageCheckpoint:
+    """保存并恢复入库流程各阶段的中间结果，重跑时从最后完成的阶段继续。"""
+
+    def __init__(self, file_id: str, base_dir: str = "data/relation_store") -> None:
+        self.file_id = file_id
+        self.dir = Path(base_dir) / file_id
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._filter_log: Optional[FilterResultLog] = None
+
+    def _path(self, stage: str) -> Path:
+        return self.dir / f"{stage}.json"
+
+    def has(self, stage: str) -> bool:
+        return self._path(stage).exists()
+
+    def load(self, stage: str) -> Any:
+        with self._path(stage).open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, stage: str, data: Any) -> None:
+        path = self._path(stage)
+        tmp = path.with_suffix(".json.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        logger.info("Checkpoint %s saved for %s", stage, self.file_id)
+
+    def load_chunks(self, stage: str) -> List[ParagraphChunk]:
+        return [ParagraphChunk.from_dict(d) for d in self.load(stage)]
+
+    def save_chunks(self, stage: str, docs: List[ParagraphChunk]) -> None:
+        self.save(stage, [d.to_dict() for d in docs])
+
+    @property
+    def filter_log(self) -> "FilterResultLog":
+        if self._filter_log is None:
+            self._filter_log = FilterResultLog(self.dir / FILTER_LOG)
+        return self._filter_log
+
+    def block_log(self) -> "BlockLog":
+        return BlockLog(self.dir / STREAM_BLOCKS)
+
+
+def _terminate_last_line(path: Path) -> None:
+    """中断时最后一行可能不完整，补上换行避免与后续追加的记录粘连"""
+    with path.open("rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+
+def _read_jsonl(path: Path) -> List[Any]:
+    """读取 JSONL，跳过不完整的行"""
+    records = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+class FilterResultLog:
+    """逐条追加写入的 LLM 过滤结果，进程中断后已完成的 chunk 无需重新请求。"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data: Dict[str, dict] = {}
+        if self.path.exists():
+            _terminate_last_line(self.path)
+            for rec in _read_jsonl(self.path):
+                self._data[rec["key"]] = rec["result"]
+            logger.info("Resuming with %d filter results from %s", len(self._data), self.path)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            return self._data.get(key)
+
+    def put(self, key: str, result: dict) -> None:
+        with self._lock:
+            self._data[key] = result
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "result": result}, ensure_ascii=False) + "\n")
+                f.flush()
+
+
+class BlockLog:
+    """流式解析时逐页追加保存收到的 content list 条目（每行一页）。
+
+    进程中断后重新入库同一文件时，已记录的页直接重放，只需解析其后的页；
+    写入中途崩溃的不完整行连同该页一起丢弃。
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+
+    def resume(self) -> tuple[list, int]:
+        """返回 (可重放的条目, 续跑的起始页)；没有记录时为 ([], 0)"""
+        if not self.path.exists():
+            return [], 0
+        _terminate_last_line(self.path)
+        pages = _read_jsonl(self.path)
+        if not pages:
+            return [], 0
+        blocks = [b for page in pages for b in page["blocks"]]
+        start = pages[-1]["page_idx"] + 1
+        logger.info("Replaying %d streamed pages, resuming parse at page %d", len(pages), start)
+        return blocks, start
+
+    def append(self, page_idx: int, blocks: List[dict]) -> None:
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps({"page_idx": page_idx, "blocks": blocks}, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
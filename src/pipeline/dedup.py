@@ -0,0 +1,64 @@
+# src/pipeline/dedup.py
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+HASH_CHUNK = 1024 * 1024
+
+
+def hash_file(path: str, chunk_size: int = HASH_CHUNK) -> str:
+    """分块计算文件内容的 sha256，避免整文件读入内存"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class FileHashIndex:
+    """持久化的 内容哈希 -> file_id 索引，用于跳过重复上传的 PDF。"""
+
+    def __init__(self, path: str = "data/file_index.json") -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._index: Dict[str, str] = {}
+        if self.path.exists():
+            with self.path.open("r", encoding="utf-8") as f:
+                self._index = json.load(f)
+            logger.info("Loaded %d entries from %s", len(self._index), self.path)
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            return self._index.get(digest)
+
+    def put(self, digest: str, file_id: str) -> None:
+        with self._lock:
+            self._index[digest] = file_id
+            self._save()
+
+    def remove(self, digest: str) -> None:
+        with self._lock:
+            if self._index.pop(digest, None) is not None:
+                self._save()
+
+    def lock_for(self, digest: str) -> threading.Lock:
+        """同一内容的并发上传共用一把锁，保证只处理一次"""
+        with self._lock:
+            return self._key_locks.setdefault(digest, threading.Lock())
+
+    def _save(self) -> None:
+        # 先写临时文件再替换，防止中途崩溃损坏索引
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self._index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
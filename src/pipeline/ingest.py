@@ -0,0 +1,275 @@
+# src/pipeline/ingest.py
+
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from itertools import chain
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from src.datamodel import ParagraphChunk
+from src.pipeline.checkpoint import StageCheckpoint, CONTENT_LIST, PARAGRAPHS, RAW_CHUNKS
+from src.pipeline.dedup import FileHashIndex, hash_file
+from src.loaders.mineru_loader import MineruLoader, iter_mineru_blocks, iter_paragraphs, parse_content_list
+from src.preprocessing.chunker import iter_chunks
+from src.preprocessing.cleaner import clean_documents, iter_clean
+from src.preprocessing.filterer import chunk_and_filter, filter_and_convert, retry_failed
+from src.rag.embedding import EmbeddingManager
+from src.utils.config import load_config
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+Reporter = Callable[..., None]
+# 流式入库时每得到一批 chunk 的回调：(file_id, 目前已索引的切片, 索引管理器)
+PartialCallback = Callable[[str, List[ParagraphChunk], EmbeddingManager], None]
+
+
+def _noop_report(stage: str, progress: Optional[float] = None, details=None) -> None:
+    pass
+
+
+def save_chunks(docs: List[ParagraphChunk], file_id: str,
+                base_dir: str = "data/relation_store") -> Path:
+    """保存切片以便后续构建关系图"""
+    save_dir = Path(base_dir) / file_id
+    save_dir.mkdir(parents=True, exist_ok=True)
+    path = save_dir / "chunks.json"
+    with path.open("w", encoding="utf-8") as f:
+        json.dump([c.to_json() for c in docs], f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_chunks(file_id: str, base_dir: str = "data/relation_store") -> Optional[List[ParagraphChunk]]:
+    """读取已保存的切片，不存在时返回 None"""
+    path = Path(base_dir) / file_id / "chunks.json"
+    if not path.exists():
+        return None
+    with path.open("r", encoding="utf-8") as f:
+        return [ParagraphChunk.from_json(s) for s in json.load(f)]
+
+
+def find_existing(digest: str, index: FileHashIndex, data_dir: str = "data") -> Tuple[str, Optional[List[ParagraphChunk]]]:
+    """按内容哈希查找已入库的文件，返回 (file_id, 切片)。
+
+    文件已完整入库时切片非空；处理中断过的文件沿用原 file_id、切片为 None；
+    新文件分配新的 file_id 并立即写入索引，以便中断后续跑。调用方需持有 ``index.lock_for(digest)``。
+    """
+    file_id = index.get(digest)
+    if file_id is not None:
+        docs = load_chunks(file_id, base_dir=str(Path(data_dir) / "relation_store"))
+        if docs is not None and (Path(data_dir) / f"{file_id}.pdf").exists():
+            logger.info("Duplicate upload %s reuses %s", digest[:12], file_id)
+            return file_id, docs
+        # 上次处理未完成，沿用同一 file_id 从检查点继续
+        logger.info("Resuming unfinished ingest %s -> %s", digest[:12], file_id)
+        return file_id, None
+    file_id = uuid.uuid4().hex
+    index.put(digest, file_id)
+    return file_id, None
+
+
+def parse_stage(path: str, file_id: str, data_dir: str = "data") -> List[ParagraphChunk]:
+    """MinerU 解析并清洗，返回段落列表（各步结果写入检查点）"""
+    ckpt = StageCheckpoint(file_id, base_dir=str(Path(data_dir) / "relation_store"))
+    if ckpt.has(PARAGRAPHS):
+        docs = ckpt.load_chunks(PARAGRAPHS)
+        logger.info("Loaded %d cleaned paragraphs from checkpoint", len(docs))
+        return docs
+
+    if ckpt.has(CONTENT_LIST):
+        content_list = ckpt.load(CONTENT_LIST)
+    else:
+        content_list = MineruLoader(path)
+        ckpt.save(CONTENT_LIST, content_list)
+    docs = parse_content_list(content_list, file_id)
+    logger.info("Parsed %d paragraphs for %s", len(docs), file_id)
+
+    docs = clean_documents(docs)
+    ckpt.save_chunks(PARAGRAPHS, docs)
+    return docs
+
+
+def filter_stage(docs: List[ParagraphChunk], file_id: str, data_dir: str = "data") -> List[ParagraphChunk]:
+    """切分并调用 LLM 过滤，保存最终切片"""
+    relation_dir = str(Path(data_dir) / "relation_store")
+    ckpt = StageCheckpoint(file_id, base_dir=relation_dir)
+    chunks = chunk_and_filter(docs, checkpoint=ckpt)
+    save_chunks(chunks, file_id, base_dir=relation_dir)
+    return chunks
+
+
+def embed_stage(path: str, file_id: str, chunks: List[ParagraphChunk], emb_cfg: dict,
+                data_dir: str = "data", consume_source: bool = True) -> EmbeddingManager:
+    """增量更新向量索引（只写入新增或变化的 chunk），并将 PDF 放入 data 目录（标志入库完成）
+
+    ``consume_source`` 为 True 时移动源文件（上传的临时文件），否则复制。
+    """
+    emb_mgr = EmbeddingManager(emb_cfg, file_id)
+    emb_mgr.build_or_load(chunks, force_rebuild=True)
+    _store_pdf(path, file_id, data_dir, consume_source)
+    logger.info("Indexed %d chunks for %s (%s, %.0f embedded tokens/s)",
+                len(chunks), file_id, emb_mgr.last_sync, emb_mgr.stats["tokens_per_s"])
+    return emb_mgr
+
+
+def _store_pdf(path: str, file_id: str, data_dir: str, consume_source: bool) -> None:
+    target = Path(data_dir) / f"{file_id}.pdf"
+    if consume_source:
+        shutil.move(path, target)
+    else:
+        shutil.copy2(path, target)
+
+
+def _collect(items: Iterable, sink: list) -> Iterator:
+    for item in items:
+        sink.append(item)
+        yield item
+
+
+def stream_stages(
+    path: str,
+    file_id: str,
+    emb_cfg: dict,
+    report: Reporter = _noop_report,
+    data_dir: str = "data",
+    consume_source: bool = True,
+    on_partial: Optional[PartialCallback] = None,
+    micro_batch: int = 8,
+) -> Tuple[str, List[ParagraphChunk], EmbeddingManager]:
+    """流式入库：解析服务逐页返回结果，清洗、切分与之同步进行，每闭合 ``micro_batch`` 个 chunk
+    即过滤并写入索引，首批 chunk 无需等待整本解析完成即可检索。
+
+    首轮过滤失败的 chunk 需要向后扩展窗口，在全部段落到齐后统一重试。
+    检查点与分阶段入库相同：LLM 过滤结果逐条写入 filter log；收到的解析结果按页追加到 block log，
+    中断后重新入库同一文件时重放已收到的页、只解析其后的页；解析结束后写入
+    CONTENT_LIST、PARAGRAPHS 与 RAW_CHUNKS，此后再中断则按阶段续跑。
+    索引与 ``EmbeddingManager.sync`` 一致：只写入新增或变化的 chunk，结束时删除已不存在的 chunk。
+    """
+    relation_dir = str(Path(data_dir) / "relation_store")
+    ckpt = StageCheckpoint(file_id, base_dir=relation_dir)
+    cache = ckpt.filter_log
+    block_log = ckpt.block_log()
+    replay, start_page = block_log.resume()
+    emb_mgr = EmbeddingManager(emb_cfg, file_id)
+    # 与 sync 相同：只写入新增或变化的 chunk，全部到齐后删除索引中已不存在的 chunk
+    indexed = emb_mgr.indexed_hashes()
+    changed: List[ParagraphChunk] = []
+    blocks: list = []
+    paragraphs: List[ParagraphChunk] = []
+    raw_chunks: List[dict] = []
+    results: List[ParagraphChunk] = []
+    failed: List[ParagraphChunk] = []
+    pending: List[ParagraphChunk] = []
+
+    def index(docs: List[ParagraphChunk]) -> None:
+        todo = emb_mgr.changed_documents(docs, indexed)
+        if todo:
+            emb_mgr.add_documents(todo)
+            changed.extend(todo)
+        results.extend(docs)
+
+    def flush() -> None:
+        ok, bad = filter_and_convert(pending, cache=cache)
+        pending.clear()
+        failed.extend(bad)
+        if ok:
+            index(ok)
+            if on_partial is not None:
+                on_partial(file_id, list(results), emb_mgr)
+        pages = blocks[-1]["page_idx"] + 1 if blocks else 0
+        report("stream", None, {"file_id": file_id, "pages": pages, "indexed": len(results)})
+
+    def received(items: Iterable[dict]) -> Iterator[dict]:
+        """收集新收到的条目，每页收全（下一页开始）后追加到 block log"""
+        page: List[dict] = []
+        for b in items:
+            if page and b["page_idx"] != page[-1]["page_idx"]:
+                block_log.append(page[-1]["page_idx"], page)
+                page = []
+            page.append(b)
+            blocks.append(b)
+            yield b
+        if page:
+            block_log.append(page[-1]["page_idx"], page)
+
+    report("stream", 0.0, {"file_id": file_id, "pages": 0, "indexed": 0})
+    source = chain(_collect(replay, blocks), received(iter_mineru_blocks(path, start_page=start_page)))
+    cleaned = _collect(iter_clean(iter_paragraphs(source, file_id)), paragraphs)
+    header_types: dict = {}
+    for chunk in iter_chunks(cleaned, header_types=header_types):
+        raw_chunks.append(chunk.to_dict())  # 过滤前的快照，过滤会向 metadata 写入摘要与编号
+        pending.append(chunk)
+        if len(pending) >= micro_batch:
+            flush()
+    if pending:
+        flush()
+    ckpt.save(CONTENT_LIST, blocks)
+    ckpt.save(RAW_CHUNKS, raw_chunks)
+    ckpt.save_chunks(PARAGRAPHS, paragraphs)
+    block_log.remove()
+
+    report("filter", 0.8, {"file_id": file_id, "indexed": len(results)})
+    retried = retry_failed(failed, paragraphs, cache=cache, header_types=header_types)
+    if retried:
+        index(retried)
+    emb_mgr.finish_sync(results, indexed, changed)
+    save_chunks(results, file_id, base_dir=relation_dir)
+    _store_pdf(path, file_id, data_dir, consume_source)
+    report("done", 1.0, {"file_id": file_id, "indexed": len(results), "index": emb_mgr.last_sync,
+                         "embed_tokens_per_s": emb_mgr.stats["tokens_per_s"]})
+    logger.info("Stream-indexed %d chunks for %s (index %s)", len(results), file_id, emb_mgr.last_sync)
+    return file_id, results, emb_mgr
+
+
+def ingest_pdf(
+    path: str,
+    emb_cfg: dict,
+    report: Reporter = _noop_report,
+    data_dir: str = "data",
+    index: Optional[FileHashIndex] = None,
+    on_partial: Optional[PartialCallback] = None,
+) -> Tuple[str, List[ParagraphChunk], EmbeddingManager]:
+    """解析、清洗、切分过滤并索引单个 PDF，返回 (file_id, 切片, 索引管理器)。
+
+    该函数是阻塞的，应在后台任务线程中调用；``report(stage, progress)`` 用于上报进度。
+    若提供 ``index``，按 PDF 内容哈希去重：已处理过的文件直接复用已有的切片与向量索引。
+    配置 ``ingest.streaming`` 开启时走流式入库，``on_partial`` 在每批 chunk 入索引后调用。
+    """
+    try:
+        if index is None:
+            return _run_stages(path, uuid.uuid4().hex, emb_cfg, report, data_dir, on_partial)
+
+        report("hash", 0.0)
+        digest = hash_file(path)
+        with index.lock_for(digest):
+            file_id, docs = find_existing(digest, index, data_dir)
+            if docs is not None:
+                report("done", 1.0)
+                return file_id, docs, EmbeddingManager(emb_cfg, file_id)
+            return _run_stages(path, file_id, emb_cfg, report, data_dir, on_partial)
+    finally:
+        # 成功入库时上传的临时文件已移入 data 目录；重复上传或处理失败时删除，避免堆积
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _run_stages(path: str, file_id: str, emb_cfg: dict, report: Reporter, data_dir: str,
+                on_partial: Optional[PartialCallback] = None) -> Tuple[str, List[ParagraphChunk], EmbeddingManager]:
+    ingest_cfg = load_config("rag_config").get("ingest", {})
+    ckpt = StageCheckpoint(file_id, base_dir=str(Path(data_dir) / "relation_store"))
+    # 已有检查点时按阶段续跑，否则可走流式入库
+    if ingest_cfg.get("streaming", False) and not ckpt.has(PARAGRAPHS):
+        return stream_stages(path, file_id, emb_cfg, report, data_dir,
+                             on_partial=on_partial, micro_batch=ingest_cfg.get("micro_batch", 8))
+
+    report("parse", 0.0)
+    docs = parse_stage(path, file_id, data_dir)
+    report("filter", 0.35)
+    chunks = filter_stage(docs, file_id, data_dir)
+    report("embed", 0.8)
+    emb_mgr = embed_stage(path, file_id, chunks, emb_cfg, data_dir)
+    report("done", 1.0, {"file_id": file_id, "indexed": len(chunks), "index": emb_mgr.last_sync,
+                         "embed_tokens_per_s": emb_mgr.stats["tokens_per_s"]})
+    return file_id, chunks, emb_mgr
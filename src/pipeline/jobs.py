@@ -0,0 +1,131 @@
+# src/pipeline/jobs.py
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueueFull(RuntimeError):
+    """排队任务数已达上限。"""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str = QUEUED
+    stage: str = ""
+    progress: float = 0.0
+    error: Optional[str] = None
+    details: Any = None
+    result: Any = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 4),
+            "error": self.error,
+            "details": self.details,
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """在有界线程池中执行耗时任务（如文档入库），避免阻塞事件循环。
+
+    任务函数的第一个参数为 ``report(stage, progress, details)`` 回调，用于上报当前阶段、
+    进度及可选的明细（如批量任务中每个文档的状态）。
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 32,
+                 max_history: int = 256) -> None:
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _active_count(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.status in (QUEUED, RUNNING))
+
+    def _trim_history(self) -> None:
+        finished = [jid for jid, j in self._jobs.items() if j.status in (DONE, FAILED)]
+        for jid in finished[: max(0, len(finished) - self.max_history)]:
+            del self._jobs[jid]
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args, **kwargs) -> Job:
+        """提交任务并立即返回 Job；排队数超过 ``max_pending`` 时抛出 JobQueueFull。"""
+        with self._lock:
+            if self._active_count() >= self.max_pending:
+                raise JobQueueFull(f"too many pending jobs ({self.max_pending})")
+            job = Job(id=uuid.uuid4().hex, kind=kind)
+            self._jobs[job.id] = job
+            self._trim_history()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        logger.info("Job %s (%s) queued", job.id, kind)
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any], args, kwargs) -> None:
+        def report(stage: str, progress: Optional[float] = None, details: Any = None) -> None:
+            with self._lock:
+                job.stage = stage
+                if progress is not None:
+                    job.progress = min(max(progress, 0.0), 1.0)
+                if details is not None:
+                    job.details = details
+
+        with self._lock:
+            job.status = RUNNING
+            job.started_at = time.time()
+        try:
+            result = fn(report, *args, **kwargs)
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            with self._lock:
+                job.status = FAILED
+                job.error = f"{type(e).__name__}: {e}"
+                job.finished_at = time.time()
+            return
+        with self._lock:
+            job.status = DONE
+            job.progress = 1.0
+            job.result = result
+            job.finished_at = time.time()
+        logger.info("Job %s finished in %.1fs", job.id, job.finished_at - job.started_at)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            return [j.to_dict() for j in self._jobs.values()]
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
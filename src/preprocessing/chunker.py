@@ -2,67 +2,121 @@
 
 import re
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterable, Iterator
 from src.datamodel import ParagraphChunk
+from src.utils.tokens import count_tokens
 
 # 1. 定义标题正则
 DOT = r"[\.．·]"  # 普通点、全角点及中点
-PATTERNS = {
-    "definition":   re.compile(rf"^[\s\u200b\ufeff]*(定义)\s*\d+(?:{DOT}\d+)*", re.I),
-    "theorem":      re.compile(rf"^[\s\u200b\ufeff]*(定理)\s*\d+(?:{DOT}\d+)*", re.I),
-    "lemma":        re.compile(rf"^[\s\u200b\ufeff]*(引理)\s*\d+(?:{DOT}\d+)*", re.I),
-    "proposition":  re.compile(rf"^[\s\u200b\ufeff]*(命题)\s*\d+(?:{DOT}\d+)*", re.I),
-    "example":      re.compile(rf"^[\s\u200b\ufeff]*(例题?)\s*\d+(?:{DOT}\d+)*", re.I),
-    "exercise":     re.compile(rf"^[\s\u200b\ufeff]*(练习)\s*\d+(?:{DOT}\d+)*", re.I),
+HEADER_KEYWORDS = {
+    "definition":   "定义",
+    "theorem":      "定理",
+    "lemma":        "引理",
+    "proposition":  "命题",
+    "example":      "例题?",
+    "exercise":     "练习",
 }
+# 所有类型合并为一个正则，命名组标记类型，每段只需匹配一次
+HEADER_RE = re.compile(
+    r"^[\s\u200b\ufeff]*(?:"
+    + "|".join(f"(?P<{ctype}>{kw})" for ctype, kw in HEADER_KEYWORDS.items())
+    + rf")\s*\d+(?:{DOT}\d+)*",
+    re.I,
+)
+
+NUMBER_RE = re.compile(rf"\d+(?:{DOT}\d+)*$")
 
 def detect_header_type(text: str) -> str | None:
-    stripped = text.lstrip("\u200b\ufeff \t\r\n")
-    for ctype, pat in PATTERNS.items():
-        if pat.match(stripped):        # 只看段首
-            return ctype
-    return None
+    m = HEADER_RE.match(text)  # 只看段首
+    return m.lastgroup if m else None
 
-def chunk_documents(docs: List[ParagraphChunk], MAX_TOKEN: int=500) -> List[ParagraphChunk]:
-    """docs 为 MinerU / 自己 loader 产生的“段落级”列表"""
-    result: list[ParagraphChunk] = []
-    i = 0
-    while i < len(docs):
-        cur = docs[i]
-        ctype = detect_header_type(cur.page_content)
+def header_number(text: str) -> str | None:
+    """段首标题中的编号（如 "定理 4.1.3" 中的 "4.1.3"），保留原文中的点号"""
+    m = HEADER_RE.match(text)
+    return NUMBER_RE.search(m.group(0)).group(0) if m else None
+
+def canonical_number(num: str) -> str:
+    """编号的规范形式：全角点、中点统一为 "."，去掉空白"""
+    return re.sub(DOT, ".", "".join(num.split()))
+
+def classify(doc: ParagraphChunk, header_types: Dict[str, str | None] | None = None) -> str | None:
+    """段落的标题类型；传入 header_types 时按段落 id 记录，切分与失败重试共用同一份结果"""
+    if header_types is None:
+        return detect_header_type(doc.page_content)
+    if doc.id not in header_types:
+        header_types[doc.id] = detect_header_type(doc.page_content)
+    return header_types[doc.id]
+
+# 内容派生的 chunk id 的命名空间（uuid5）
+CHUNK_NAMESPACE = uuid.UUID("5b0c1f62-8a4e-4d0e-9f39-3c2f7d6a9e41")
+
+def stable_chunk_id(chunk_type: str, paragraphs: List[str], occurrence: int = 0) -> str:
+    """由类型与段落内容派生的 chunk id：重新处理同一文件时未变化的 chunk 得到相同的 id。
+
+    同一文件中内容完全相同的 chunk 以出现次序 ``occurrence`` 区分。
+    """
+    raw = "\x00".join([chunk_type, str(occurrence), *paragraphs])
+    return uuid.uuid5(CHUNK_NAMESPACE, raw).hex
+
+def iter_chunks(
+    docs: Iterable[ParagraphChunk],
+    MAX_TOKEN: int=500,
+    header_types: Dict[str, str | None] | None = None,
+    counter: Callable[[str], int] = count_tokens,
+) -> Iterator[ParagraphChunk]:
+    """chunk_documents 的流式版本：逐段读入，标题段到来或超出阈值时立即产出已闭合的 chunk
+
+    ``MAX_TOKEN`` 以分词器 token 计（``counter``，默认 tiktoken）。
+    """
+    buf_text: list[str] | None = None
+    buf_meta: dict = {}
+    tok_cnt = 0
+    seen: Dict[str, int] = {}
+
+    def flush() -> ParagraphChunk:
+        # 内容闭合后才能确定 id
+        base = stable_chunk_id(buf_meta["chunk_type"], buf_text)
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        buf_meta["chunk_id"] = base if n == 0 else stable_chunk_id(buf_meta["chunk_type"], buf_text, n)
+        return ParagraphChunk(
+            id=buf_meta["chunk_id"],
+            page_content=buf_text,
+            metadata=buf_meta,
+        )
 
+    for cur in docs:
+        ctype = classify(cur, header_types)
+        if buf_text is not None:
+            # 遇到下一条标题段，或合并后 token 超过阈值，闭合当前 chunk
+            if not ctype and tok_cnt <= MAX_TOKEN:
+                buf_text.append(cur.page_content)
+                tok_cnt += counter(cur.page_content)
+                continue
+            yield flush()
+            buf_text = None
+
+        # 非标题段（含超限后紧随的段）直接跳过
         if not ctype:
-            i += 1
             continue
 
         buf_text = [cur.page_content]
         buf_meta = cur.metadata
         buf_meta["chunk_type"] = ctype
         buf_meta["initial_id"] = cur.id
-        buf_meta["chunk_id"] = uuid.uuid4().hex
-        tok_cnt = len(cur.page_content)
-
-        j = i + 1
-        while j < len(docs):
-            nxt = docs[j]
-            # 遇到下一条标题段，停止拼接
-            if detect_header_type(nxt.page_content):
-                break
-            # 若合并后 token 超过阈值，也停止
-            if tok_cnt > MAX_TOKEN:
-                break
-            # 否则拼接
-            buf_text.append(nxt.page_content)
-            tok_cnt += len(nxt.page_content)
-            j += 1
-
-        result.append(ParagraphChunk(
-            id=buf_meta["chunk_id"],
-            page_content=buf_text,
-            metadata=buf_meta,
-        ))
-        i = j  # 跳过已经合并的段
-    return result
+        tok_cnt = counter(cur.page_content)
+
+    if buf_text is not None:
+        yield flush()
+
+def chunk_documents(
+    docs: List[ParagraphChunk],
+    MAX_TOKEN: int=500,
+    header_types: Dict[str, str | None] | None = None,
+    counter: Callable[[str], int] = count_tokens,
+) -> List[ParagraphChunk]:
+    """docs 为 MinerU / 自己 loader 产生的“段落级”列表"""
+    return list(iter_chunks(docs, MAX_TOKEN, header_types, counter))
 
 # def split_by_heading(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
 #     """
@@ -1,21 +1,29 @@
 # src/preprocessing/filterer.py
 
-import json, yaml, tiktoken, backoff
+import json, yaml
 import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 from textwrap import dedent
 from typing import List, Dict, Any
-from pydantic import BaseModel, ValidationError, RootModel
 from jsonschema import validate
-from camel.agents import ChatAgent
-from camel.models import ModelFactory
-from camel.types import ModelPlatformType, OpenAIBackendRole
-from camel.messages import BaseMessage
+from jsonschema.exceptions import ValidationError as SchemaValidationError
 from src.datamodel import ParagraphChunk
-from src.preprocessing.chunker import chunk_documents, detect_header_type
+from src.preprocessing.chunker import canonical_number, chunk_documents, classify, header_number
+from src.pipeline.checkpoint import RAW_CHUNKS
+from src.preprocessing.rules import classify_chunk
+from src.utils.config import load_config
+from src.utils.http import use_shared_client
+from src.utils.llm_cache import get_llm_cache, prompt_version
+from src.utils.logger import get_logger
+from src.utils.rate_limit import Priority, get_limiter
+from src.utils.tokens import count_tokens
 
 load_dotenv()
+logger = get_logger(__name__)
 
 # 1. 从配置文件加载 Agent 配置与 Schema 路径
 BASE_DIR = Path(__file__).resolve().parent.parent.parent  # 回到 project_root/
@@ -37,10 +45,8 @@ FILTER_SCHEMA = {
     },
 }
 
-# 3. 构造系统消息（包含 Schema）
-sys_msg = BaseMessage.make_assistant_message(
-    role_name="filterer",
-    content=dedent(
+# 3. 系统提示词（包含 Schema）
+SYSTEM_PROMPT = dedent(
         """
         你是一个数学文档处理助手。
         输入：一个 JSON 格式的 chunk，对象包含：
@@ -67,14 +73,31 @@ sys_msg = BaseMessage.make_assistant_message(
         输入: {"chunk_type":"definition","page_content":["定义4.3.4(矩阵乘法)矩阵乘法是按以下方式定义的映射","$$\n\\begin{array} { r l } { \\mathrm { M } _ { m \\times n } ( F ) \\times \\mathrm { M } _ { n \\times r } ( F ) \\longrightarrow \\mathrm { M } _ { m \\times r } ( F ) } & { { } } \\\\ { ( A , B ) \\longmapsto } & { { } A B ; } \\end{array}\n$$","若 $A = ( a _ { i j } ) _ { \\underset { 1 \\leq j \\leq n } { 1 \\leq i \\leq m } } , B = ( b _ { j k } ) _ { \\underset { 1 \\leq k \\leq r } { 1 \\leq j \\leq n } }$ ，则 $A B = ( c _ { i k } ) _ { 1 \\leq i \\leq m }$ ，其中1≤k≤r","$$\nc _ { i k } : = \\sum _ { j = 1 } ^ { n } a _ { i j } b _ { j k } = { \\left( \\begin{array} { l l l } { \\ a _ { i 1 } } & { \\cdots } & { a _ { i n } } \\\\ & & { { \\Biggl | } { \\frac { \\# } { \\# } } \\ i \\ { \\bar { \\mathbb { T } } } } \\end{array} \\right) } { \\left( \\begin{array} { l } { \\ b _ { 1 k } } \\\\ { \\ \\vdots } \\\\ { \\ b _ { n k } } \\end{array} \\right) }\n$$"]}
         输出: {"state_code":"001","content":"定义4.3.4(矩阵乘法)矩阵乘法是按以下方式定义的映射$$ \\begin{array} { r l } { \\mathrm { M } _ { m \\times n } ( F ) \\times \\mathrm { M } _ { n \\times r } ( F ) \\longrightarrow \\mathrm { M } _ { m \\times r } ( F ) } & { { } } \\\\ { ( A , B ) \\longmapsto } & { { } A B ; } \\end{array} $$若 $A = ( a _ { i j } ) _ { \\underset { 1 \\leq j \\leq n } { 1 \\leq i \\leq m } } , B = ( b _ { j k } ) _ { \\underset { 1 \\leq k \\leq r } { 1 \\leq j \\leq n } }$ ，则 $A B = ( c _ { i k } ) _ { 1 \\leq i \\leq m }$ ，其中1≤k≤r$$ c _ { i k } : = \\sum _ { j = 1 } ^ { n } a _ { i j } b _ { j k } = { \\left( \\begin{array} { l l l } { \\ a _ { i 1 } } & { \\cdots } & { a _ { i n } } \\\\ & & { { \\Biggl | } { \\frac { \\# } { \\# } } \\ i \\ { \\bar { \\mathbb { T } } } } \\end{array} \\right) } { \\left( \\begin{array} { l } { \\ b _ { 1 k } } \\\\ { \\ \\vdots } \\\\ { \\ b _ { n k } } \\end{array} \\right) } $$","summary":"矩阵乘法","number":"4.3.4"}
         """
-    ),
 )
 
-# 4. 初始化 ChatAgent
-enc = tiktoken.get_encoding("cl100k_base")
-CTX_LIMIT = agent_cfg["model_config"]["max_tokens"]  # 模型上下文
+# 批量模式：一次请求判定多个 chunk，输入为带 index 的数组，输出为逐条结果数组
+PACKED_SYSTEM_PROMPT = SYSTEM_PROMPT + dedent(
+    """
+    批量模式：
+    输入数据可能是一个 JSON 数组，每个元素包含 index、chunk_type、page_content。
+    请对每个元素独立按上述规则处理，互不参考，输出 {"results": [...]}，
+    results 中每个元素为上述格式的 JSON 对象并附带对应的 index，每个输入元素恰好对应一个结果。
+    """
+)
+
+# 4. 模型与分词器在首次调用时才构建，导入本模块不依赖 API Key 与网络
+CTX_LIMIT = agent_cfg["model_config"]["max_tokens"]  # 单次输出上限
+MODEL_CONTEXT = agent_cfg.get("model_context", CTX_LIMIT * 4)  # 模型上下文
 SAFETY = 1024  # 给输出留余量
 
+# llm_call 判定失败时的空结果
+EMPTY_RESULT = {
+    "state_code": "003",
+    "content": "",
+    "summary": "",
+    "number": "",
+}
+
 response_format = {
     "type": "json_schema",
     "json_schema": {
@@ -83,19 +106,73 @@ response_format = {
     },
 }
 
+PACKED_SCHEMA = {
+    "type": "object",
+    "required": ["results"],
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                **FILTER_SCHEMA,
+                "required": ["index", *FILTER_SCHEMA["required"]],
+                "properties": {"index": {"type": "integer"}, **FILTER_SCHEMA["properties"]},
+            },
+        },
+    },
+}
 
-model = ModelFactory.create(
-    model_platform=ModelPlatformType[agent_cfg["model_platform"]],
-    model_type=agent_cfg["model_type"],
-    model_config_dict=agent_cfg["model_config"],
-)
+packed_response_format = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "PackedChunkFilterResults",
+        "schema": PACKED_SCHEMA,
+    },
+}
 
-agent = ChatAgent(
-    system_message=sys_msg,
-    model=model,
-    output_language="中文",
+# LLM 响应缓存的版本：提示词、schema 或模型参数变化后旧结果自动失效
+PROMPT_VERSION = prompt_version(SYSTEM_PROMPT, PACKED_SYSTEM_PROMPT, FILTER_SCHEMA, agent_cfg["model_config"])
+
+# 单字段修复：标题编号无法在本地确定时，只向 LLM 询问编号
+NUMBER_PROMPT = dedent(
+    """
+    你是一个数学文档处理助手。
+    输入：一个数学条目（定义、定理、引理、例题等）开头的一段文字。
+    若标题中包含编号（如 "定理 4.1.3"），提取编号（如 "4.1.3"）填入 `number` 字段；否则 `number` 置为空字符串。
+    最终输出一个 JSON 对象。
+    """
 )
 
+NUMBER_SCHEMA = {
+    "type": "object",
+    "required": ["number"],
+    "properties": {"number": {"type": "string"}},
+}
+
+number_response_format = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "ChunkNumber",
+        "schema": NUMBER_SCHEMA,
+    },
+}
+
+NUMBER_PROMPT_VERSION = prompt_version(NUMBER_PROMPT, NUMBER_SCHEMA, agent_cfg["model_config"])
+
+
+@lru_cache(maxsize=None)
+def get_model():
+    """过滤用的 LLM 客户端，首次调用时创建"""
+    from camel.models import ModelFactory
+    from camel.types import ModelPlatformType
+
+    model = ModelFactory.create(
+        model_platform=ModelPlatformType[agent_cfg["model_platform"]],
+        model_type=agent_cfg["model_type"],
+        model_config_dict=agent_cfg["model_config"],
+    )
+    use_shared_client(model)
+    return model
+
 
 # 5. 批量过滤与转换函数
 def normalize_latex_block(text: str) -> str:
@@ -114,147 +191,420 @@ def normalize_latex_block(text: str) -> str:
     return pattern.sub(repl, text)
 
 
-def llm_call(chunk: Dict[str, Any]):
-    prompt = "\n\n输入数据：\n" + json.dumps(chunk, ensure_ascii=False)
-    user = BaseMessage.make_user_message("chunk_provider", prompt)
+def _complete(system_prompt: str, prompt: str, fmt: dict) -> str:
+    model = get_model()
 
     messages = [
-        sys_msg.to_openai_message(OpenAIBackendRole.SYSTEM),
-        user.to_openai_message(OpenAIBackendRole.USER),
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt},
     ]
     messages = model.preprocess_messages(messages)
 
     request_cfg = agent_cfg["model_config"].copy()
-    request_cfg["response_format"] = response_format
+    request_cfg["response_format"] = fmt
     request_cfg.pop("stream", None)
 
-    def _step():
-        rsp = model._client.chat.completions.create(
+    # 与关系构建、解答共用服务商限流器，入库请求让位于交互式解答
+    limiter = get_limiter(agent_cfg["model_platform"], agent_cfg["model_type"])
+    rsp = limiter.call(
+        lambda: model._client.chat.completions.create(
             messages=messages,
             model=model.model_type,
             **request_cfg,
-        )
-        return rsp.choices[0].message.content
+        ),
+        tokens=count_tokens(system_prompt) + count_tokens(prompt),
+        priority=Priority.INGEST,
+    )
+    return rsp.choices[0].message.content
+
+
+class FilterIncomplete(RuntimeError):
+    """重试后仍有 chunk 没有得到判定（请求失败），入库不能视为完成"""
+
+
+def is_valid_result(cand: Any) -> bool:
+    """判定结果是否符合 FILTER_SCHEMA"""
+    try:
+        validate(cand, FILTER_SCHEMA)
+    except SchemaValidationError:
+        return False
+    return True
+
+
+def _llm_call_once(chunk: Dict[str, Any]) -> Dict[str, Any] | None:
+    """单条判定；连续多次返回非 JSON 或不符合 FILTER_SCHEMA 的结果时返回 None"""
+    prompt = "\n\n输入数据：\n" + json.dumps(chunk, ensure_ascii=False)
 
     for _ in range(3):
         try:
-            return json.loads(_step())  # ⇐ 保证返回 python 对象
+            cand = json.loads(_complete(SYSTEM_PROMPT, prompt, response_format))  # ⇐ 保证返回 python 对象
         except json.JSONDecodeError:
             continue
+        if is_valid_result(cand):
+            return cand
+    return None
+
+
+def llm_call(chunk: Dict[str, Any]):
+    cand = _llm_call_once(chunk)
     # 连续多次解析失败，返回空结果以避免中断流程
-    return {
-        "state_code": "003",
-        "content": "",
-        "summary": "",
-        "number": "",
-    }
+    return cand if cand is not None else dict(EMPTY_RESULT)
+
+
+def llm_call_packed(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any] | None]:
+    """一次请求判定多个 chunk，返回与输入对齐的结果；缺失或未通过校验的位置为 None"""
+    payload = [{"index": i, **c} for i, c in enumerate(chunks)]
+    prompt = "\n\n输入数据：\n" + json.dumps(payload, ensure_ascii=False)
+    out: List[Dict[str, Any] | None] = [None] * len(chunks)
+    try:
+        data = json.loads(_complete(PACKED_SYSTEM_PROMPT, prompt, packed_response_format))
+    except json.JSONDecodeError:
+        return out
+
+    items = data.get("results") if isinstance(data, dict) else None
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        idx = item.get("index")
+        if not isinstance(idx, int) or not 0 <= idx < len(chunks) or out[idx] is not None:
+            continue
+        cand = {k: item.get(k) for k in FILTER_SCHEMA["required"]}
+        if is_valid_result(cand):
+            out[idx] = cand
+    return out
+
+
+def _call_pack(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any] | None]:
+    if len(chunks) == 1:
+        return [_llm_call_once(chunks[0])]
+    return llm_call_packed(chunks)
+
+
+def pack_budget() -> int:
+    """单次打包请求中 chunk 的 token 上限。
+
+    结果会复述 chunk 内容，需容纳于输出上限 CTX_LIMIT（扣除 SAFETY）；
+    输入（系统提示 + chunk）与输出之和不超过模型上下文。
+    """
+    prompt_tokens = count_tokens(PACKED_SYSTEM_PROMPT)
+    return max(1, min(CTX_LIMIT - SAFETY, MODEL_CONTEXT - CTX_LIMIT - prompt_tokens))
+
+
+def pack_items(items: List[Dict[str, Any]], indices: List[int], budget: int,
+               max_items: int) -> List[List[int]]:
+    """按 token 预算把待判定的 chunk 依次装入请求；超出预算的单个 chunk 独占一个请求"""
+    packs: List[List[int]] = []
+    cur: List[int] = []
+    used = 0
+    for i in indices:
+        n = count_tokens(json.dumps(items[i], ensure_ascii=False))
+        if cur and (used + n > budget or len(cur) >= max_items):
+            packs.append(cur)
+            cur, used = [], 0
+        cur.append(i)
+        used += n
+    if cur:
+        packs.append(cur)
+    return packs
+
+
+def filter_config() -> dict:
+    """rag_config.yaml 的 filter 配置（并发数、打包模式）"""
+    return load_config("rag_config").get("filter", {})
+
+
+def max_concurrency() -> int:
+    """过滤阶段同时在途的 LLM 请求数（filter.max_concurrency）"""
+    return max(1, filter_config().get("max_concurrency", 8))
+
+
+def call_many(items: List[Dict[str, Any]], keys: List[str], cache=None,
+              max_workers: int | None = None, packed: bool | None = None,
+              rules: bool | None = None) -> List[Dict[str, Any] | None]:
+    """并发调用 LLM 判定 items，结果与 items 顺序一致。
+
+    ``rules`` 开启（缺省取 filter.rules）时先做规则预判，置信度不低于 filter.rule_threshold 的
+    条目直接采用规则结论。命中 ``cache`` 的条目不再请求。``packed`` 开启（缺省取 filter.packed）时按 token 预算把多个
+    chunk 合并到一次请求，打包结果中缺失或未通过校验的条目再单独请求。
+    通过 FILTER_SCHEMA 校验的判定结果写入共享的 LLM 响应缓存（src.utils.llm_cache），重跑时相同内容的
+    chunk 不再请求；缓存中未通过校验的结果视为未命中。
+    单条请求抛出异常或多次返回无效结果时视为判定失败：该位置为 None（不写入缓存），不影响同批其他 chunk。
+    """
+    cfg = filter_config()
+    if rules is None:
+        rules = cfg.get("rules", False)
+    threshold = cfg.get("rule_threshold", 0.9)
+
+    results: List[Dict[str, Any] | None] = [None] * len(items)
+    llm_cache = get_llm_cache()
+    llm_keys: Dict[int, str] = {}
+    todo = []
+    settled = 0
+    for i, key in enumerate(keys):
+        if rules:
+            verdict = classify_chunk(items[i])
+            if verdict.state_code and verdict.confidence >= threshold:
+                results[i] = verdict.candidate()
+                settled += 1
+                continue
+        # 缓存中未通过校验的结果视为未命中，重新请求并覆盖
+        cand = cache.get(key) if cache is not None else None
+        if cand is not None and not is_valid_result(cand):
+            cand = None
+        if cand is None:
+            # 跨文件、跨运行共享的响应缓存，按 chunk 内容而非 id 命中
+            llm_keys[i] = llm_cache.key("filter", agent_cfg["model_type"], PROMPT_VERSION, items[i])
+            cand = llm_cache.get(llm_keys[i])
+            if cand is not None and not is_valid_result(cand):
+                cand = None
+            if cand is not None and cache is not None:
+                cache.put(key, cand)
+        if cand is None:
+            todo.append(i)
+        else:
+            results[i] = cand
+    if settled:
+        logger.info("Rules settled %d of %d chunks without LLM", settled, len(items))
+    if not todo:
+        return results
+
+    if packed is None:
+        packed = cfg.get("packed", False)
+    if packed:
+        packs = pack_items(items, todo, pack_budget(), cfg.get("pack_max_items", 8))
+    else:
+        packs = [[i] for i in todo]
+
+    get_model()  # 在分发前创建客户端，避免各线程重复初始化
+    workers = min(max_workers or max_concurrency(), len(packs))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="filter") as pool:
+        futures = {pool.submit(_call_pack, [items[i] for i in pack]): pack for pack in packs}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in done:
+                pack = futures.pop(fut)
+                try:
+                    cands = fut.result()
+                except Exception as e:
+                    if len(pack) > 1:
+                        logger.warning("Packed filter request failed, retrying singly: %s", e)
+                        cands = [None] * len(pack)
+                    else:
+                        logger.warning("LLM filter failed for %s: %s", keys[pack[0]], e)
+                        continue
+                for i, cand in zip(pack, cands):
+                    if cand is not None and not is_valid_result(cand):
+                        logger.warning("LLM filter result for %s failed schema validation", keys[i])
+                        cand = None  # 只缓存通过校验的结果
+                    if cand is None and len(pack) > 1:
+                        # 打包结果缺失或未通过校验，单独重发
+                        futures[pool.submit(_call_pack, [items[i]])] = [i]
+                        continue
+                    if cand is None:
+                        logger.warning("LLM filter returned no valid result for %s", keys[i])
+                        continue
+                    llm_cache.put(llm_keys[i], cand)
+                    if cache is not None:
+                        cache.put(keys[i], cand)
+                    results[i] = cand
+    return results
+
+
+def _head_text(page_content: List[str] | str) -> str:
+    """chunk 的标题段（段落列表取首段，拼接后的文本取全文）"""
+    if isinstance(page_content, list):
+        return page_content[0] if page_content else ""
+    return page_content
+
+
+def number_in_head(num: str, head: str) -> bool:
+    """``num`` 作为完整编号出现在标题段中（按编号边界匹配，"1" 不匹配 "11"、"2.1" 或 "1.2"）"""
+    pattern = rf"(?<![0-9A-Za-z.]){re.escape(num)}(?!\.?[0-9])"
+    return re.search(pattern, canonical_number(head)) is not None
+
+
+def local_number(head: str, claimed: str) -> str | None:
+    """在本地确定条目编号，无法确定时返回 None。
+
+    标题正则匹配到的编号优先；否则 LLM 给出的编号须能在标题段中找到，
+    LLM 给出空编号且标题不含标准编号时视为无编号。
+    """
+    num = header_number(head)
+    if num:
+        return canonical_number(num)
+    claimed = canonical_number(claimed or "")
+    if not claimed:
+        return ""
+    return claimed if number_in_head(claimed, head) else None
+
+
+def repair_number(head: str, attempts: int = 3) -> str:
+    """只向 LLM 询问编号这一个字段；结果仍须能在标题段中找到，否则置为空"""
+    llm_cache = get_llm_cache()
+    key = llm_cache.key("number", agent_cfg["model_type"], NUMBER_PROMPT_VERSION, head)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached["number"]
+
+    prompt = "\n\n输入数据：\n" + head
+    number = ""
+    for _ in range(attempts):
+        try:
+            cand = json.loads(_complete(NUMBER_PROMPT, prompt, number_response_format))
+        except json.JSONDecodeError:
+            continue
+        num = canonical_number(str(cand.get("number", ""))) if isinstance(cand, dict) else ""
+        if not num or number_in_head(num, head):
+            number = num
+            break
+    llm_cache.put(key, {"number": number})
+    return number
+
+
+def repair_numbers(heads: List[str], attempts: int = 3, max_workers: int | None = None) -> List[str]:
+    """并发修复多个标题段的编号，结果与输入顺序一致；单条失败时编号置为空"""
+    if not heads:
+        return []
+
+    def one(head: str) -> str:
+        try:
+            return repair_number(head, attempts)
+        except Exception as e:
+            logger.warning("Number repair failed: %s", e)
+            return ""
+
+    get_model()
+    workers = min(max_workers or max_concurrency(), len(heads))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="number") as pool:
+        return list(pool.map(one, heads))
 
 
 def filter_and_convert(
-    chunks: List[ParagraphChunk], max_retry: int = 3
+    chunks: List[ParagraphChunk], max_retry: int = 3, cache=None, tag: str = "main",
+    max_workers: int | None = None, require_verdicts: bool = False,
 ) -> (List[ParagraphChunk], List[ParagraphChunk]):
-    """调用 LLM 过滤并解析 chunk，可对编号识别失败的条目进行重复处理。"""
+    """调用 LLM 过滤并解析 chunk，返回 (通过的条目, 需扩大窗口重试的 chunk)。
+
+    需要重试的是内容不完整（002）与请求失败、没有得到判定的 chunk；后者在
+    ``require_verdicts`` 为 True 时（重试轮）直接抛出 FilterIncomplete，不会被当作 003 丢弃。
+
+    每个 chunk 只完整判定一次：编号由标题正则在本地确定并校验，
+    仅在本地无法确定时向 LLM 单独询问编号（至多 ``max_retry`` 次），不再整条重发。
+    请求并发发出（至多 ``max_workers`` 个在途，缺省取配置），结果保持原顺序。
+    ``cache`` 提供 ``get(key)``/``put(key, result)`` 时，逐条记录 LLM 结果，
+    重跑时已完成的 chunk 直接复用（键为 ``tag:0:chunk_id``）。
+    """
+
+    pure_chunks = []
+    for chunk in chunks:
+        pure_chunks.append(
+            {
+                "chunk_type": chunk.metadata["chunk_type"],
+                "page_content": chunk.page_content,
+            }
+        )
+
+    keys = [f"{tag}:0:{chunk.id}" for chunk in chunks]
+    candidate_list = call_many(pure_chunks, keys, cache=cache, max_workers=max_workers)
 
-    remaining = list(chunks)
-    results_dict: Dict[str, ParagraphChunk] = {}
+    results: List[ParagraphChunk] = []
     faild_chunks: List[ParagraphChunk] = []
-    last_candidate: Dict[str, ParagraphChunk] = {}
-    attempt = 0
-
-    while remaining and attempt < max_retry:
-        pure_chunks = []
-        for chunk in remaining:
-            pure_chunks.append(
-                {
-                    "chunk_type": chunk.metadata["chunk_type"],
-                    "page_content": chunk.page_content,
-                }
+    unresolved: List[tuple] = []
+    missing: List[str] = []
+    for item, chunk in zip(candidate_list, chunks):
+        if item is None:
+            missing.append(chunk.id)
+            faild_chunks.append(
+                ParagraphChunk(id=chunk.id, page_content=chunk.page_content, metadata=chunk.metadata)
             )
-
-        candidate_list = []
-        for item in pure_chunks:
-            candidate_list.append(llm_call(item))
-
-        for cand in candidate_list:
-            try:
-                validate(cand, FILTER_SCHEMA)
-            except ValidationError:
-                print("Schema 校验失败")
-
-        next_round = []
-        for item, chunk in zip(candidate_list, remaining):
-            if item["state_code"] == "001":
-                content = normalize_latex_block(item["content"])
-                new_chunk = ParagraphChunk(
-                    id=chunk.id, page_content=content, metadata=chunk.metadata
-                )
-                new_chunk.metadata["summary"] = item["summary"]
-                new_chunk.metadata["number"] = item.get("number", "")
-                last_candidate[chunk.id] = new_chunk
-
-                num = new_chunk.metadata["number"].strip()
-                text = (
-                    "".join(new_chunk.page_content)
-                    if isinstance(new_chunk.page_content, list)
-                    else new_chunk.page_content
-                )
-                if num and re.search(re.escape(num), text):
-                    results_dict[chunk.id] = new_chunk
-                else:
-                    next_round.append(chunk)
-            elif item["state_code"] == "002":
-                faild_chunks.append(
-                    ParagraphChunk(
-                        id=chunk.id,
-                        page_content=chunk.page_content,
-                        metadata=chunk.metadata,
-                    )
-                )
-            else:
-                faild_chunks.append(
-                    ParagraphChunk(
-                        id=chunk.id,
-                        page_content=chunk.page_content,
-                        metadata=chunk.metadata,
-                    )
+            continue
+        if not is_valid_result(item):
+            logger.warning("Filter result for %s failed schema validation, skipping: %r", chunk.id, item)
+            continue
+        if item["state_code"] == "001":
+            content = normalize_latex_block(item["content"])
+            new_chunk = ParagraphChunk(
+                id=chunk.id, page_content=content, metadata=chunk.metadata
+            )
+            new_chunk.metadata["summary"] = item["summary"]
+            head = _head_text(chunk.page_content)
+            num = local_number(head, item.get("number", ""))
+            new_chunk.metadata["number"] = num or ""
+            if num is None:
+                unresolved.append((new_chunk, head))
+            results.append(new_chunk)
+        elif item["state_code"] == "002":
+            faild_chunks.append(
+                ParagraphChunk(
+                    id=chunk.id,
+                    page_content=chunk.page_content,
+                    metadata=chunk.metadata,
                 )
+            )
 
-        remaining = next_round
-        attempt += 1
-
-    # 已经达到重试次数，使用最后一次的候选结果
-    for chunk in remaining:
-        cand = last_candidate.get(chunk.id)
-        if cand:
-            results_dict[chunk.id] = cand
+    if missing:
+        logger.warning("%d of %d chunks got no filter verdict", len(missing), len(chunks))
+        if require_verdicts:
+            raise FilterIncomplete(f"No filter verdict for {len(missing)} chunks: {', '.join(missing[:5])}")
 
-    results = [results_dict[c.id] for c in chunks if c.id in results_dict]
+    if unresolved:
+        numbers = repair_numbers([head for _, head in unresolved], max_retry, max_workers)
+        for (new_chunk, _), num in zip(unresolved, numbers):
+            new_chunk.metadata["number"] = num
+        logger.info("Repaired numbers of %d of %d chunks via LLM", len(unresolved), len(results))
     return results, faild_chunks
 
 
-def chunk_and_filter(docs: List[ParagraphChunk], TOKEN_LIM: int = 500, FAILD_LIM: int = 2000) -> List[ParagraphChunk]:
-    chunks = chunk_documents(docs, MAX_TOKEN=TOKEN_LIM)
-    docs_dict = {doc.id: (doc, index) for index, doc in enumerate(docs)}
+def chunk_and_filter(docs: List[ParagraphChunk], TOKEN_LIM: int = 500, FAILD_LIM: int = 2000,
+                     checkpoint=None) -> List[ParagraphChunk]:
+    """切分并过滤段落；传入 StageCheckpoint 时保存切分结果与逐条过滤结果，便于断点续跑。
+
+    ``TOKEN_LIM`` / ``FAILD_LIM`` 以分词器 token 计；段落标题类型只识别一次，切分与失败重试共用。
+    """
+    cache = checkpoint.filter_log if checkpoint is not None else None
+    header_types: Dict[str, str | None] = {}
+    if checkpoint is not None and checkpoint.has(RAW_CHUNKS):
+        chunks = checkpoint.load_chunks(RAW_CHUNKS)
+    else:
+        chunks = chunk_documents(docs, MAX_TOKEN=TOKEN_LIM, header_types=header_types)
+        if checkpoint is not None:
+            checkpoint.save_chunks(RAW_CHUNKS, chunks)
+
+    result, faild_chunks = filter_and_convert(chunks, cache=cache)
+    result.extend(retry_failed(faild_chunks, docs, FAILD_LIM, cache=cache, header_types=header_types))
+    return result
 
-    result, faild_chunks = filter_and_convert(chunks)
 
+def build_retry_chunks(faild_chunks: List[ParagraphChunk], docs: List[ParagraphChunk],
+                       FAILD_LIM: int = 2000,
+                       header_types: Dict[str, str | None] | None = None) -> List[ParagraphChunk]:
+    """以更大的窗口（直到下一个标题段或 FAILD_LIM 个 token）重新拼接过滤失败的 chunk"""
+    docs_dict = {doc.id: (doc, index) for index, doc in enumerate(docs)}
     retry_chunks = []
     for chunk in faild_chunks:
         target_chunk, target_index = docs_dict.get(chunk.metadata["initial_id"])
         buf_text = [target_chunk.page_content]
-        tok_cnt = len(target_chunk.page_content)
-        for next_chunk in docs[target_index + 1 :]:
-            if detect_header_type(next_chunk.page_content):
+        tok_cnt = count_tokens(target_chunk.page_content)
+        for next_chunk in islice(docs, target_index + 1, None):
+            if classify(next_chunk, header_types):
                 break
             if tok_cnt > FAILD_LIM:
                 break
             buf_text.append(next_chunk.page_content)
-            tok_cnt += len(next_chunk.page_content)
+            tok_cnt += count_tokens(next_chunk.page_content)
         retry_chunks.append(
             ParagraphChunk(id=chunk.id, page_content="\n".join(buf_text).strip(), metadata=chunk.metadata)
         )
+    return retry_chunks
 
-    _result, _faild_chunks = filter_and_convert(retry_chunks)
 
-    result.extend(_result)
-    return result
+def retry_failed(faild_chunks: List[ParagraphChunk], docs: List[ParagraphChunk],
+                 FAILD_LIM: int = 2000, cache=None,
+                 header_types: Dict[str, str | None] | None = None) -> List[ParagraphChunk]:
+    """对首轮内容不完整（002）或未得到判定的 chunk 扩大窗口后再过滤一次，返回成功的结果。
+
+    仍未得到判定时抛出 FilterIncomplete，已有结果保留在 ``cache`` 中，重新入库时只请求缺失的部分。
+    """
+    retry_chunks = build_retry_chunks(faild_chunks, docs, FAILD_LIM, header_types)
+    _result, _faild_chunks = filter_and_convert(retry_chunks, cache=cache, tag="retry", require_verdicts=True)
+    return _result
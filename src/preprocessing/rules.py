@@ -0,0 +1,175 @@
+# src/preprocessing/rules.py
+"""规则预判：对一目了然的 chunk 直接给出过滤结果与置信度，只把模糊的交给 LLM。
+
+评估模式：python -m src.preprocessing.rules <chunks.json | relation_store/<file_id> ...>
+统计规则结论与 LLM 判定的一致率。段落级 chunks.json 先切分再调用 LLM（经响应缓存）；
+入库产生的 relation_store/<file_id> 目录直接使用其中保存的首轮过滤结果。
+"""
+
+import argparse
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.preprocessing.chunker import HEADER_RE, header_number
+
+# 标题编号后紧跟这些词（且其后不是括号标题）时，该段多半是对条目的引用而不是条目本身（如“定理 1.2 的证明”）。
+# “中”“得”“给出”等前缀也可能是条目名或正文的开头（“定理 3.1 中值定理”“定义 2.1 给出映射”），不在此列
+REFERENCE_RE = re.compile(r"^\s*(?:的|可知|表明|所述|已证|证明了|推出)(?!\s*[（(])")
+# 引用规则仍可能误判，置信度低于默认阈值，由 LLM 确认
+REFERENCE_CONFIDENCE = 0.8
+# 以“如下”“以下”等结尾（可带冒号、逗号），说明内容延续到了 chunk 之外
+INCOMPLETE_RE = re.compile(r"(?:如下|以下|下列|下述|如下所示)\s*[:：,，]?\s*$")
+# 证明、提示、解答等段落的起始标记，之前的段落即为条目正文
+MARKER_RE = re.compile(r"^\s*(?:证明|提示|Proof|(?:证|解)\s*[:：.．\s])")
+# 标题编号后的括号标题（用作 summary）
+TITLE_RE = re.compile(r"^\s*[（(]([^()（）]{1,30})[)）]")
+# 正文完整时末段的结尾
+TERMINAL_RE = re.compile(r"(?:[。．.!！?？;；)）]|\$\$|\$)\s*$")
+
+
+@dataclass
+class RuleResult:
+    state_code: str  # 空字符串表示规则无法判断
+    confidence: float
+    rule: str
+    content: str = ""
+    summary: str = ""
+    number: str = ""
+
+    def candidate(self) -> Dict[str, str]:
+        """与 LLM 输出格式相同的过滤结果"""
+        return {
+            "state_code": self.state_code,
+            "content": self.content,
+            "summary": self.summary,
+            "number": self.number,
+        }
+
+
+AMBIGUOUS = RuleResult("", 0.0, "ambiguous")
+
+
+def classify_chunk(item: Dict[str, Any]) -> RuleResult:
+    """对 {"chunk_type", "page_content"} 做规则判定，返回结论与置信度（0~1）"""
+    paragraphs = item["page_content"]
+    if isinstance(paragraphs, str):
+        paragraphs = [paragraphs]
+    if not paragraphs:
+        return AMBIGUOUS
+    head = paragraphs[0]
+    m = HEADER_RE.match(head)
+    if m is None:
+        return AMBIGUOUS
+    number = header_number(head) or ""
+    rest = head[m.end():]
+
+    if REFERENCE_RE.match(rest):
+        return RuleResult("003", REFERENCE_CONFIDENCE, "reference")
+
+    if INCOMPLETE_RE.search(paragraphs[-1]):
+        # 段落越多，末段越可能不属于条目本身
+        return RuleResult("002", 0.95 if len(paragraphs) <= 2 else 0.8, "incomplete")
+
+    title = TITLE_RE.match(rest)
+    if title is None:
+        return AMBIGUOUS  # 没有可用作 summary 的标题，交给 LLM 总结
+    marker = next((k for k, p in enumerate(paragraphs[1:], 1) if MARKER_RE.match(p)), None)
+    if marker is not None:
+        statement, confidence, rule = paragraphs[:marker], 0.95, "statement+marker"
+    elif len(paragraphs) == 1:
+        statement, confidence, rule = paragraphs, 0.9, "single"
+    else:
+        # 标题段自身完整，但后续段落是否属于条目需要语义判断
+        statement, confidence, rule = paragraphs[:1], 0.75, "head"
+    if not TERMINAL_RE.search(statement[-1]):
+        return AMBIGUOUS
+    if item.get("chunk_type") == "exercise":
+        confidence -= 0.1  # 练习的括号内常是出处而非主题
+    return RuleResult(
+        "001",
+        round(confidence, 2),
+        rule,
+        content="\n".join(statement),
+        summary=title.group(1).strip(),
+        number=number,
+    )
+
+
+# ---------------------------------------------------------------- 评估模式
+
+def _load_eval_items(path: Path) -> Tuple[List[Dict[str, Any]], List[Optional[dict]]]:
+    from src.datamodel import ParagraphChunk
+    from src.pipeline.checkpoint import RAW_CHUNKS, StageCheckpoint
+    from src.preprocessing.chunker import chunk_documents
+
+    if path.is_dir():
+        ckpt = StageCheckpoint(path.name, base_dir=str(path.parent))
+        if not ckpt.has(RAW_CHUNKS):
+            raise FileNotFoundError(f"{path} has no {RAW_CHUNKS}.json checkpoint")
+        chunks = ckpt.load_chunks(RAW_CHUNKS)
+        log = ckpt.filter_log
+        stored = [log.get(f"main:0:{c.id}") for c in chunks]
+    else:
+        with path.open("r", encoding="utf-8") as f:
+            docs = [ParagraphChunk.from_json(s) for s in json.load(f)]
+        chunks = chunk_documents(docs)
+        stored = [None] * len(chunks)
+    items = [{"chunk_type": c.metadata["chunk_type"], "page_content": c.page_content} for c in chunks]
+    return items, stored
+
+
+def evaluate(paths: List[str], threshold: float) -> dict:
+    """规则与 LLM 的一致率：总体覆盖率、置信度达标部分的一致率及各规则明细"""
+    from src.preprocessing.filterer import call_many
+
+    per_rule: Dict[str, Counter] = {}
+    confusion: Counter = Counter()
+    total = settled = agree = 0
+    for p in paths:
+        items, stored = _load_eval_items(Path(p))
+        missing = [i for i, s in enumerate(stored) if s is None]
+        if missing:
+            fresh = call_many([items[i] for i in missing], [f"eval:{p}:{i}" for i in missing], rules=False)
+            for i, cand in zip(missing, fresh):
+                stored[i] = cand
+        for item, llm in zip(items, stored):
+            r = classify_chunk(item)
+            total += 1
+            stats = per_rule.setdefault(r.rule, Counter())
+            stats["n"] += 1
+            if not r.state_code or llm is None:
+                continue  # 规则无法判断，或 LLM 请求失败
+            same = r.state_code == llm["state_code"] and (
+                r.state_code != "001" or r.number == llm.get("number", "").strip()
+            )
+            stats["agree"] += same
+            confusion[(r.state_code, llm["state_code"])] += 1
+            if r.confidence >= threshold:
+                settled += 1
+                agree += same
+    return {
+        "chunks": total,
+        "settled": settled,
+        "coverage": round(settled / total, 4) if total else 0.0,
+        "agreement": round(agree / settled, 4) if settled else 0.0,
+        "rules": {k: dict(v) for k, v in per_rule.items()},
+        "confusion": {f"{a}->{b}": n for (a, b), n in sorted(confusion.items())},
+    }
+
+
+def main() -> None:
+    from src.preprocessing.filterer import filter_config
+
+    parser = argparse.ArgumentParser(description="评估规则预判与 LLM 过滤结果的一致率")
+    parser.add_argument("paths", nargs="+", help="段落级 chunks.json 或 relation_store/<file_id> 目录")
+    parser.add_argument("--threshold", type=float, default=filter_config().get("rule_threshold", 0.9))
+    args = parser.parse_args()
+    print(json.dumps(evaluate(args.paths, args.threshold), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
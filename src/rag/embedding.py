@@ -1,37 +1,123 @@
 # src/rag/embedding.py
 
+import hashlib
+import json
 import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple
 from dotenv import load_dotenv
-from camel.embeddings import OpenAICompatibleEmbedding
-from camel.storages import BaseVectorStorage, VectorRecord, QdrantStorage
-from camel.types import VectorDistance
 from src.datamodel import ParagraphChunk
+from src.utils.embedding_cache import get_embedding_cache
+from src.utils.logger import get_logger
+from src.utils.http import use_shared_client
+from src.utils.rate_limit import Priority, get_limiter
+from src.utils.tokens import count_tokens
 
 load_dotenv()
+logger = get_logger(__name__)
+
+
+def plan_batches(token_counts: List[int], max_tokens: int, max_items: int) -> List[Tuple[int, int]]:
+    """按 token 数把文本依次分组，返回 [start, end) 区间；单条超过上限的文本独占一组"""
+    batches: List[Tuple[int, int]] = []
+    start, used = 0, 0
+    for i, n in enumerate(token_counts):
+        if i > start and (used + n > max_tokens or i - start >= max_items):
+            batches.append((start, i))
+            start, used = i, 0
+        used += n
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+def create_embedder(config: dict):
+    """按 embedding.backend 创建向量模型：api 为 OpenAI 兼容接口（SiliconFlow），local 为本地 CPU 模型"""
+    backend = config.get("backend", "api")
+    if backend == "local":
+        from src.rag.local_embedding import get_local_embedding
+
+        local = {k: v for k, v in config.get("local", {}).items() if k != "index_path"}
+        return get_local_embedding(**local)
+    if backend != "api":
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    from camel.embeddings import OpenAICompatibleEmbedding
+
+    embedder = OpenAICompatibleEmbedding(
+        model_type=config["model_name"],
+        url=config["url"],
+    )
+    use_shared_client(embedder)
+    return embedder
+
+
+# 每次解析都会重新生成、不影响检索内容的元数据（段落 id 为 uuid4），不参与内容摘要
+VOLATILE_METADATA = frozenset({"initial_id"})
+
+
+def point_id(doc_id: str) -> str:
+    """向量库中的点 id 统一为 32 位十六进制（Qdrant 返回带连字符的 UUID）"""
+    try:
+        return uuid.UUID(str(doc_id)).hex
+    except ValueError:
+        return str(doc_id)
+
 
 class EmbeddingManager:
     def __init__(self, config: dict, collection_name: str):
-        self.embedder = OpenAICompatibleEmbedding(
-            model_type=config["model_name"],
-            url=config["url"],
-        )
+        from camel.storages import QdrantStorage
+        from camel.types import VectorDistance
+
+        self.embedder = create_embedder(config)
+        local = config.get("backend", "api") == "local"
+        # 本地模型不经过服务商限流，批次并行由模型自身的线程池完成
+        self.limiter = None if local else get_limiter(config.get("model_platform", "SILICONFLOW"), config["model_name"])
+        # 每次请求至多 batch_size 条、max_batch_tokens 个 token，同时在途 concurrency 个请求
         self.batch_size = config.get("batch_size", 32)
-        # 初始化向量存储路径并绑定本地 QdrantStorage
-        self.index_path = Path(config.get("index_path", "data/vector_store"))
+        self.max_batch_tokens = config.get("max_batch_tokens", 8192)
+        self.concurrency = 1 if local else max(1, config.get("concurrency", 4))
+        self.stats = {"texts": 0, "cached": 0, "tokens": 0, "seconds": 0.0, "tokens_per_s": 0.0}
+        self.last_sync: dict | None = None
+        # 跨文件共享的向量缓存：相同文本在任何 collection 中只计算一次
+        self.model_name = self.embedder.name if local else config["model_name"]
+        self.cache = get_embedding_cache()
+        # 初始化向量存储路径并绑定本地 QdrantStorage；本地模型的向量维度可能不同，使用单独的目录
+        if local:
+            self.index_path = Path(config.get("local", {}).get("index_path", "data/vector_store_local"))
+        else:
+            self.index_path = Path(config.get("index_path", "data/vector_store"))
         self.index_path.mkdir(parents=True, exist_ok=True)
         self.collection_name = collection_name
-        self.storage = QdrantStorage(
-            vector_dim=self.embedder.get_output_dim(),
-            path=str(self.index_path),
-            collection_name=collection_name,
-            distance=VectorDistance.COSINE,
-        )
+        # 向量库：qdrant 为本地 Qdrant；flat 为内存映射的扁平矩阵（见 flat_store），可选 int8/binary 量化
+        store = config.get("store", "qdrant")
+        if store == "flat":
+            from src.rag.flat_store import FlatVectorStorage
+
+            flat = config.get("flat", {})
+            self.storage = FlatVectorStorage(
+                vector_dim=self.embedder.get_output_dim(),
+                path=str(self.index_path),
+                collection_name=collection_name,
+                quantization=flat.get("quantization", "none"),
+                rescore=flat.get("rescore", 4),
+            )
+        elif store == "qdrant":
+            self.storage = QdrantStorage(
+                vector_dim=self.embedder.get_output_dim(),
+                path=str(self.index_path),
+                collection_name=collection_name,
+                distance=VectorDistance.COSINE,
+            )
+        else:
+            raise ValueError(f"Unknown vector store: {store}")
 
     def build_or_load(self, documents: List[ParagraphChunk], force_rebuild: bool = False):
         """
-        如果已有索引且不强制重建，直接加载；否则对所有 documents 批量计算嵌入并存储。
+        如果已有索引且不强制重建，直接加载；否则按内容差异增量更新索引（见 ``sync``）。
         """
         # 根据当前 collection 判断是否已构建过索引
         try:
@@ -40,31 +126,177 @@ class EmbeddingManager:
         except Exception:
             pass
 
-        # 批量计算并存储
-        for i in range(0, len(documents), self.batch_size):
-            batch = documents[i : i + self.batch_size]
-            texts = [d.page_content for d in batch]
-            vectors = self.embedder.embed_list(texts)
-
-            # 构造 VectorRecord
-            records = []
-            for vec, doc in zip(vectors, batch):
-                vr = VectorRecord(
-                    id=doc.id,
-                    vector=vec,
-                    payload={
-                        "text": doc.page_content,  # 正文
-                        "metadata": doc.metadata,  # 页码、文件名
-                        "content path": f"{doc.metadata['file_id']}#page="
-                                        f"{doc.metadata['page_num']}",
-                        "extra_info": {}  # 可选
-                    }
-                )
-                records.append(vr)
-
-            # 重点：传入 records 参数
-            self.storage.add(records=records)
-
-    def embed(self, text: str) -> list[float]:
-        """对单条文本进行编码。"""
-        return self.embedder.embed_list([text])[0]
+        return self.sync(documents)
+
+    def content_hash(self, doc: ParagraphChunk) -> str:
+        """决定向量与 payload 是否需要重写的摘要：模型、正文与元数据任一变化都会改变（VOLATILE_METADATA 除外）"""
+        metadata = {k: v for k, v in (doc.metadata or {}).items() if k not in VOLATILE_METADATA}
+        raw = json.dumps([self.model_name, doc.page_content, metadata],
+                         ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def indexed_hashes(self) -> Dict[str, str | None]:
+        """向量库中已有的 {点 id: content_hash}（旧版本写入的点没有摘要，值为 None）"""
+        if hasattr(self.storage, "payload_values"):
+            return {point_id(i): h for i, h in self.storage.payload_values("content_hash")}
+        client = self.storage.client
+        found: Dict[str, str | None] = {}
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=self.collection_name, limit=1024, offset=offset,
+                with_payload=["content_hash"], with_vectors=False,
+            )
+            for p in points:
+                found[point_id(p.id)] = (p.payload or {}).get("content_hash")
+            if offset is None:
+                return found
+
+    def sync(self, documents: List[ParagraphChunk]) -> dict:
+        """使索引与 documents 一致：只计算并写入新增或内容变化的 chunk，删除已不存在的 chunk。
+
+        chunk id 由内容派生（见 chunker.stable_chunk_id），重新处理同一文件时未变化的 chunk 直接复用。
+        返回 {"reused", "added", "updated", "removed"} 计数。
+        """
+        indexed = self.indexed_hashes()
+        changed = self.changed_documents(documents, indexed)
+        if changed:
+            self.add_documents(changed)
+        return self.finish_sync(documents, indexed, changed)
+
+    def changed_documents(self, documents: List[ParagraphChunk], indexed: Dict[str, str | None]) -> List[ParagraphChunk]:
+        """documents 中不在 indexed（``indexed_hashes`` 的结果）里或内容摘要已变化、需要写入的 chunk"""
+        return [doc for doc in documents if indexed.get(point_id(doc.id)) != self.content_hash(doc)]
+
+    def finish_sync(self, documents: List[ParagraphChunk], indexed: Dict[str, str | None],
+                    changed: List[ParagraphChunk]) -> dict:
+        """changed 写入后收尾：删除 indexed 中已不在 documents 里的点，记录并返回 ``sync`` 的计数。
+
+        流式入库逐批写入变化的 chunk，全部到齐后调用本方法。
+        """
+        wanted = {point_id(doc.id) for doc in documents}
+        stale = [pid for pid in indexed if pid not in wanted]
+        if stale:
+            self.storage.delete(ids=stale)
+        added = sum(1 for doc in changed if point_id(doc.id) not in indexed)
+        summary = {
+            "reused": len(documents) - len(changed),
+            "added": added,
+            "updated": len(changed) - added,
+            "removed": len(stale),
+        }
+        self.last_sync = summary
+        logger.info("Index %s synced: %s", self.collection_name, summary)
+        return summary
+
+    def add_documents(self, documents: List[ParagraphChunk]) -> dict:
+        """对 documents 计算嵌入并追加到索引（流式入库时逐批调用），返回本次的吞吐统计。
+
+        命中向量缓存的文本直接写入；其余文本去重后按 token 数分组请求，多组并发计算，
+        先完成的组由当前线程写入向量库与缓存，写入与其余组的计算重叠。
+        """
+        texts = [d.page_content for d in documents]
+        keys = [self.cache.key(self.model_name, t) for t in texts]
+        cached = self.cache.get_many(keys)
+        # 同一次调用中重复的文本也只计算一次
+        pending: Dict[str, List[int]] = {}
+        for i, k in enumerate(keys):
+            if k not in cached:
+                pending.setdefault(k, []).append(i)
+        todo = [idx[0] for idx in pending.values()]
+        counts = [count_tokens(texts[i]) for i in todo]
+        batches = plan_batches(counts, self.max_batch_tokens, self.batch_size)
+
+        start = time.perf_counter()
+        workers = min(self.concurrency, len(batches)) or 1
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+            futures = {
+                pool.submit(self._embed, [texts[i] for i in todo[a:b]], Priority.INGEST): todo[a:b]
+                for a, b in batches
+            }
+            try:
+                # 向量库只在当前线程写入；缓存命中的部分在等待首批结果时写入
+                hits = [self._record(d, cached[k]) for d, k in zip(documents, keys) if k in cached]
+                for h in range(0, len(hits), self.batch_size):
+                    self.storage.add(records=hits[h : h + self.batch_size])
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        group = futures.pop(fut)
+                        vectors = fut.result()
+                        self.cache.put_many((keys[i], vec) for i, vec in zip(group, vectors))
+                        self.storage.add(records=[
+                            self._record(documents[j], vec)
+                            for i, vec in zip(group, vectors)
+                            for j in pending[keys[i]]
+                        ])
+            except BaseException:
+                for fut in futures:
+                    fut.cancel()
+                raise
+
+        elapsed = time.perf_counter() - start
+        tokens = sum(counts)
+        run = {
+            "texts": len(texts),
+            "cached": len(texts) - sum(len(idx) for idx in pending.values()),
+            "tokens": tokens,
+            "seconds": round(elapsed, 3),
+            "tokens_per_s": round(tokens / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        self.stats["texts"] += run["texts"]
+        self.stats["cached"] += run["cached"]
+        self.stats["tokens"] += tokens
+        self.stats["seconds"] = round(self.stats["seconds"] + elapsed, 3)
+        if self.stats["seconds"] > 0:
+            self.stats["tokens_per_s"] = round(self.stats["tokens"] / self.stats["seconds"], 1)
+        if texts:
+            logger.info("Embedded %d texts (%d cached, %d tokens) in %d requests: %.1fs, %.0f tokens/s",
+                        len(texts), run["cached"], tokens, len(batches), elapsed, run["tokens_per_s"])
+        return run
+
+    def _record(self, doc: ParagraphChunk, vector: list):
+        from camel.storages import VectorRecord
+
+        return VectorRecord(
+            id=doc.id,
+            vector=vector,
+            payload={
+                "text": doc.page_content,  # 正文
+                "metadata": doc.metadata,  # 页码、文件名
+                "content path": f"{doc.metadata['file_id']}#page="
+                                f"{doc.metadata['page_num']}",
+                "content_hash": self.content_hash(doc),  # 增量更新时判断是否变化
+                "extra_info": {}  # 可选
+            }
+        )
+
+    def _embed(self, texts: List[str], priority: Priority) -> List[list]:
+        if self.limiter is None:
+            return self.embedder.embed_list(texts)
+        return self.limiter.call(
+            lambda: self.embedder.embed_list(texts),
+            tokens=sum(count_tokens(t) for t in texts),
+            priority=priority,
+        )
+
+    def embed(self, text: str, priority: Priority = Priority.INTERACTIVE) -> list[float]:
+        """对单条文本进行编码（检索查询，缺省为交互优先级）。"""
+        return self._embed([text], priority)[0]
+
+
+class QueryEmbedding:
+    """供 camel VectorRetriever 使用的查询编码器：查询经由 EmbeddingManager（限流、所选后端）"""
+
+    def __init__(self, emb_mgr: EmbeddingManager, priority: Priority = Priority.INTERACTIVE):
+        self.emb_mgr = emb_mgr
+        self.priority = priority
+
+    def embed(self, obj: str, **kwargs) -> list[float]:
+        return self.emb_mgr.embed(obj, self.priority)
+
+    def embed_list(self, objs: List[str], **kwargs) -> List[list]:
+        return self.emb_mgr._embed(objs, self.priority)
+
+    def get_output_dim(self) -> int:
+        return self.emb_mgr.embedder.get_output_dim()
@@ -0,0 +1,364 @@
+# src/rag/flat_store.py
+
+"""内存映射的扁平向量库：每个文件一个连续的 float32 矩阵，精确 top-k 只需一次向量化点积。
+
+单个文件的 collection 只有数百到数千条向量，无需 Qdrant 的索引结构、进程锁与启动开销。
+目录布局（``<index_path>/flat/<collection>/``）：
+
+- ``meta.json``：维度与量化方式；
+- ``vectors.f32``：归一化后的 float32 向量，按行连续存放，查询时以 memmap 打开；
+- ``codes.i8`` + ``scales.f32``（int8）或 ``codes.bin``（binary）：量化码，先用其粗排，
+  再取 ``rescore`` 倍候选用 float32 精排；
+- ``records.jsonl``：与向量行一一对应的 id 与 payload。
+
+新增的向量追加到文件末尾，已有 id 原地覆盖对应行，删除时整体压缩重写：先写入 ``<collection>.tmp``，
+把原目录改名为 ``<collection>.old`` 后换入新目录，最后删除旧目录；中断时打开 collection 会据此还原（见 ``_recover``）。
+追加时先写向量与量化码、最后写 records.jsonl；写入中断时打开 collection 会把各文件截断到
+共同的完整行数（见 ``_repair``），多出的向量行不会与之后追加的记录错位。
+"""
+
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from camel.storages.vectordb_storages import (
+    BaseVectorStorage,
+    VectorDBQuery,
+    VectorDBQueryResult,
+    VectorDBStatus,
+    VectorRecord,
+)
+
+from src.rag.embedding import point_id
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+QUANTIZATIONS = ("none", "int8", "binary")
+
+
+def _row_bytes(dim: int, quantization: str) -> Dict[str, int]:
+    """各矩阵文件每行的字节数"""
+    files = {"vectors.f32": 4 * dim}
+    if quantization == "int8":
+        files.update({"codes.i8": dim, "scales.f32": 4})
+    elif quantization == "binary":
+        files["codes.bin"] = (dim + 7) // 8
+    return files
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    return m / np.maximum(np.linalg.norm(m, axis=-1, keepdims=True), 1e-12)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """逐行对称量化：code = round(v / scale)，scale = max|v| / 127"""
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """按符号取一位，每 8 维打包为一个字节"""
+    return np.packbits(vectors > 0, axis=1)
+
+
+def _popcount(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return np.unpackbits(x, axis=-1)
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """分数最高的 k 个下标，按分数降序"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+class FlatVectorStorage(BaseVectorStorage):
+    """与 QdrantStorage 接口相同，可直接交给 camel 的 VectorRetriever 使用（余弦相似度）"""
+
+    def __init__(self, vector_dim: int, path: str, collection_name: str,
+                 quantization: str = "none", rescore: int = 4) -> None:
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.vector_dim = vector_dim
+        self.collection_name = collection_name
+        self.dir = Path(path) / "flat" / collection_name
+        self.rescore = max(1, rescore)
+        self._lock = threading.RLock()
+        self._cache: Optional[dict] = None
+        self._recover()
+
+        meta_path = self.dir / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if meta["dim"] != vector_dim:
+                raise ValueError(
+                    f"Collection {collection_name} has dim {meta['dim']}, expected {vector_dim}"
+                )
+            self._repair(meta["quantization"])
+            if meta["quantization"] != quantization:
+                # 量化方式变化时由 float32 向量重建量化码
+                logger.info("Re-quantizing %s: %s -> %s", collection_name, meta["quantization"], quantization)
+                self.quantization = meta["quantization"]
+                self._rewrite(*self._read_all(), quantization=quantization)
+        self.quantization = quantization
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._write_meta()
+
+    # ------------------------------------------------------------ 文件读写
+
+    def _file(self, name: str) -> Path:
+        return self.dir / name
+
+    def _write_meta(self) -> None:
+        meta = {"dim": self.vector_dim, "quantization": self.quantization}
+        self._file("meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    def _swap_dirs(self) -> Tuple[Path, Path]:
+        return self.dir.with_name(self.dir.name + ".tmp"), self.dir.with_name(self.dir.name + ".old")
+
+    def _recover(self) -> None:
+        """整体重写在换入新目录前后中断时还原：原目录已移开则换入写完的新目录（meta.json 最后写入），
+        否则恢复旧目录；原目录完好时清理残留的临时目录"""
+        tmp, old = self._swap_dirs()
+        if not self.dir.exists():
+            if (tmp / "meta.json").exists():
+                logger.warning("Completing interrupted rewrite of %s", self.collection_name)
+                os.replace(tmp, self.dir)
+            elif old.exists():
+                logger.warning("Restoring %s after an interrupted rewrite", self.collection_name)
+                os.replace(old, self.dir)
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def _repair(self, quantization: str) -> None:
+        """追加写入中断后，把 records.jsonl 与各矩阵文件截断到共同的完整行数"""
+        path = self._file("records.jsonl")
+        lines = path.read_bytes().splitlines(keepends=True) if path.exists() else []
+        records = 0
+        for line in lines:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            records += 1
+        sizes = {name: (self._file(name).stat().st_size if self._file(name).exists() else 0, width)
+                 for name, width in _row_bytes(self.vector_dim, quantization).items()}
+        n = min([records] + [size // width for size, width in sizes.values()])
+        if n == len(lines) and all(size == n * width for size, width in sizes.values()):
+            return
+        logger.warning("Repairing %s after an interrupted write: %d records, %s -> %d rows",
+                       self.collection_name, len(lines),
+                       {name: size // width for name, (size, width) in sizes.items()}, n)
+        if n < len(lines):
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(b"".join(lines[:n]))
+            os.replace(tmp, path)
+        for name, (size, width) in sizes.items():
+            if size > n * width:
+                os.truncate(self._file(name), n * width)
+
+    def _records(self) -> List[dict]:
+        path = self._file("records.jsonl")
+        if not path.exists():
+            return []
+        with path.open("r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _matrix(self, name: str, dtype, width: int, count: int) -> np.ndarray:
+        path = self._file(name)
+        if count == 0 or not path.exists():
+            return np.zeros((0, width), dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count, width))
+
+    def _state(self) -> dict:
+        """当前的 id、payload 与各矩阵（memmap），写入后失效重建"""
+        with self._lock:
+            if self._cache is None:
+                records = self._records()
+                n = len(records)
+                state = {
+                    "ids": [r["id"] for r in records],
+                    "payloads": [r["payload"] for r in records],
+                    "rows": {point_id(r["id"]): i for i, r in enumerate(records)},
+                    "vectors": self._matrix("vectors.f32", np.float32, self.vector_dim, n),
+                }
+                if self.quantization == "int8":
+                    state["codes"] = self._matrix("codes.i8", np.int8, self.vector_dim, n)
+                    state["scales"] = (np.fromfile(self._file("scales.f32"), dtype=np.float32)
+                                       if n else np.zeros(0, np.float32))
+                elif self.quantization == "binary":
+                    state["codes"] = self._matrix("codes.bin", np.uint8, (self.vector_dim + 7) // 8, n)
+                self._cache = state
+            return self._cache
+
+    def _read_all(self) -> Tuple[List[str], List[Any], np.ndarray]:
+        state = self._state()
+        return list(state["ids"]), list(state["payloads"]), np.array(state["vectors"])
+
+    def _code_files(self, vectors: np.ndarray, quantization: str) -> Dict[str, bytes]:
+        if quantization == "int8":
+            codes, scales = quantize_int8(vectors)
+            return {"codes.i8": codes.tobytes(), "scales.f32": scales.tobytes()}
+        if quantization == "binary":
+            return {"codes.bin": quantize_binary(vectors).tobytes()}
+        return {}
+
+    def _rewrite(self, ids: List[str], payloads: List[Any], vectors: np.ndarray,
+                 quantization: Optional[str] = None) -> None:
+        """整体重写（删除、量化方式变化时），先写临时文件再替换"""
+        quantization = quantization or self.quantization
+        with self._lock:
+            self._cache = None
+            tmp, old = self._swap_dirs()
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir(parents=True)
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.vector_dim)
+            (tmp / "vectors.f32").write_bytes(vectors.tobytes())
+            for name, data in self._code_files(vectors, quantization).items():
+                (tmp / name).write_bytes(data)
+            with (tmp / "records.jsonl").open("w", encoding="utf-8") as f:
+                for i, p in zip(ids, payloads):
+                    f.write(json.dumps({"id": i, "payload": p}, ensure_ascii=False) + "\n")
+            (tmp / "meta.json").write_text(
+                json.dumps({"dim": self.vector_dim, "quantization": quantization}), encoding="utf-8"
+            )
+            # 先移开原目录再换入，任一时刻磁盘上都有一份完整的 collection
+            shutil.rmtree(old, ignore_errors=True)
+            if self.dir.exists():
+                os.replace(self.dir, old)
+            os.replace(tmp, self.dir)
+            shutil.rmtree(old, ignore_errors=True)
+
+    # ------------------------------------------------------------ BaseVectorStorage
+
+    def add(self, records: List[VectorRecord], **kwargs: Any) -> None:
+        """写入记录：新 id 追加到末尾，已有 id 覆盖原行"""
+        if not records:
+            return
+        with self._lock:
+            state = self._state()
+            rows = state["rows"]
+            vectors = _normalize(np.asarray([r.vector for r in records], dtype=np.float32))
+            if vectors.shape[1] != self.vector_dim:
+                raise ValueError(f"Expected dim {self.vector_dim}, got {vectors.shape[1]}")
+
+            latest: Dict[str, int] = {}
+            for k, r in enumerate(records):
+                latest[point_id(r.id)] = k  # 同一批内重复的 id 以最后一条为准
+            updates = [(rows[pid], k) for pid, k in latest.items() if pid in rows]
+            appends = [k for pid, k in latest.items() if pid not in rows]
+
+            if updates:
+                ids, payloads, matrix = self._read_all()
+                for row, k in updates:
+                    ids[row], payloads[row], matrix[row] = records[k].id, records[k].payload, vectors[k]
+                ids += [records[k].id for k in appends]
+                payloads += [records[k].payload for k in appends]
+                matrix = np.concatenate([matrix, vectors[appends]]) if appends else matrix
+                self._rewrite(ids, payloads, matrix)
+                return
+
+            new = vectors[appends]
+            self._cache = None
+            # records.jsonl 最后写入：记录行数决定有效的向量行数，中断时由 _repair 截掉多出的行
+            with self._file("vectors.f32").open("ab") as f:
+                f.write(np.ascontiguousarray(new).tobytes())
+            for name, data in self._code_files(new, self.quantization).items():
+                with self._file(name).open("ab") as f:
+                    f.write(data)
+            with self._file("records.jsonl").open("a", encoding="utf-8") as f:
+                for k in appends:
+                    f.write(json.dumps({"id": records[k].id, "payload": records[k].payload},
+                                       ensure_ascii=False) + "\n")
+
+    def delete(self, ids: Optional[List[str]] = None, payload_filter: Optional[Dict[str, Any]] = None,
+               **kwargs: Any) -> None:
+        if not ids and not payload_filter:
+            raise ValueError("You must provide either `ids` or `payload_filter` to delete points.")
+        with self._lock:
+            drop = {point_id(i) for i in ids or []}
+            old_ids, payloads, matrix = self._read_all()
+
+            def matches(p: Any) -> bool:
+                return bool(payload_filter) and isinstance(p, dict) and all(
+                    p.get(k) == v for k, v in payload_filter.items()
+                )
+
+            keep = [i for i, (rid, p) in enumerate(zip(old_ids, payloads))
+                    if point_id(rid) not in drop and not matches(p)]
+            if len(keep) == len(old_ids):
+                return
+            self._rewrite([old_ids[i] for i in keep], [payloads[i] for i in keep], matrix[keep])
+
+    def status(self) -> VectorDBStatus:
+        return VectorDBStatus(vector_dim=self.vector_dim, vector_count=len(self._state()["ids"]))
+
+    def query(self, query: VectorDBQuery, **kwargs: Any) -> List[VectorDBQueryResult]:
+        state = self._state()
+        n = len(state["ids"])
+        if n == 0:
+            return []
+        q = _normalize(np.asarray(query.query_vector, dtype=np.float32))
+        k = min(query.top_k, n)
+        vectors = state["vectors"]
+
+        if self.quantization == "none":
+            scores = vectors @ q
+            idx = _top(scores, k)
+            sims = scores[idx]
+        else:
+            # 量化码粗排出 rescore * k 个候选，再用 float32 精确打分
+            m = min(n, k * self.rescore)
+            if self.quantization == "int8":
+                approx = (state["codes"] @ q) * state["scales"]
+            else:
+                q_bits = quantize_binary(q[None, :])[0]
+                approx = -_popcount(state["codes"] ^ q_bits).sum(axis=1).astype(np.float32)
+            cand = np.sort(_top(approx, m))
+            exact = vectors[cand] @ q
+            order = _top(exact, k)
+            idx, sims = cand[order], exact[order]
+
+        return [
+            VectorDBQueryResult.create(
+                similarity=float(s),
+                vector=vectors[i].tolist(),
+                id=state["ids"][i],
+                payload=state["payloads"][i],
+            )
+            for i, s in zip(idx, sims)
+        ]
+
+    def clear(self) -> None:
+        self._rewrite([], [], np.zeros((0, self.vector_dim), dtype=np.float32))
+
+    def load(self) -> None:
+        pass
+
+    @property
+    def client(self) -> "FlatVectorStorage":
+        return self
+
+    # ------------------------------------------------------------ 增量更新辅助
+
+    def payload_values(self, key: str) -> Iterator[Tuple[str, Any]]:
+        """逐条返回 (id, payload[key])，供 EmbeddingManager.sync 比对内容摘要"""
+        state = self._state()
+        for rid, p in zip(state["ids"], state["payloads"]):
+            yield rid, (p or {}).get(key)
+
+    def memory_bytes(self) -> int:
+        """查询时需要映射的文件大小（量化时粗排只读量化码）"""
+        names = ["vectors.f32", "codes.i8", "scales.f32", "codes.bin", "records.jsonl"]
+        return sum(self._file(n).stat().st_size for n in names if self._file(n).exists())
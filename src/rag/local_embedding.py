@@ -0,0 +1,201 @@
+# src/rag/local_embedding.py
+
+"""本地 CPU 向量模型，可替代 SiliconFlow 的向量接口，离线可用。
+
+支持三种运行方式（``runtime``，缺省按模型目录自动选择）：
+
+- ``onnx``：onnxruntime 推理导出的 ``model.onnx``；``quantize`` 为真时使用（或动态生成）int8 模型；
+- ``torch``：transformers 加载 HF 格式模型，``quantize`` 为真时对 Linear 层做动态 int8 量化；
+- ``static``：model2vec 格式的静态词向量（``model.safetensors`` 中的 ``embeddings`` 表），只需 numpy。
+
+文本按长度排序后分批推理以减少 padding，多个批次由线程池并行执行。
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_quantized.onnx"
+WEIGHTS_FILE = "model.safetensors"
+
+
+def resolve_runtime(model_path: Path, runtime: str = "auto") -> str:
+    """auto：有 ONNX 模型且装了 onnxruntime 时用 onnx，model2vec 格式用 static，否则用 torch"""
+    if runtime != "auto":
+        return runtime
+    if (model_path / ONNX_FILE).exists():
+        try:
+            import onnxruntime  # noqa: F401
+            return "onnx"
+        except ImportError:
+            pass
+    weights = model_path / WEIGHTS_FILE
+    if weights.exists():
+        from safetensors import safe_open
+
+        with safe_open(str(weights), framework="numpy") as f:
+            if "embeddings" in f.keys():
+                return "static"
+    return "torch"
+
+
+def pool_hidden(hidden: np.ndarray, mask: np.ndarray, pooling: str) -> np.ndarray:
+    """(batch, seq, dim) 的隐藏状态池化为 (batch, dim)：cls 取首个 token，mean 按 mask 平均"""
+    if pooling == "cls":
+        return hidden[:, 0]
+    mask = mask[..., None].astype(hidden.dtype)
+    return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+class LocalEmbedding:
+    """接口与 camel 的 embedding 相同（``embed_list`` / ``embed`` / ``get_output_dim``）"""
+
+    def __init__(
+        self,
+        model_path: str,
+        runtime: str = "auto",
+        quantize: bool = False,
+        batch_size: int = 16,
+        threads: int = 2,
+        max_length: int = 512,
+        pooling: str = "cls",
+        normalize: bool = True,
+    ) -> None:
+        from tokenizers import Tokenizer
+
+        self.model_path = Path(model_path)
+        self.runtime = resolve_runtime(self.model_path, runtime)
+        self.quantize = quantize
+        self.batch_size = max(1, batch_size)
+        self.threads = max(1, threads)
+        self.pooling = pooling
+        self.normalize = normalize
+        # 各批次并行执行时，每个批次内部的算子线程数
+        self.intra_threads = max(1, (os.cpu_count() or 1) // self.threads)
+
+        self.tokenizer = Tokenizer.from_file(str(self.model_path / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        loaders = {"static": self._load_static, "onnx": self._load_onnx, "torch": self._load_torch}
+        if self.runtime not in loaders:
+            raise ValueError(f"Unknown embedding runtime: {self.runtime}")
+        self._forward: Callable[[List[str]], np.ndarray] = loaders[self.runtime]()
+        self._pool = ThreadPoolExecutor(self.threads, thread_name_prefix="local-embed") if self.threads > 1 else None
+        self._dim: Optional[int] = None
+        suffix = ":int8" if quantize and self.runtime != "static" else ""
+        self.name = f"local:{self.model_path.name}:{self.runtime}{suffix}"
+        logger.info("Local embedding model loaded: %s", self.name)
+
+    # ------------------------------------------------------------ 各运行方式
+
+    def _encode(self, texts: List[str], special_tokens: bool = True):
+        """分词并补齐到批内最长，返回 (input_ids, attention_mask)"""
+        encodings = self.tokenizer.encode_batch(texts, add_special_tokens=special_tokens)
+        width = max((len(e.ids) for e in encodings), default=0) or 1
+        ids = np.zeros((len(texts), width), dtype=np.int64)
+        mask = np.zeros((len(texts), width), dtype=np.int64)
+        for row, e in enumerate(encodings):
+            ids[row, : len(e.ids)] = e.ids
+            mask[row, : len(e.ids)] = 1
+        return ids, mask
+
+    def _load_static(self):
+        from safetensors.numpy import load_file
+
+        table = load_file(str(self.model_path / WEIGHTS_FILE))["embeddings"].astype(np.float32)
+
+        def forward(texts: List[str]) -> np.ndarray:
+            # 静态词向量不使用 [CLS]/[SEP]，按 token 平均
+            ids, mask = self._encode(texts, special_tokens=False)
+            return pool_hidden(table[ids], mask, "mean")
+
+        return forward
+
+    def _load_onnx(self):
+        import onnxruntime as ort
+
+        path = self.model_path / ONNX_FILE
+        if self.quantize:
+            quantized = self.model_path / ONNX_INT8_FILE
+            if not quantized.exists():
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                quantize_dynamic(str(path), str(quantized), weight_type=QuantType.QInt8)
+            path = quantized
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_threads
+        session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        input_names = {i.name for i in session.get_inputs()}
+
+        def forward(texts: List[str]) -> np.ndarray:
+            ids, mask = self._encode(texts)
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in input_names:
+                feeds["token_type_ids"] = np.zeros_like(ids)
+            hidden = session.run(None, {k: v for k, v in feeds.items() if k in input_names})[0]
+            return pool_hidden(hidden, mask, self.pooling)
+
+        return forward
+
+    def _load_torch(self):
+        import torch
+        from transformers import AutoModel
+
+        torch.set_num_threads(self.intra_threads)
+        model = AutoModel.from_pretrained(str(self.model_path)).eval()
+        if self.quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        def forward(texts: List[str]) -> np.ndarray:
+            ids, mask = self._encode(texts)
+            with torch.inference_mode():
+                out = model(input_ids=torch.from_numpy(ids), attention_mask=torch.from_numpy(mask))
+            return pool_hidden(out.last_hidden_state.float().numpy(), mask, self.pooling)
+
+        return forward
+
+    # ------------------------------------------------------------ 对外接口
+
+    def _run_batch(self, texts: List[str]) -> np.ndarray:
+        vecs = self._forward(texts).astype(np.float32)
+        if self.normalize:
+            vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        return vecs
+
+    def embed_list(self, objs: List[str], **kwargs) -> List[List[float]]:
+        if not objs:
+            return []
+        # 按长度排序后切批，同一批内 padding 最少；结果按原顺序返回
+        order = sorted(range(len(objs)), key=lambda i: len(objs[i]))
+        batches = [order[i : i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        texts = [[objs[i] for i in b] for b in batches]
+        outputs = self._pool.map(self._run_batch, texts) if self._pool else map(self._run_batch, texts)
+        result: List[Optional[List[float]]] = [None] * len(objs)
+        for batch, vecs in zip(batches, outputs):
+            for i, vec in zip(batch, vecs):
+                result[i] = vec.tolist()
+        return result
+
+    def embed(self, obj: str, **kwargs) -> List[float]:
+        return self.embed_list([obj])[0]
+
+    def get_output_dim(self) -> int:
+        if self._dim is None:
+            self._dim = len(self.embed("dim"))
+        return self._dim
+
+
+@lru_cache(maxsize=None)
+def get_local_embedding(model_path: str, runtime: str = "auto", quantize: bool = False,
+                        batch_size: int = 16, threads: int = 2, max_length: int = 512,
+                        pooling: str = "cls", normalize: bool = True) -> LocalEmbedding:
+    """按配置共享模型实例，每个文件的 EmbeddingManager 不重复加载"""
+    return LocalEmbedding(model_path, runtime, quantize, batch_size, threads, max_length, pooling, normalize)
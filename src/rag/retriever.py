@@ -3,9 +3,7 @@
 from dataclasses import dataclass
 from typing import List, Dict, Any, Tuple
 
-from qdrant_client import QdrantClient, models
-from camel.retrievers.vector_retriever import VectorRetriever
-from src.rag.embedding import EmbeddingManager
+from src.rag.embedding import EmbeddingManager, QueryEmbedding
 from src.datamodel import ParagraphChunk
 
 @dataclass
@@ -17,10 +15,12 @@ class RetrievedDoc:
 
 class RetrieverManager:
     def __init__(self, embedding_mgr: EmbeddingManager, config: dict):
+        from camel.retrievers.vector_retriever import VectorRetriever
+
         self.emb_mgr = embedding_mgr
         self.store = self.emb_mgr.storage
         self.retriever = VectorRetriever(
-            embedding_model=self.emb_mgr.embedder,
+            embedding_model=QueryEmbedding(self.emb_mgr),
             storage=self.store
         )
         self.top_k = config.get("top_k", 5)
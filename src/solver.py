@@ -1,51 +1,68 @@
 import json
+from functools import lru_cache
 from pathlib import Path
 from textwrap import dedent
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, TYPE_CHECKING
 import re
 import yaml
 
-from camel.agents import ChatAgent
-from camel.models import ModelFactory
-from camel.messages import BaseMessage
-from camel.types import ModelPlatformType, RoleType
-
 from src.utils.logger import get_logger
+from src.utils.http import use_shared_client
+from src.utils.rate_limit import Priority, get_limiter
+from src.utils.tokens import count_tokens
 
 from src.datamodel import ParagraphChunk
-from src.rag.retriever import RetrieverManager
+
+if TYPE_CHECKING:
+    from src.rag.retriever import RetrieverManager
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 with open(BASE_DIR / "config" / "agent_config.yaml", "r", encoding="utf-8") as f:
     cfg = yaml.safe_load(f)["GENERATE_MODEL"]
 
-platform = cfg.get("model_platform", "SILICONFLOW")
-try:
-    _model = ModelFactory.create(
-        model_platform=ModelPlatformType[platform],
-        model_type=cfg.get("model_type", "Pro/deepseek-ai/DeepSeek-R1"),
-        model_config_dict=cfg.get("model_config", None),
-    )
-except Exception:
-    _model = ModelFactory.create(
-        model_platform=ModelPlatformType.DEFAULT,
-        model_type="stub",
-    )
-
-_system_msg = BaseMessage.make_assistant_message(
-    role_name="math_solver",
-    content=dedent(
-        """
-        你是一个数学题解助手。用户的问题前会附带与主题相关的词条（定理、命题、定义等）。
-        请充分利用这些词条完成证明和解答，引用时使用格式 [REF:{chunk_id}]，其中 chunk_id 已在题目中给出。
-
-        有如下要求：
-        1. 输出使用 markdown 可直接渲染解析的格式，LaTeX 公式要放在 $$ 中。
-        2. 仅可引用用户提供的词条，不要编造文档库中不存在的引用。
-        3. [REF] 不可放在 LaTeX 公式的 $$ 内部。
-        """
-    ),
+
+@lru_cache(maxsize=None)
+def get_model():
+    """解题用的 LLM 客户端，首次调用时创建；配置无效时退回默认模型"""
+    from camel.models import ModelFactory
+    from camel.types import ModelPlatformType
+
+    platform = cfg.get("model_platform", "SILICONFLOW")
+    try:
+        model = ModelFactory.create(
+            model_platform=ModelPlatformType[platform],
+            model_type=cfg.get("model_type", "Pro/deepseek-ai/DeepSeek-R1"),
+            model_config_dict=cfg.get("model_config", None),
+        )
+    except Exception:
+        model = ModelFactory.create(
+            model_platform=ModelPlatformType.DEFAULT,
+            model_type="stub",
+        )
+    use_shared_client(model)
+    return model
+
+
+def _limiter(model):
+    """解题请求与入库、建图共用服务商限流器，以交互优先级排队"""
+    return get_limiter(cfg.get("model_platform", "SILICONFLOW"), str(model.model_type))
+
+
+def _prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(m["content"]) for m in messages)
+
+
+SYSTEM_PROMPT = dedent(
+    """
+    你是一个数学题解助手。用户的问题前会附带与主题相关的词条（定理、命题、定义等）。
+    请充分利用这些词条完成证明和解答，引用时使用格式 [REF:{chunk_id}]，其中 chunk_id 已在题目中给出。
+
+    有如下要求：
+    1. 输出使用 markdown 可直接渲染解析的格式，LaTeX 公式要放在 $$ 中。
+    2. 仅可引用用户提供的词条，不要编造文档库中不存在的引用。
+    3. [REF] 不可放在 LaTeX 公式的 $$ 内部。
+    """
 )
 
 logger = get_logger(__name__)
@@ -56,26 +73,17 @@ class ConversationMemory:
 
     def __init__(self, max_rounds: int = 3) -> None:
         self.max_rounds = max_rounds
-        self.history: List[BaseMessage] = []
+        self.history: List[Dict] = []
 
     def add(self, role: str, content: str) -> None:
-        if role == "user":
-            msg = BaseMessage.make_user_message("user", content)
-        else:
-            msg = BaseMessage.make_assistant_message("assistant", content)
-        self.history.append(msg)
+        role = "user" if role == "user" else "assistant"
+        self.history.append({"role": role, "content": content})
         limit = self.max_rounds * 2
         if len(self.history) > limit:
             self.history = self.history[-limit:]
 
     def to_messages(self) -> List[Dict]:
-        msgs: List[Dict] = []
-        for m in self.history:
-            if m.role_type == RoleType.USER:
-                msgs.append(m.to_openai_user_message())
-            else:
-                msgs.append(m.to_openai_assistant_message())
-        return msgs
+        return [dict(m) for m in self.history]
 
     def clear(self) -> None:
         self.history.clear()
@@ -84,7 +92,7 @@ class ConversationMemory:
 class MathSolver:
     def __init__(
         self,
-        retriever: Optional[RetrieverManager],
+        retriever: Optional["RetrieverManager"],
         docs: List[ParagraphChunk],
         memory: Optional[ConversationMemory] = None,
     ) -> None:
@@ -93,11 +101,6 @@ class MathSolver:
         self.docs_dict = {}
         for doc in self.docs:
             self.docs_dict[doc.id] = doc
-        self.agent = ChatAgent(
-            system_message=_system_msg,
-            model=_model,
-            output_language="中文",
-        )
         self.memory = memory or ConversationMemory()
         logger.info("MathSolver initialized with %d docs", len(self.docs))
 
@@ -154,15 +157,20 @@ class MathSolver:
                 context_parts
             )
 
-        messages = [_system_msg.to_openai_assistant_message()]
+        messages = [{"role": "assistant", "content": SYSTEM_PROMPT}]
         messages.extend(self.memory.to_messages())
         messages.append({"role": "user", "content": prompt})
 
-        req_cfg = _model.model_config_dict.copy()
+        model = get_model()
+        req_cfg = model.model_config_dict.copy()
         req_cfg.pop("stream", None)
 
-        rsp = _model._client.chat.completions.create(
-            messages=messages, model=_model.model_type, **req_cfg
+        rsp = _limiter(model).call(
+            lambda: model._client.chat.completions.create(
+                messages=messages, model=model.model_type, **req_cfg
+            ),
+            tokens=_prompt_tokens(messages),
+            priority=Priority.INTERACTIVE,
         )
         answer = self._validate_refs(rsp.choices[0].message.content)
         self.memory.add("user", question)
@@ -190,23 +198,25 @@ class MathSolver:
                 context_parts
             )
 
-        messages = [_system_msg.to_openai_assistant_message()]
+        messages = [{"role": "assistant", "content": SYSTEM_PROMPT}]
         messages.extend(self.memory.to_messages())
         messages.append({"role": "user", "content": prompt})
 
-        req_cfg = _model.model_config_dict.copy()
+        model = get_model()
+        req_cfg = model.model_config_dict.copy()
         req_cfg["stream"] = True
 
-        stream = _model._client.chat.completions.create(
-            messages=messages, model=_model.model_type, **req_cfg
-        )
-
         acc = ""
-        for chunk in stream:
-            delta = chunk.choices[0].delta.content
-            if delta:
-                acc += delta
-                yield delta
+        # 流式输出期间一直占用名额
+        with _limiter(model).slot(_prompt_tokens(messages), Priority.INTERACTIVE):
+            stream = model._client.chat.completions.create(
+                messages=messages, model=model.model_type, **req_cfg
+            )
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    acc += delta
+                    yield delta
 
         final = self._validate_refs(acc)
         if final != acc:
@@ -0,0 +1,15 @@
+# src/utils/config.py
+
+from functools import lru_cache
+from pathlib import Path
+
+import yaml
+
+CONFIG_DIR = Path(__file__).resolve().parent.parent.parent / "config"
+
+
+@lru_cache(maxsize=None)
+def load_config(name: str) -> dict:
+    """读取 config/<name>.yaml（进程内缓存，返回值请勿修改）"""
+    with open(CONFIG_DIR / f"{name}.yaml", "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
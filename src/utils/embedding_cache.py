@@ -0,0 +1,161 @@
+# src/utils/embedding_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.utils.config import load_config
+from src.utils.llm_cache import normalize
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 每写入多少条检查一次容量
+EVICT_EVERY = 256
+# SQLite 单条语句的参数个数上限以内分批查询
+QUERY_BATCH = 500
+
+
+class EmbeddingCache:
+    """跨文件共享的向量缓存（SQLite），键为 (模型名, 规范化文本) 的哈希，向量以 float32 存储。
+
+    同一段文本在不同文件、不同版本的教材中反复出现时只需计算一次；
+    总大小超过 ``max_bytes`` 时按最近最少使用淘汰。``enabled`` 为假时完全不读写。
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike = "data/embedding_cache.sqlite",
+        max_bytes: Optional[int] = None,
+        enabled: bool = True,
+    ) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors ("
+                " key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS vectors_accessed ON vectors(accessed)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        raw = model + "\x00" + normalize(text)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """批量查询，返回命中的 {key: 向量}"""
+        if not self.enabled or not keys:
+            return {}
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            for i in range(0, len(unique), QUERY_BATCH):
+                part = unique[i : i + QUERY_BATCH]
+                marks = ",".join("?" * len(part))
+                for k, blob in db.execute(f"SELECT key, vector FROM vectors WHERE key IN ({marks})", part):
+                    found[k] = array("f", blob).tolist()
+                db.execute(f"UPDATE vectors SET accessed = ? WHERE key IN ({marks})", [now, *part])
+            db.commit()
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, List[float]]]) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        rows = []
+        for k, vec in items:
+            blob = array("f", vec).tobytes()
+            rows.append((k, blob, len(blob), now))
+        if not rows:
+            return
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "INSERT OR REPLACE INTO vectors (key, vector, size, accessed) VALUES (?, ?, ?, ?)", rows
+            )
+            db.commit()
+            before = self.writes
+            self.writes += len(rows)
+            if self.writes // EVICT_EVERY != before // EVICT_EVERY:
+                self._evict()
+
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+        db = self._db()
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM vectors").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 淘汰到容量的 90%，避免每次写入都触发
+        excess = total - int(self.max_bytes * 0.9)
+        victims = []
+        for k, size in db.execute("SELECT key, size FROM vectors ORDER BY accessed"):
+            if excess <= 0:
+                break
+            victims.append((k,))
+            excess -= size
+        db.executemany("DELETE FROM vectors WHERE key = ?", victims)
+        db.commit()
+        self.evictions += len(victims)
+
+    def clear(self) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM vectors")
+            db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = 0, 0
+            if self.enabled:
+                entries, size = self._db().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM vectors"
+                ).fetchone()
+            return {
+                "enabled": self.enabled,
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache() -> EmbeddingCache:
+    """进程内共享的缓存实例（rag_config.yaml 的 embedding_cache 配置）"""
+    cfg = load_config("rag_config").get("embedding_cache", {})
+    max_mb = cfg.get("max_mb")
+    return EmbeddingCache(
+        path=cfg.get("path", "data/embedding_cache.sqlite"),
+        max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+        enabled=cfg.get("enabled", True),
+    )
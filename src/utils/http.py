@@ -0,0 +1,117 @@
+# src/utils/http.py
+
+"""进程级共享的 HTTP 客户端。
+
+MinerU、LLM、Embedding 等所有外部请求共用同一个连接池：保持 keep-alive、统一超时，
+并按目标主机限制并发请求数。配置见 rag_config.yaml 的 ``http`` 段。
+"""
+
+import threading
+from typing import Dict, Optional
+
+import httpx
+
+from src.utils.config import load_config
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """响应体读取完毕或关闭时释放主机并发名额"""
+
+    def __init__(self, stream: httpx.SyncByteStream, sem: threading.BoundedSemaphore) -> None:
+        self._stream = stream
+        self._sem = sem
+        self._released = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._sem.release()
+
+
+class HostLimitedTransport(httpx.HTTPTransport):
+    """在连接池之上按主机限制同时进行中的请求数"""
+
+    def __init__(self, default_limit: int, host_limits: Optional[Dict[str, int]] = None,
+                 **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.default_limit = default_limit
+        self.host_limits = host_limits or {}
+        self._sems: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _sem_for(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._sems.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.host_limits.get(host, self.default_limit))
+                self._sems[host] = sem
+            return sem
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        sem = self._sem_for(request.url.host)
+        # 与等待连接池一样受 pool 超时约束，主机名额被长时间占满时抛出可重试的 PoolTimeout
+        timeout = request.extensions.get("timeout", {}).get("pool")
+        if not sem.acquire(timeout=timeout):
+            raise httpx.PoolTimeout(f"No free request slot for {request.url.host}", request=request)
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            sem.release()
+            raise
+        response.stream = _ReleasingStream(response.stream, sem)
+        return response
+
+
+def default_timeout() -> httpx.Timeout:
+    cfg = load_config("rag_config").get("http", {})
+    return httpx.Timeout(cfg.get("read_timeout", 180), connect=cfg.get("connect_timeout", 10))
+
+
+def _build_client() -> httpx.Client:
+    cfg = load_config("rag_config").get("http", {})
+    limits = httpx.Limits(
+        max_connections=cfg.get("max_connections", 100),
+        max_keepalive_connections=cfg.get("max_keepalive_connections", 20),
+        keepalive_expiry=cfg.get("keepalive_expiry", 60),
+    )
+    transport = HostLimitedTransport(
+        default_limit=cfg.get("per_host_limit", 16),
+        host_limits=cfg.get("host_limits"),
+        limits=limits,
+    )
+    logger.info("Shared HTTP client created (max_connections=%d)", limits.max_connections)
+    return httpx.Client(transport=transport, timeout=default_timeout())
+
+
+def get_http_client() -> httpx.Client:
+    """返回进程内共享的 httpx.Client（首次调用时创建）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+def use_shared_client(holder) -> None:
+    """将持有 OpenAI SDK 客户端（``_client`` 属性）的对象切换到共享连接池。
+
+    适用于 camel 的模型后端与 OpenAICompatibleEmbedding。SDK 自带的重试关闭，
+    429 与可重试错误统一由 src.utils.rate_limit 处理，限流器才能感知服务端的限速。
+    """
+    client = getattr(holder, "_client", None)
+    if client is None or not hasattr(client, "copy"):
+        return
+    holder._client = client.copy(http_client=get_http_client(), timeout=default_timeout(), max_retries=0)
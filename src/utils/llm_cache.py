@@ -0,0 +1,175 @@
+# src/utils/llm_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional
+
+from src.utils.config import load_config
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 每写入多少条检查一次过期与容量
+EVICT_EVERY = 64
+
+
+def normalize(value: Any) -> str:
+    """输入规范化：字典按键排序，字符串压缩空白，使等价输入得到相同的键"""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def prompt_version(*parts: Any) -> str:
+    """由系统提示词、响应 schema、模型参数等计算版本号，任何一项变化都会使旧缓存失效"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class LLMCache:
+    """磁盘上的 LLM 响应缓存（SQLite），键为 (命名空间, 模型, 提示词版本, 规范化输入) 的哈希。
+
+    ``ttl`` 秒后条目过期；总大小超过 ``max_bytes`` 时按最近最少使用淘汰。
+    ``bypass`` 为真时不读缓存、仍写入新结果（用于强制刷新）；``enabled`` 为假时完全不读写。
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike = "data/llm_cache.sqlite",
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        bypass: bool = False,
+        enabled: bool = True,
+    ) -> None:
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(namespace: str, model: str, version: str, payload: Any) -> str:
+        raw = "\x00".join([namespace, model, version, normalize(payload)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled or self.bypass:
+            return None
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                db.commit()
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data.encode("utf-8")), now, now),
+            )
+            db.commit()
+            self.writes += 1
+            if self.writes % EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        db = self._db()
+        if self.ttl is not None:
+            cur = db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self.evictions += cur.rowcount
+        if self.max_bytes is not None:
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # 淘汰到容量的 90%，避免每次写入都触发
+                excess = total - int(self.max_bytes * 0.9)
+                victims = []
+                for k, size in db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    if excess <= 0:
+                        break
+                    victims.append((k,))
+                    excess -= size
+                db.executemany("DELETE FROM responses WHERE key = ?", victims)
+                self.evictions += len(victims)
+        db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM responses")
+            db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = 0, 0
+            if self.enabled:
+                entries, size = self._db().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+            return {
+                "enabled": self.enabled,
+                "bypass": self.bypass,
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+@lru_cache(maxsize=None)
+def get_llm_cache() -> LLMCache:
+    """进程内共享的缓存实例（rag_config.yaml 的 llm_cache 配置；环境变量 LLM_CACHE_BYPASS=1 强制刷新）"""
+    cfg = load_config("rag_config").get("llm_cache", {})
+    ttl_days = cfg.get("ttl_days")
+    max_mb = cfg.get("max_mb")
+    return LLMCache(
+        path=cfg.get("path", "data/llm_cache.sqlite"),
+        ttl=ttl_days * 86400 if ttl_days else None,
+        max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+        bypass=cfg.get("bypass", False) or os.environ.get("LLM_CACHE_BYPASS") == "1",
+        enabled=cfg.get("enabled", True),
+    )
@@ -0,0 +1,325 @@
+# src/utils/rate_limit.py
+
+"""按服务商与模型共享的请求限流器。
+
+过滤、关系构建、解答与向量化对同一 (服务商, 模型) 的请求共用一个 ``ProviderLimiter``：
+
+- 令牌桶分别限制每分钟请求数（rpm）与 token 数（tpm）；
+- 并发上限按 AIMD 自适应：收到 429 时减半并按 Retry-After 暂停发送，延迟超过目标时小幅下调，
+  正常响应时逐步恢复到配置上限；
+- 等待者按优先级排队，交互式解答总是先于入库与建图，并为其预留并发名额。
+
+解答与过滤、建图往往使用同一服务商的不同模型，各模型的限流器互不相干；因此同一服务商的所有
+限流器之后还要经过一个服务商级的闸门（``gate``，只限并发、同样按优先级排队并为交互请求预留名额），
+批量入库占满服务商连接时解答仍然优先。
+
+配置见 rag_config.yaml 的 ``rate_limit`` 段。
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from src.utils.config import load_config
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 429 未给出 Retry-After 时的暂停时长（秒）
+DEFAULT_PAUSE = 2.0
+# 非 429 的可重试错误（5xx、连接失败）的退避上限（秒）
+MAX_BACKOFF = 30.0
+
+
+class Priority(IntEnum):
+    """数值越小越优先"""
+
+    INTERACTIVE = 0  # 用户在线等待的解答、检索
+    INGEST = 1  # 文件入库：过滤、向量化
+    BACKGROUND = 2  # 建图等后台任务
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """异常对应的 HTTP 状态码（OpenAI SDK 与 httpx 的异常均适用）"""
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """响应头中的 Retry-After（秒），没有或无法解析时返回 None"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    return status_code(exc) == 429
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """429、5xx 与连接层错误可重试；其余（如 400、401）直接抛出"""
+    code = status_code(exc)
+    if code is not None:
+        return code == 429 or code >= 500
+    try:
+        from openai import APIConnectionError  # APITimeoutError 是其子类
+    except ImportError:
+        APIConnectionError = ()
+    return isinstance(exc, (httpx.TransportError, ConnectionError, TimeoutError, APIConnectionError))
+
+
+class TokenBucket:
+    """按分钟配额匀速补充的令牌桶；``per_minute`` 为空表示不限"""
+
+    def __init__(self, per_minute: Optional[float]) -> None:
+        self.capacity = float(per_minute) if per_minute else None
+        self.level = self.capacity or 0.0
+        self._stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity is None:
+            return
+        self.level = min(self.capacity, self.level + (now - self._stamp) * self.capacity / 60)
+        self._stamp = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """取出 ``amount`` 个令牌还需等待的秒数（超过容量的请求只需等到桶满）"""
+        if self.capacity is None:
+            return 0.0
+        self._refill(now)
+        need = min(amount, self.capacity) - self.level
+        return max(0.0, need * 60 / self.capacity)
+
+    def take(self, amount: float) -> None:
+        if self.capacity is not None:
+            self.level -= amount
+
+    def adjust(self, delta: float) -> None:
+        """按实际用量修正（可为负数，欠下的额度由后续请求等待补足）"""
+        self.take(delta)
+
+
+@dataclass
+class Permit:
+    """一次获准的请求；``used_tokens`` 由调用方填入实际用量，用于修正 tpm 预估"""
+
+    tokens: int
+    priority: Priority
+    used_tokens: Optional[int] = None
+    gate_permit: Optional["Permit"] = None
+
+
+class ProviderLimiter:
+    def __init__(
+        self,
+        name: str,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        interactive_reserve: int = 1,
+        latency_target: Optional[float] = None,
+        max_tries: int = 5,
+        gate: Optional["ProviderLimiter"] = None,
+    ) -> None:
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.interactive_reserve = max(0, interactive_reserve)
+        self.latency_target = latency_target
+        self.max_tries = max(1, max_tries)
+        self.gate = gate
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.throttled = 0
+        self.completed = 0
+        self._paused_until = 0.0
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _capacity(self, priority: Priority) -> int:
+        limit = max(self.min_concurrency, int(self.limit))
+        if priority > Priority.INTERACTIVE:
+            # 给交互请求预留名额，但至少留一个给其余请求，避免饿死
+            limit = max(1, limit - self.interactive_reserve)
+        return limit
+
+    def _delay(self, entry: tuple, tokens: int, now: float) -> Optional[float]:
+        """轮到 ``entry`` 发送还需等待的秒数；None 表示等待其他请求完成或更高优先级的请求先走"""
+        if self._waiters[0] != entry:
+            return None
+        if self.in_flight >= self._capacity(Priority(entry[0])):
+            return None
+        if now < self._paused_until:
+            return self._paused_until - now
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def acquire(self, tokens: int = 0, priority: Priority = Priority.INGEST) -> Permit:
+        """阻塞直到按优先级轮到本请求，且并发与 rpm/tpm 配额允许；有 ``gate`` 时随后在闸门处排队"""
+        entry = (int(priority), next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    delay = self._delay(entry, tokens, time.monotonic())
+                    if delay == 0:
+                        break
+                    self._cond.wait(timeout=delay)
+            except BaseException:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self._cond.notify_all()
+        permit = Permit(tokens, priority)
+        if self.gate is not None:
+            try:
+                permit.gate_permit = self.gate.acquire(priority=priority)
+            except BaseException:
+                self.release(permit)
+                raise
+        return permit
+
+    def release(self, permit: Permit, latency: Optional[float] = None,
+                error: Optional[BaseException] = None) -> None:
+        """归还名额并据结果调整并发上限：429 减半并暂停，超时延迟小幅下调，正常响应加性恢复"""
+        if permit.gate_permit is not None:
+            # 闸门只限并发，不随单个模型的 429 与延迟调整
+            self.gate.release(permit.gate_permit)
+            permit.gate_permit = None
+        with self._cond:
+            self.in_flight -= 1
+            if permit.used_tokens is not None:
+                self.tokens.adjust(permit.used_tokens - permit.tokens)
+            if error is not None and is_rate_limited(error):
+                self.throttled += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                pause = retry_after(error)
+                pause = DEFAULT_PAUSE if pause is None else pause
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                logger.warning("%s rate limited, concurrency -> %d, pausing %.1fs",
+                               self.name, int(self.limit), pause)
+            elif error is None and latency is not None:
+                self.completed += 1
+                if self.latency_target and latency > self.latency_target:
+                    self.limit = max(self.min_concurrency, self.limit * 0.9)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, tokens: int = 0, priority: Priority = Priority.INGEST):
+        """占用一个请求名额，退出时按耗时与异常反馈给限流器"""
+        permit = self.acquire(tokens, priority)
+        start = time.monotonic()
+        try:
+            yield permit
+        except BaseException as e:
+            self.release(permit, error=e)
+            raise
+        self.release(permit, latency=time.monotonic() - start)
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0,
+             priority: Priority = Priority.INGEST) -> Any:
+        """在限流下调用 ``fn``，429、5xx 与连接错误最多重试 ``max_tries`` 次。
+
+        429 的等待由限流器统一处理（暂停期间同一服务商的所有请求都不发送）；
+        其余可重试错误在名额之外做指数退避。响应带 ``usage.total_tokens`` 时用于修正 tpm。
+        """
+        for attempt in range(1, self.max_tries + 1):
+            try:
+                with self.slot(tokens, priority) as permit:
+                    rsp = fn()
+                    permit.used_tokens = getattr(getattr(rsp, "usage", None), "total_tokens", None)
+                    return rsp
+            except Exception as e:
+                if attempt >= self.max_tries or not is_retryable(e):
+                    raise
+                if not is_rate_limited(e):
+                    time.sleep(min(MAX_BACKOFF, 2 ** (attempt - 1)) * random.uniform(0.5, 1.0))
+                logger.info("%s request failed (%s), retry %d/%d", self.name, e, attempt, self.max_tries - 1)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "completed": self.completed,
+                "throttled": self.throttled,
+                "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            }
+
+
+def gate_config() -> dict:
+    """服务商级闸门的配置（rate_limit.gate）"""
+    return load_config("rag_config").get("rate_limit", {}).get("gate", {})
+
+
+def limiter_config(provider: str, model: str) -> dict:
+    """rate_limit.default < rate_limit.providers[provider] < rate_limit.models[model]"""
+    cfg = load_config("rag_config").get("rate_limit", {})
+    merged = dict(cfg.get("default", {}))
+    merged.update((cfg.get("providers") or {}).get(provider, {}))
+    merged.update((cfg.get("models") or {}).get(model, {}))
+    return merged
+
+
+_limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+_gates: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _gate(provider: str) -> Optional[ProviderLimiter]:
+    """服务商级闸门；rate_limit.gate.max_concurrency 为空时不设闸门。调用方需持有 ``_limiters_lock``"""
+    gate = _gates.get(provider)
+    if gate is None:
+        cfg = gate_config()
+        if not cfg.get("max_concurrency"):
+            return None
+        gate = _gates[provider] = ProviderLimiter(
+            f"{provider}/*",
+            max_concurrency=cfg["max_concurrency"],
+            interactive_reserve=cfg.get("interactive_reserve", 1),
+        )
+    return gate
+
+
+def get_limiter(provider: str, model: str) -> ProviderLimiter:
+    """进程内每个 (服务商, 模型) 共享一个限流器，同一服务商的限流器共用一个闸门"""
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = ProviderLimiter(
+                f"{provider}/{model}", gate=_gate(provider), **limiter_config(provider, model)
+            )
+        return limiter
+
+
+def limiter_stats() -> dict:
+    """已创建的全部限流器与闸门的状态"""
+    with _limiters_lock:
+        limiters = list(_limiters.values()) + list(_gates.values())
+    return {lim.name: lim.stats() for lim in limiters}
@@ -0,0 +1,30 @@
+# src/utils/tokens.py
+
+from functools import lru_cache
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 与过滤 LLM / 向量模型计费口径一致的分词方式
+ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    """tiktoken 分词器，首次调用时加载词表；离线无法获取词表时返回 None"""
+    import tiktoken
+    try:
+        return tiktoken.get_encoding(ENCODING)
+    except Exception as e:
+        logger.warning("Tokenizer %s unavailable, counting characters instead: %s", ENCODING, e)
+        return None
+
+
+@lru_cache(maxsize=65536)
+def count_tokens(text: str) -> int:
+    """文本的 token 数，按文本缓存；同一段落在切分、重试与打包时只编码一次"""
+    enc = get_encoding()
+    if enc is None:
+        return len(text)
+    return len(enc.encode(text, disallowed_special=()))
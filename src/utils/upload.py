@@ -0,0 +1,63 @@
+# src/utils/upload.py
+
+import os
+from tempfile import NamedTemporaryFile
+from typing import Optional
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+DEFAULT_CHUNK = 1024 * 1024  # 每次读写 1MB
+
+
+class UploadTooLarge(ValueError):
+    """上传文件超过大小限制。"""
+
+
+async def save_upload(
+    file: UploadFile,
+    suffix: str = "",
+    max_bytes: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK,
+) -> str:
+    """将上传文件分块写入临时文件并返回路径，内存占用与文件大小无关。
+
+    超过 ``max_bytes`` 时删除临时文件并抛出 UploadTooLarge。
+    """
+    total = 0
+    with NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        try:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if max_bytes is not None and total > max_bytes:
+                    raise UploadTooLarge(
+                        f"file exceeds {max_bytes} bytes"
+                    )
+                await run_in_threadpool(tmp.write, chunk)
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    return tmp.name
+
+
+async def read_upload(
+    file: UploadFile,
+    max_bytes: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK,
+) -> bytes:
+    """分块读取上传文件到内存，适用于图片等小文件；超过 ``max_bytes`` 时抛出 UploadTooLarge。"""
+    parts = []
+    total = 0
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if max_bytes is not None and total > max_bytes:
+            raise UploadTooLarge(f"file exceeds {max_bytes} bytes")
+        parts.append(chunk)
+    return b"".join(parts)
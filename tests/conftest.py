@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import pytest
+
+TINY_EMBEDDER = Path(__file__).parent / "data" / "tiny_embedder"
+
+
+@pytest.fixture(autouse=True)
+def isolated_llm_cache(tmp_path, monkeypatch):
+    """LLM 响应缓存写入测试的临时目录，不在仓库的 data/ 下留下文件"""
+    from src.utils import llm_cache
+
+    load_config = llm_cache.load_config
+
+    def load(name):
+        cfg = load_config(name)
+        if name != "rag_config":
+            return cfg
+        return {**cfg, "llm_cache": {**cfg.get("llm_cache", {}), "path": str(tmp_path / "llm_cache.sqlite")}}
+
+    monkeypatch.setattr(llm_cache, "load_config", load)
+    llm_cache.get_llm_cache.cache_clear()
+    yield llm_cache.get_llm_cache()
+    llm_cache.get_llm_cache.cache_clear()
+
+
+@pytest.fixture
+def local_embedding_cfg(tmp_path, monkeypatch):
+    """离线可用的 embedding 配置（本地 tiny_embedder），索引与向量缓存写入临时目录"""
+    from src.rag import embedding
+    from src.utils.embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(tmp_path / "embedding_cache.sqlite")
+    monkeypatch.setattr(embedding, "get_embedding_cache", lambda: cache)
+    return {
+        "backend": "local",
+        "model_name": "unused",
+        "local": {"model_path": str(TINY_EMBEDDER), "threads": 1, "index_path": str(tmp_path / "vs")},
+    }
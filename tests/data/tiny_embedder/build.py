@@ -0,0 +1,25 @@
+"""生成测试用的微型静态向量模型（model2vec 格式）：python tests/data/tiny_embedder/build.py
+
+词表为少量数学常用汉字与 ASCII 字符，向量随机生成（固定种子），只用于离线测试本地向量后端。
+"""
+
+from pathlib import Path
+
+import numpy as np
+from safetensors.numpy import save_file
+from tokenizers import Tokenizer, models, normalizers, pre_tokenizers
+
+HERE = Path(__file__).resolve().parent
+DIM = 16
+CHARS = "定理引命题义例练习证明设函数连续可导群环域矩阵向量空间线性映射的是在上为有则若且存一个"
+
+vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]"]
+vocab += list("abcdefghijklmnopqrstuvwxyz0123456789.,()=+-$") + list(dict.fromkeys(CHARS))
+tokenizer = Tokenizer(models.WordPiece({t: i for i, t in enumerate(vocab)}, unk_token="[UNK]"))
+tokenizer.normalizer = normalizers.BertNormalizer(lowercase=True)
+tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+tokenizer.save(str(HERE / "tokenizer.json"))
+
+table = np.random.default_rng(0).standard_normal((len(vocab), DIM)).astype(np.float32)
+table[0] = 0.0
+save_file({"embeddings": table}, str(HERE / "model.safetensors"))
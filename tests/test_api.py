@@ -63,3 +63,35 @@ def test_solve_sanitizes(monkeypatch):
     assert res.status_code == 200
     assert "暴力" not in captured["q"]
 
+
+
+def test_solve_does_not_block_event_loop(monkeypatch):
+    import threading
+
+    started, release, finished = threading.Event(), threading.Event(), threading.Event()
+
+    def slow_solve(self, q):
+        started.set()
+        release.wait(5)  # 模拟在限流器中等待配额
+        finished.set()
+        return "late"
+
+    monkeypatch.setattr("api_server.MathSolver.solve", slow_solve)
+    with TestClient(app) as shared:  # 所有请求共用同一个事件循环
+        result = {}
+        t = threading.Thread(target=lambda: result.update(
+            shared.post("/solve", json={"file_id": FILE_ID, "question": "q"}).json()))
+        t.start()
+        assert started.wait(5)
+        assert shared.get("/health").status_code == 200
+        assert not finished.is_set()  # 解答仍在等待时其他请求照常响应
+        release.set()
+        t.join(5)
+    assert result["answer"] == "late"
+
+
+def test_solve_stream(monkeypatch):
+    monkeypatch.setattr("api_server.MathSolver.stream_solve", lambda self, q: iter(["答", "案"]))
+    res = client.post("/solve_stream", json={"file_id": FILE_ID, "question": "q"})
+    assert res.status_code == 200
+    assert res.text == "答案"
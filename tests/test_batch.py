@@ -0,0 +1,106 @@
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from src.datamodel import ParagraphChunk
+from src.pipeline import batch
+from src.pipeline.batch import BatchIngestor
+from src.pipeline.dedup import FileHashIndex
+
+
+def test_batch_pipelines_stages(tmp_path, monkeypatch):
+    active = {"parse": 0, "filter": 0}
+    overlap = threading.Event()
+    lock = threading.Lock()
+
+    def track(stage, other):
+        with lock:
+            active[stage] += 1
+            if active[other]:
+                overlap.set()
+        time.sleep(0.05)
+        with lock:
+            active[stage] -= 1
+
+    def fake_parse(path, file_id, data_dir):
+        track("parse", "filter")
+        return [ParagraphChunk(id=file_id, page_content=path, metadata={})]
+
+    def fake_filter(docs, file_id, data_dir):
+        track("filter", "parse")
+        return docs
+
+    def fake_embed(path, file_id, chunks, emb_cfg, data_dir, consume_source=True):
+        return SimpleNamespace(stats={"tokens_per_s": 0.0})
+
+    monkeypatch.setattr(batch, "parse_stage", fake_parse)
+    monkeypatch.setattr(batch, "filter_stage", fake_filter)
+    monkeypatch.setattr(batch, "embed_stage", fake_embed)
+
+    paths = []
+    for i in range(4):
+        p = tmp_path / f"{i}.pdf"
+        p.write_bytes(b"pdf %d" % i)
+        paths.append(str(p))
+
+    done = []
+    ingestor = BatchIngestor({}, index=FileHashIndex(str(tmp_path / "idx.json")),
+                             data_dir=str(tmp_path), parse_workers=1, filter_workers=1,
+                             embed_workers=1, on_done=lambda d, c, e: done.append(d.name))
+    reports = []
+    results = ingestor.run(paths, lambda stage, progress=None, details=None: reports.append(progress))
+
+    assert [r["stage"] for r in results] == ["done"] * 4
+    assert sorted(done) == ["0.pdf", "1.pdf", "2.pdf", "3.pdf"]
+    assert overlap.is_set()
+    assert reports[-1] == 1.0
+
+
+def test_batch_isolates_failures(tmp_path, monkeypatch):
+    def fake_parse(path, file_id, data_dir):
+        if path.endswith("bad.pdf"):
+            raise RuntimeError("parse failed")
+        return []
+
+    monkeypatch.setattr(batch, "parse_stage", fake_parse)
+    monkeypatch.setattr(batch, "filter_stage", lambda docs, fid, d: docs)
+    monkeypatch.setattr(batch, "embed_stage", lambda *a, **k: SimpleNamespace(stats={"tokens_per_s": 0.0}))
+
+    good, bad = tmp_path / "good.pdf", tmp_path / "bad.pdf"
+    good.write_bytes(b"good")
+    bad.write_bytes(b"bad")
+    results = BatchIngestor({}, data_dir=str(tmp_path)).run([str(good), str(bad)])
+    assert results[0]["stage"] == "done"
+    assert results[1]["stage"] == "failed"
+    assert "parse failed" in results[1]["error"]
+    assert not bad.exists()  # 上传的临时文件在失败时同样删除
+
+
+def test_duplicates_in_a_batch_do_not_hold_parse_workers(tmp_path, monkeypatch):
+    other_parsed = threading.Event()
+    overlapped = []
+
+    def fake_parse(path, file_id, data_dir):
+        name = Path(path).name
+        if name == "b.pdf":
+            other_parsed.set()
+        elif name == "a.pdf":
+            # 第一个文档解析期间，另一个解析线程应能处理 b 而不是阻塞在重复文档的哈希锁上
+            overlapped.append(other_parsed.wait(1))
+        return []
+
+    monkeypatch.setattr(batch, "parse_stage", fake_parse)
+    monkeypatch.setattr(batch, "filter_stage", lambda docs, fid, d: docs)
+    monkeypatch.setattr(batch, "embed_stage", lambda *a, **k: SimpleNamespace(stats={"tokens_per_s": 0.0}))
+
+    paths = []
+    for name, data in (("a.pdf", b"same"), ("a_copy.pdf", b"same"), ("b.pdf", b"other")):
+        (tmp_path / name).write_bytes(data)
+        paths.append(str(tmp_path / name))
+    results = BatchIngestor({}, index=FileHashIndex(str(tmp_path / "idx.json")), data_dir=str(tmp_path),
+                            parse_workers=2, consume_source=False).run(paths)
+
+    assert overlapped == [True]
+    assert [r["stage"] for r in results] == ["done"] * 3
+    assert results[0]["file_id"] == results[1]["file_id"] != results[2]["file_id"]
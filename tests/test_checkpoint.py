@@ -0,0 +1,30 @@
+from src.datamodel import ParagraphChunk
+from src.pipeline.checkpoint import StageCheckpoint, FilterResultLog
+
+
+def test_stage_roundtrip(tmp_path):
+    ckpt = StageCheckpoint("fid", base_dir=str(tmp_path))
+    assert not ckpt.has("paragraphs")
+    docs = [ParagraphChunk(id="a", page_content="x", metadata={"page_num": 0})]
+    ckpt.save_chunks("paragraphs", docs)
+
+    again = StageCheckpoint("fid", base_dir=str(tmp_path))
+    assert again.has("paragraphs")
+    assert again.load_chunks("paragraphs") == docs
+
+
+def test_filter_log_resumes_and_skips_partial_line(tmp_path):
+    path = tmp_path / "filter_results.jsonl"
+    log = FilterResultLog(path)
+    log.put("main:0:a", {"state_code": "001"})
+    log.put("main:0:b", {"state_code": "003"})
+    with path.open("a", encoding="utf-8") as f:
+        f.write('{"key": "main:0:c", "res')  # 模拟写入中途崩溃
+
+    resumed = FilterResultLog(path)
+    assert len(resumed) == 2
+    assert resumed.get("main:0:a") == {"state_code": "001"}
+    assert resumed.get("main:0:c") is None
+
+    resumed.put("main:0:c", {"state_code": "002"})
+    assert FilterResultLog(path).get("main:0:c") == {"state_code": "002"}
@@ -0,0 +1,72 @@
+from src.datamodel import ParagraphChunk
+from src.preprocessing.chunker import chunk_documents, detect_header_type, iter_chunks
+
+
+def make_docs(texts):
+    return [ParagraphChunk(id=str(i), page_content=t, metadata={"page_num": i})
+            for i, t in enumerate(texts)]
+
+
+def test_chunks_split_on_headers_and_budget():
+    docs = make_docs(["前言", "定理 1.1 设", "内容甲", "内容乙", "定义 2.1 称", "长" * 20, "尾注"])
+    chunks = chunk_documents(docs, MAX_TOKEN=10, counter=len)
+    assert [c.page_content for c in chunks] == [
+        # 合并“内容甲”后超出阈值，闭合 chunk，紧随的非标题段被丢弃
+        ["定理 1.1 设", "内容甲"],
+        ["定义 2.1 称", "长" * 20],
+    ]
+    assert chunks[0].metadata["chunk_type"] == "theorem"
+    assert chunks[0].metadata["initial_id"] == "1"
+
+
+def test_iter_chunks_yields_before_input_ends():
+    seen = []
+
+    def source():
+        for d in make_docs(["定理 1 甲", "乙", "引理 2 丙", "丁"]):
+            seen.append(d.id)
+            yield d
+
+    it = iter_chunks(source())
+    first = next(it)
+    assert first.page_content == ["定理 1 甲", "乙"]
+    # 第一个 chunk 在读到下一个标题段时即产出，无需读完全部输入
+    assert seen == ["0", "1", "2"]
+    assert [c.page_content for c in it] == [["引理 2 丙", "丁"]]
+
+
+def test_detect_header_type_single_pattern():
+    assert detect_header_type("\u200b 定义 3.2 称") == "definition"
+    assert detect_header_type("例题 5 求") == "example"
+    assert detect_header_type("例 1．2·3 设") == "example"
+    assert detect_header_type("练习12") == "exercise"
+    assert detect_header_type("定理：无编号") is None
+    assert detect_header_type("由定理 1 可知") is None
+
+
+def test_header_types_classified_once(monkeypatch):
+    from src.preprocessing import chunker
+
+    calls = []
+    real = chunker.detect_header_type
+    monkeypatch.setattr(chunker, "detect_header_type", lambda t: calls.append(t) or real(t))
+    docs = make_docs(["定理 1 甲", "乙", "引理 2 丙"])
+    header_types = {}
+    chunk_documents(docs, header_types=header_types, counter=len)
+    assert header_types == {"0": "theorem", "1": None, "2": "lemma"}
+    for d in docs:
+        chunker.classify(d, header_types)
+    assert len(calls) == 3
+
+
+def test_chunk_ids_are_content_derived_and_unique():
+    def paragraphs():
+        return [
+            ParagraphChunk(id=f"p{i}", page_content=t, metadata={})
+            for i, t in enumerate(["定理 1 甲", "内容", "定理 1 甲", "内容", "定理 2 乙"])
+        ]
+
+    first = [c.id for c in chunk_documents(paragraphs(), counter=len)]
+    again = [c.id for c in chunk_documents(paragraphs(), counter=len)]
+    assert first == again
+    assert len(set(first)) == 3  # 内容相同的两个 chunk 以出现次序区分
@@ -0,0 +1,25 @@
+from unstructured.cleaners.core import clean_extra_whitespace, replace_unicode_quotes
+
+from src.datamodel import ParagraphChunk
+from src.preprocessing.cleaner import clean_documents, clean_text
+
+
+def test_clean_text_matches_unstructured_pipeline():
+    samples = [
+        "  定理 1.1\n设 $f$\xa0连续  ",
+        "\x93quoted\x94 &apos;x&apos;",
+        "â\x80\x93dash â\x80\x99s  ââ\x80\x80s'",
+        "\t　全角空白　\n",
+        "",
+    ]
+    for text in samples:
+        expected = clean_extra_whitespace(replace_unicode_quotes(text)).replace("\n", " ")
+        assert clean_text(text) == expected
+
+
+def test_clean_documents_keeps_order_and_input():
+    docs = [ParagraphChunk(id=str(i), page_content=f" 段落 {i}\n\n内容 ", metadata={}) for i in range(50)]
+    cleaned = clean_documents(docs)
+    assert [d.page_content for d in cleaned] == [f"段落 {i} 内容" for i in range(50)]
+    assert [d.id for d in cleaned] == [str(i) for i in range(50)]
+    assert docs[0].page_content == " 段落 0\n\n内容 "
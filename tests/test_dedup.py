@@ -0,0 +1,28 @@
+import hashlib
+
+from src.pipeline.dedup import FileHashIndex, hash_file
+
+
+def test_hash_file_matches_sha256(tmp_path):
+    path = tmp_path / "a.pdf"
+    data = b"%PDF-1.4 " * 1000
+    path.write_bytes(data)
+    assert hash_file(str(path), chunk_size=7) == hashlib.sha256(data).hexdigest()
+
+
+def test_index_persists_across_instances(tmp_path):
+    path = tmp_path / "file_index.json"
+    index = FileHashIndex(str(path))
+    assert index.get("abc") is None
+    index.put("abc", "file1")
+
+    reloaded = FileHashIndex(str(path))
+    assert reloaded.get("abc") == "file1"
+    reloaded.remove("abc")
+    assert FileHashIndex(str(path)).get("abc") is None
+
+
+def test_lock_for_same_digest_is_shared(tmp_path):
+    index = FileHashIndex(str(tmp_path / "idx.json"))
+    assert index.lock_for("h") is index.lock_for("h")
+    assert index.lock_for("h") is not index.lock_for("g")
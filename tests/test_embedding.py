@@ -0,0 +1,129 @@
+import threading
+import time
+
+from src.datamodel import ParagraphChunk
+from src.rag import embedding
+from src.rag.embedding import EmbeddingManager, plan_batches
+from src.utils.embedding_cache import EmbeddingCache
+from src.utils.rate_limit import ProviderLimiter
+
+
+def test_plan_batches_by_tokens_and_items():
+    assert plan_batches([3, 3, 3, 20, 1, 1], max_tokens=7, max_items=5) == [(0, 2), (2, 3), (3, 4), (4, 6)]
+    assert plan_batches([1] * 5, max_tokens=100, max_items=2) == [(0, 2), (2, 4), (4, 5)]
+    assert plan_batches([], max_tokens=10, max_items=2) == []
+
+
+def make_manager(cache, state):
+    lock = threading.Lock()
+
+    class Embedder:
+        def embed_list(self, texts):
+            state["embedded"].extend(texts)
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.02)
+            with lock:
+                state["active"] -= 1
+            return [[float(len(t))] for t in texts]
+
+    class Storage:
+        def __init__(self):
+            self.records = []
+
+        def add(self, records):
+            state["writer"].add(threading.get_ident())
+            self.records.extend(records)
+
+    mgr = EmbeddingManager.__new__(EmbeddingManager)
+    mgr.embedder, mgr.storage = Embedder(), Storage()
+    mgr.limiter = ProviderLimiter("p/embed")
+    mgr.batch_size, mgr.max_batch_tokens, mgr.concurrency = 4, 10, 3
+    mgr.stats = {"texts": 0, "cached": 0, "tokens": 0, "seconds": 0.0, "tokens_per_s": 0.0}
+    mgr.model_name, mgr.cache = "bge", cache
+    return mgr
+
+
+def docs_of(texts, file_id="f"):
+    return [
+        ParagraphChunk(id=f"{file_id}{i}", page_content=t, metadata={"file_id": file_id, "page_num": 1})
+        for i, t in enumerate(texts)
+    ]
+
+
+def test_add_documents_embeds_concurrently_and_writes_everything(monkeypatch, tmp_path):
+    monkeypatch.setattr(embedding, "count_tokens", len)
+    state = {"active": 0, "peak": 0, "writer": set(), "embedded": []}
+    mgr = make_manager(EmbeddingCache(tmp_path / "e.sqlite"), state)
+    docs = docs_of([chr(ord("a") + i) * (i % 5 + 1) for i in range(20)])
+    run = mgr.add_documents(docs)
+
+    assert sorted(r.id for r in mgr.storage.records) == sorted(d.id for d in docs)
+    assert all(r.vector == [float(len(r.payload["text"]))] for r in mgr.storage.records)
+    assert 1 < state["peak"] <= 3
+    assert state["writer"] == {threading.get_ident()}
+    assert run["tokens"] == sum(len(d.page_content) for d in docs) == mgr.stats["tokens"]
+    assert run["tokens_per_s"] > 0
+
+
+def test_cached_and_repeated_texts_are_embedded_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(embedding, "count_tokens", len)
+    cache = EmbeddingCache(tmp_path / "e.sqlite")
+    state = {"active": 0, "peak": 0, "writer": set(), "embedded": []}
+    first = make_manager(cache, state)
+    first.add_documents(docs_of(["定理 1", "定理 2", "定理  1"], "a"))
+    assert sorted(state["embedded"]) == ["定理 1", "定理 2"]
+
+    # 另一个文件的 collection 直接复用缓存，只计算新文本
+    second = make_manager(cache, state)
+    run = second.add_documents(docs_of(["定理 2", "定义 3", "定理 1"], "b"))
+    assert sorted(state["embedded"]) == ["定义 3", "定理 1", "定理 2"]
+    assert run["cached"] == 2
+    assert sorted(r.id for r in second.storage.records) == ["b0", "b1", "b2"]
+
+
+def test_sync_reuses_unchanged_chunks_and_removes_stale(local_embedding_cfg, monkeypatch):
+    mgr = EmbeddingManager(local_embedding_cfg, "sync")
+
+    def chunks(texts):
+        return [
+            ParagraphChunk(id=f"{i:032x}", page_content=t, metadata={"file_id": "f", "page_num": 1})
+            for i, t in texts.items()
+        ]
+
+    assert mgr.build_or_load(chunks({1: "群", 2: "环", 3: "域"}), force_rebuild=True) == {
+        "reused": 0, "added": 3, "updated": 0, "removed": 0,
+    }
+    written = []
+    monkeypatch.setattr(mgr, "add_documents", lambda docs: written.extend(d.page_content for d in docs))
+    summary = mgr.sync(chunks({1: "群", 2: "环 域", 4: "矩阵"}))
+    assert summary == {"reused": 1, "added": 1, "updated": 1, "removed": 1}
+    assert sorted(written) == ["环 域", "矩阵"]
+    assert set(mgr.indexed_hashes()) == {f"{1:032x}", f"{2:032x}"}
+
+
+def test_reparsing_the_same_content_updates_nothing(local_embedding_cfg):
+    from src.loaders.mineru_loader import parse_content_list
+    from src.preprocessing.chunker import chunk_documents
+
+    content = [
+        {"type": "text", "text": "定理 1.1 设 $f$ 在闭区间上连续。", "page_idx": 0},
+        {"type": "text", "text": "则 $f$ 有界。", "page_idx": 0},
+        {"type": "text", "text": "定义 1.2 满足结合律的幺半群称为群。", "page_idx": 1},
+    ]
+
+    def parse():
+        # 过滤后的 chunk 正文为字符串
+        chunks = chunk_documents(parse_content_list(content, "f"))
+        return [ParagraphChunk(id=c.id, page_content="\n".join(c.page_content), metadata=c.metadata)
+                for c in chunks]
+
+    mgr = EmbeddingManager(local_embedding_cfg, "reparse")
+    first = parse()
+    assert mgr.sync(first)["added"] == 2
+
+    second = parse()
+    # 段落 id 每次解析都重新生成，chunk id 由内容派生保持不变
+    assert [c.metadata["initial_id"] for c in second] != [c.metadata["initial_id"] for c in first]
+    assert mgr.sync(second) == {"reused": 2, "added": 0, "updated": 0, "removed": 0}
@@ -0,0 +1,37 @@
+import pytest
+
+from src.utils import embedding_cache
+from src.utils.embedding_cache import EmbeddingCache
+
+
+def test_key_depends_on_model_and_normalized_text():
+    assert EmbeddingCache.key("bge", "定理  1\n成立") == EmbeddingCache.key("bge", "定理 1 成立")
+    assert EmbeddingCache.key("bge", "定理 1") != EmbeddingCache.key("other", "定理 1")
+
+
+def test_get_put_many_round_trip(tmp_path):
+    path = tmp_path / "e.sqlite"
+    cache = EmbeddingCache(path)
+    cache.put_many([("a", [0.5, -1.0]), ("b", [2.0, 0.25])])
+    assert cache.get_many(["a", "c", "a"]) == {"a": [0.5, -1.0]}
+    assert EmbeddingCache(path).get_many(["b"]) == {"b": [2.0, 0.25]}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 2)
+
+
+def test_size_eviction_drops_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EVICT_EVERY", 1)
+    cache = EmbeddingCache(tmp_path / "e.sqlite", max_bytes=56)
+    cache.put_many([(k, [1.0] * 4) for k in "abc"])
+    cache.get_many(["a"])
+    cache.put_many([("d", [1.0] * 4)])
+    left = set(cache.get_many(list("abcd")))
+    assert {"a", "d"} <= left and len(left) == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disabled_cache_never_hits(tmp_path):
+    cache = EmbeddingCache(tmp_path / "e.sqlite", enabled=False)
+    cache.put_many([("a", [1.0])])
+    assert cache.get_many(["a"]) == {}
+    assert not (tmp_path / "e.sqlite").exists()
@@ -1,4 +1,5 @@
 import re
+
 from src.preprocessing.filterer import normalize_latex_block
 
 
@@ -8,3 +9,225 @@ def test_normalize_latex_block_newlines():
     assert re.search(r"\n\$\$\n", out)
     assert out.count("\n$$\n") == 2
     assert out.strip().endswith("after")
+
+
+def test_call_many_keeps_order_and_isolates_failures(monkeypatch):
+    import threading
+    import time
+    from src.preprocessing import filterer
+
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def fake_call(item):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.01 * (5 - item["i"] % 5))
+        with lock:
+            active[0] -= 1
+        if item["i"] == 3:
+            raise RuntimeError("boom")
+        return {"state_code": "001", "content": str(item["i"]), "summary": "", "number": ""}
+
+    class Cache(dict):
+        def put(self, key, value):
+            self[key] = value
+
+    monkeypatch.setattr(filterer, "_llm_call_once", fake_call)
+    monkeypatch.setattr(filterer, "get_model", lambda: None)
+    cache = Cache({"k0": {"state_code": "002", "content": "", "summary": "", "number": ""}})
+    items = [{"i": i} for i in range(10)]
+    out = filterer.call_many(items, [f"k{i}" for i in range(10)], cache=cache, max_workers=3, packed=False, rules=False)
+
+    assert out[0]["state_code"] == "002"
+    assert out[3] is None  # 请求失败与 003 区分开
+    assert [o["content"] for i, o in enumerate(out) if i not in (0, 3)] == [
+        str(i) for i in range(10) if i not in (0, 3)
+    ]
+    assert peak[0] <= 3
+    assert "k3" not in cache and "k9" in cache
+
+
+def test_packed_calls_fall_back_to_single_chunk(monkeypatch):
+    import json
+    from src.preprocessing import filterer
+
+    requests = []
+
+    def fake_complete(system_prompt, prompt, fmt):
+        data = json.loads(prompt.split("输入数据：\n", 1)[1])
+        requests.append(data)
+        if isinstance(data, dict):  # 单条回退
+            return json.dumps({"state_code": "001", "content": data["page_content"][0],
+                               "summary": "s", "number": ""})
+        results = [
+            {"index": d["index"], "state_code": "001", "content": d["page_content"][0],
+             "summary": "s", "number": ""}
+            for d in data if d["page_content"][0] != "bad"
+        ]
+        results.append({"index": 0, "state_code": "003", "content": "", "summary": "", "number": ""})
+        return json.dumps({"results": results})
+
+    monkeypatch.setattr(filterer, "_complete", fake_complete)
+    monkeypatch.setattr(filterer, "get_model", lambda: None)
+    monkeypatch.setattr(filterer, "pack_budget", lambda: 1000)
+    texts = ["a", "bad", "c", "d", "e"]
+    items = [{"chunk_type": "theorem", "page_content": [t]} for t in texts]
+    out = filterer.call_many(items, [str(i) for i in range(5)], max_workers=2, packed=True)
+
+    assert [o["content"] for o in out] == texts
+    assert out[0]["state_code"] == "001"  # 重复的 index 以首个为准
+    assert len(requests) == 2 and len(requests[0]) == 5
+
+
+def test_pack_items_respects_budget_and_item_limit(monkeypatch):
+    from src.preprocessing import filterer
+    from src.preprocessing.filterer import pack_items
+
+    monkeypatch.setattr(filterer, "count_tokens", len)
+    items = [{"page_content": ["x" * n]} for n in (10, 10, 10, 500, 10)]
+    packs = pack_items(items, list(range(5)), budget=100, max_items=2)
+    assert packs == [[0, 1], [2], [3], [4]]
+
+
+def test_call_many_reuses_llm_cache_across_runs(monkeypatch, isolated_llm_cache):
+    from src.preprocessing import filterer
+
+    calls = []
+
+    def fake_call(item):
+        calls.append(item["page_content"][0])
+        return {"state_code": "001", "content": item["page_content"][0], "summary": "", "number": ""}
+
+    monkeypatch.setattr(filterer, "_llm_call_once", fake_call)
+    monkeypatch.setattr(filterer, "get_model", lambda: None)
+    items = [{"chunk_type": "theorem", "page_content": [t]} for t in ("a", "b")]
+    first = filterer.call_many(items, ["f1:0", "f1:1"], packed=False)
+    # 另一个文件中内容相同的 chunk（id 不同）直接命中缓存
+    second = filterer.call_many(items, ["f2:0", "f2:1"], packed=False)
+    assert first == second
+    assert sorted(calls) == ["a", "b"]
+    assert isolated_llm_cache.stats()["hits"] == 2
+
+
+def test_local_number_prefers_header_and_validates_claims():
+    from src.preprocessing.filterer import local_number
+
+    assert local_number("定理 4．1．3 (中值定理) 设", "1.2") == "4.1.3"
+    assert local_number("命题Ⅲ 设 $G$ 为群", "") == ""
+    assert local_number("命题 A.2 设 $G$ 为群", "A.2") == "A.2"
+    assert local_number("命题 A.2 设 $G$ 为群", "5.1") is None
+    # 编号按边界比较，不能只是标题中某个编号的一部分
+    assert local_number("命题 A.11 设 $G$ 为群", "A.1") is None
+    assert local_number("命题 A.2.1 设 $G$ 为群", "A.2") is None
+    assert local_number("命题 B2.1 设", "2.1") is None
+    assert local_number("命题 A.2. 设", "A.2") == "A.2"
+
+
+def test_filter_and_convert_repairs_only_the_number(monkeypatch):
+    import json
+    from src.datamodel import ParagraphChunk
+    from src.preprocessing import filterer
+
+    verdicts = [
+        {"state_code": "001", "content": "甲", "summary": "s", "number": "9.9"},
+        {"state_code": "001", "content": "乙", "summary": "s", "number": "5.1"},
+        {"state_code": "002", "content": "", "summary": "", "number": ""},
+        {"state_code": "003", "content": "", "summary": "", "number": ""},
+    ]
+    prompts = []
+
+    def fake_complete(system_prompt, prompt, fmt):
+        prompts.append(prompt)
+        return json.dumps({"number": "A.2"})
+
+    monkeypatch.setattr(filterer, "call_many", lambda items, keys, **kw: verdicts)
+    monkeypatch.setattr(filterer, "_complete", fake_complete)
+    monkeypatch.setattr(filterer, "get_model", lambda: None)
+    chunks = [
+        ParagraphChunk(id=f"c{i}", page_content=[head, "后文"], metadata={"chunk_type": "theorem"})
+        for i, head in enumerate(["定理 1.2 设", "命题 A.2 设", "定理 3 如下", "定理 4 的证明"])
+    ]
+    ok, failed = filterer.filter_and_convert(chunks)
+    assert [c.metadata["number"] for c in ok] == ["1.2", "A.2"]
+    assert [c.id for c in failed] == ["c2"]
+    assert len(prompts) == 1 and "命题 A.2 设" in prompts[0] and "后文" not in prompts[0]
+
+
+def test_reply_missing_a_key_is_resent_then_failed(monkeypatch):
+    import json
+    from src.datamodel import ParagraphChunk
+    from src.preprocessing import filterer
+
+    replies = []
+
+    def fake_complete(system_prompt, prompt, fmt):
+        replies.append(prompt)
+        return json.dumps({"state_code": "001", "content": "甲", "number": ""})  # 缺少 summary
+
+    monkeypatch.setattr(filterer, "_complete", fake_complete)
+    monkeypatch.setattr(filterer, "get_model", lambda: None)
+    chunks = [ParagraphChunk(id="c0", page_content=["定理 1 设"], metadata={"chunk_type": "theorem"})]
+    ok, failed = filterer.filter_and_convert(chunks)
+    assert ok == [] and [c.id for c in failed] == ["c0"] and len(replies) == 3
+
+
+def test_only_schema_valid_results_are_cached(monkeypatch, isolated_llm_cache):
+    from src.preprocessing import filterer
+
+    class Cache(dict):
+        def put(self, key, value):
+            self[key] = value
+
+    def fake_call(item):
+        if item["page_content"][0] == "bad":
+            return {"state_code": "001", "content": "bad"}  # 缺少 summary 与 number
+        return {"state_code": "001", "content": item["page_content"][0], "summary": "", "number": ""}
+
+    monkeypatch.setattr(filterer, "_llm_call_once", fake_call)
+    monkeypatch.setattr(filterer, "get_model", lambda: None)
+    # 旧版本写入的异常结果视为未命中
+    cache = Cache({"k0": {"state_code": "001"}})
+    items = [{"chunk_type": "theorem", "page_content": [t]} for t in ("a", "bad")]
+    out = filterer.call_many(items, ["k0", "k1"], cache=cache, packed=False, rules=False)
+    assert out[0]["content"] == "a" and cache["k0"] == out[0]
+    assert "k1" not in cache
+    assert isolated_llm_cache.get(isolated_llm_cache.key(
+        "filter", filterer.agent_cfg["model_type"], filterer.PROMPT_VERSION, items[1])) is None
+
+
+def test_invalid_result_skips_only_that_chunk(monkeypatch):
+    from src.datamodel import ParagraphChunk
+    from src.preprocessing import filterer
+
+    verdicts = [
+        {"state_code": "001", "content": "甲"},
+        {"state_code": "001", "content": "乙", "summary": "s", "number": "2"},
+    ]
+    monkeypatch.setattr(filterer, "call_many", lambda items, keys, **kw: verdicts)
+    chunks = [ParagraphChunk(id=f"c{i}", page_content=[f"定理 {i + 1} 设"], metadata={"chunk_type": "theorem"})
+              for i in range(2)]
+    ok, failed = filterer.filter_and_convert(chunks)
+    assert [c.id for c in ok] == ["c1"] and failed == []
+
+
+def test_chunks_without_a_verdict_are_retried_not_dropped(monkeypatch):
+    import pytest
+    from src.datamodel import ParagraphChunk
+    from src.preprocessing import filterer
+
+    docs = [ParagraphChunk(id="p0", page_content="定理 1 设 $x$ 为实数。", metadata={})]
+    chunks = [ParagraphChunk(id="c0", page_content=[docs[0].page_content],
+                             metadata={"chunk_type": "theorem", "initial_id": "p0"})]
+    ok_verdict = {"state_code": "001", "content": docs[0].page_content, "summary": "s", "number": "1"}
+    replies = {"main": [None], "retry": [None, ok_verdict]}
+    monkeypatch.setattr(filterer, "call_many", lambda items, keys, **kw: [replies[keys[0].split(":")[0]].pop(0)])
+
+    ok, failed = filterer.filter_and_convert(chunks)
+    assert ok == [] and [c.id for c in failed] == ["c0"]
+    # 重试轮仍失败时不能当作完成
+    with pytest.raises(filterer.FilterIncomplete):
+        filterer.retry_failed(failed, docs)
+    retried = filterer.retry_failed(failed, docs)
+    assert [c.metadata["number"] for c in retried] == ["1"]
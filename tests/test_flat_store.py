@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+from camel.storages.vectordb_storages import VectorDBQuery, VectorRecord
+
+from src.datamodel import ParagraphChunk
+from src.rag.embedding import EmbeddingManager
+from src.rag.flat_store import FlatVectorStorage, quantize_int8
+from src.rag.retriever import RetrieverManager
+
+DIM = 64
+
+
+def random_records(n, seed=0, offset=0):
+    rng = np.random.default_rng(seed)
+    vecs = rng.standard_normal((n, DIM)).astype(np.float32)
+    return [
+        VectorRecord(id=f"{offset + i:032x}", vector=v.tolist(), payload={"i": offset + i})
+        for i, v in enumerate(vecs)
+    ], vecs
+
+
+def exact_top(vecs, q, k):
+    v = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    return list(np.argsort(-(v @ (q / np.linalg.norm(q))))[:k])
+
+
+def test_exact_query_matches_brute_force_and_persists(tmp_path):
+    store = FlatVectorStorage(DIM, str(tmp_path), "c")
+    records, vecs = random_records(200)
+    store.add(records[:120])
+    store.add(records[120:])
+    q = np.random.default_rng(1).standard_normal(DIM).astype(np.float32)
+    hits = store.query(VectorDBQuery(query_vector=q.tolist(), top_k=10))
+    assert [h.record.payload["i"] for h in hits] == exact_top(vecs, q, 10)
+    assert hits[0].similarity >= hits[-1].similarity
+
+    reopened = FlatVectorStorage(DIM, str(tmp_path), "c")
+    assert reopened.status().vector_count == 200
+    again = reopened.query(VectorDBQuery(query_vector=q.tolist(), top_k=10))
+    assert [h.record.id for h in again] == [h.record.id for h in hits]
+
+
+def test_upsert_and_delete(tmp_path):
+    store = FlatVectorStorage(DIM, str(tmp_path), "c")
+    records, _ = random_records(5)
+    store.add(records)
+    target = np.zeros(DIM, dtype=np.float32)
+    target[0] = 1.0
+    # 同一 id（带连字符的 UUID 写法）覆盖原行而不是追加
+    dashed = "00000000-0000-0000-0000-000000000003"
+    store.add([VectorRecord(id=dashed, vector=target.tolist(), payload={"i": "new"})])
+    assert store.status().vector_count == 5
+    hit = store.query(VectorDBQuery(query_vector=target.tolist(), top_k=1))[0]
+    assert hit.record.payload == {"i": "new"} and hit.similarity == pytest.approx(1.0)
+
+    store.delete(ids=[records[0].id, dashed])
+    assert store.status().vector_count == 3
+    assert sorted(h for _, h in store.payload_values("i")) == [1, 2, 4]
+    with pytest.raises(ValueError):
+        store.delete()
+
+
+# 一位量化的粗排较粗，需要更多候选参与精排
+@pytest.mark.parametrize("quantization,rescore", [("int8", 4), ("binary", 20)])
+def test_quantized_search_rescores_to_exact_order(tmp_path, quantization, rescore):
+    records, vecs = random_records(500, seed=2)
+    store = FlatVectorStorage(DIM, str(tmp_path), "q", quantization=quantization, rescore=rescore)
+    store.add(records)
+    rng = np.random.default_rng(3)
+    recall = []
+    for _ in range(20):
+        q = vecs[rng.integers(500)] + 0.3 * rng.standard_normal(DIM).astype(np.float32)
+        hits = store.query(VectorDBQuery(query_vector=q.tolist(), top_k=5))
+        got = [h.record.payload["i"] for h in hits]
+        assert got[0] == exact_top(vecs, q, 1)[0]
+        # 精排后的相似度是 float32 精确值
+        assert [h.similarity for h in hits] == sorted((h.similarity for h in hits), reverse=True)
+        recall.append(len(set(got) & set(exact_top(vecs, q, 5))) / 5)
+    assert np.mean(recall) >= 0.9
+
+
+def test_int8_roundtrip_error_is_small():
+    vecs = np.random.default_rng(4).standard_normal((10, DIM)).astype(np.float32)
+    codes, scales = quantize_int8(vecs)
+    assert np.abs(codes * scales[:, None] - vecs).max() <= scales.max() / 2 + 1e-6
+
+
+def test_changing_quantization_rebuilds_codes(tmp_path):
+    records, vecs = random_records(50, seed=5)
+    FlatVectorStorage(DIM, str(tmp_path), "c").add(records)
+    store = FlatVectorStorage(DIM, str(tmp_path), "c", quantization="int8")
+    assert (tmp_path / "flat" / "c" / "codes.i8").stat().st_size == 50 * DIM
+    hits = store.query(VectorDBQuery(query_vector=vecs[7].tolist(), top_k=1))
+    assert hits[0].record.payload["i"] == 7
+
+
+def test_reopen_trims_rows_left_by_an_interrupted_append(tmp_path):
+    records, vecs = random_records(30, seed=6)
+    store = FlatVectorStorage(DIM, str(tmp_path), "c", quantization="int8")
+    store.add(records[:20])
+    # 模拟追加中断：向量与量化码已写入，records.jsonl 只写了半行
+    d = tmp_path / "flat" / "c"
+    with (d / "vectors.f32").open("ab") as f:
+        f.write(vecs[20:25].tobytes())
+    with (d / "codes.i8").open("ab") as f:
+        f.write(b"\0" * DIM * 3)
+    with (d / "records.jsonl").open("a", encoding="utf-8") as f:
+        f.write('{"id": "torn')
+
+    store = FlatVectorStorage(DIM, str(tmp_path), "c", quantization="int8")
+    assert store.status().vector_count == 20
+    store.add(records[20:])
+    assert (d / "vectors.f32").stat().st_size == 30 * DIM * 4
+    assert (d / "codes.i8").stat().st_size == 30 * DIM
+    for i in (3, 27):
+        hit = store.query(VectorDBQuery(query_vector=vecs[i].tolist(), top_k=1))[0]
+        assert hit.record.payload["i"] == i and hit.similarity == pytest.approx(1.0, abs=1e-5)
+
+
+def test_flat_store_plugs_into_retriever(local_embedding_cfg):
+    cfg = {**local_embedding_cfg, "store": "flat", "flat": {"quantization": "int8"}}
+    mgr = EmbeddingManager(cfg, "flat")
+    assert isinstance(mgr.storage, FlatVectorStorage)
+    docs = [
+        ParagraphChunk(id=f"{i:032x}", page_content=t,
+                       metadata={"file_id": "f", "page_num": 1, "chunk_id": str(i)})
+        for i, t in enumerate(["设函数连续可导", "群 环 域", "矩阵 向量空间"])
+    ]
+    assert mgr.build_or_load(docs)["added"] == 3
+    hits = RetrieverManager(mgr, {"top_k": 1}).retrieve("群 环", top_k=1)
+    assert hits[0]["metadata"]["chunk_id"] == "1"
+    assert mgr.sync(docs) == {"reused": 3, "added": 0, "updated": 0, "removed": 0}
+
+
+def test_rewrite_interrupted_between_swaps_keeps_the_collection(tmp_path, monkeypatch):
+    from src.rag import flat_store
+
+    records, _ = random_records(5, seed=7)
+    store = FlatVectorStorage(DIM, str(tmp_path), "c")
+    store.add(records)
+    real_replace = flat_store.os.replace
+
+    def crash_on_swap_in(src, dst):
+        if str(src).endswith(".tmp"):
+            raise KeyboardInterrupt  # 原目录已移开，新目录尚未换入
+        real_replace(src, dst)
+
+    monkeypatch.setattr(flat_store.os, "replace", crash_on_swap_in)
+    with pytest.raises(KeyboardInterrupt):
+        store.delete(ids=[records[0].id])
+    monkeypatch.setattr(flat_store.os, "replace", real_replace)
+    assert not (tmp_path / "flat" / "c").exists()
+
+    reopened = FlatVectorStorage(DIM, str(tmp_path), "c")
+    assert sorted(h for _, h in reopened.payload_values("i")) == [1, 2, 3, 4]
+    assert sorted(p.name for p in (tmp_path / "flat").iterdir()) == ["c"]
+
+    # 新目录未写完（没有 meta.json）时恢复原目录
+    (tmp_path / "flat" / "c").rename(tmp_path / "flat" / "c.old")
+    (tmp_path / "flat" / "c.tmp").mkdir()
+    reopened = FlatVectorStorage(DIM, str(tmp_path), "c")
+    assert reopened.status().vector_count == 4
+    assert sorted(p.name for p in (tmp_path / "flat").iterdir()) == ["c"]
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import httpx
+
+from src.utils.http import HostLimitedTransport, get_http_client, use_shared_client
+
+
+def test_host_limit_caps_concurrency(monkeypatch):
+    state = {"active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def fake_handle(self, request):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.02)
+        with lock:
+            state["active"] -= 1
+        return httpx.Response(200, stream=httpx.ByteStream(b"ok"))
+
+    monkeypatch.setattr(httpx.HTTPTransport, "handle_request", fake_handle)
+    client = httpx.Client(transport=HostLimitedTransport(default_limit=4, host_limits={"slow": 1}))
+
+    def call(host):
+        assert client.get(f"http://{host}/").text == "ok"
+
+    threads = [threading.Thread(target=call, args=("slow",)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert state["peak"] == 1
+
+
+def test_shared_client_is_singleton():
+    assert get_http_client() is get_http_client()
+
+
+def test_use_shared_client_swaps_openai_http_client():
+    import openai
+
+    class Holder:
+        _client = openai.OpenAI(api_key="x", base_url="http://localhost:1")
+
+    holder = Holder()
+    use_shared_client(holder)
+    assert holder._client._client is get_http_client()
+    assert holder._client.api_key == "x"
+
+
+def test_host_slot_wait_honours_pool_timeout(monkeypatch):
+    import pytest
+
+    release = threading.Event()
+
+    def fake_handle(self, request):
+        release.wait(2)
+        return httpx.Response(200, stream=httpx.ByteStream(b"ok"))
+
+    monkeypatch.setattr(httpx.HTTPTransport, "handle_request", fake_handle)
+    client = httpx.Client(transport=HostLimitedTransport(default_limit=1),
+                          timeout=httpx.Timeout(5, pool=0.05))
+    holder = threading.Thread(target=lambda: client.get("http://busy/"))
+    holder.start()
+    time.sleep(0.02)
+    with pytest.raises(httpx.PoolTimeout):
+        client.get("http://busy/")
+    release.set()
+    holder.join()
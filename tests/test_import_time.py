@@ -0,0 +1,7 @@
+from benchmarks.import_budget import heavy_imports, measure
+
+
+def test_api_server_import_is_light(tmp_path):
+    rows = measure("api_server", cwd=tmp_path)
+    slowest = "\n".join(f"{cum / 1e3:.1f}ms {name}" for cum, _, name in rows[:10])
+    assert heavy_imports(rows) == [], f"heavy modules imported at startup, slowest imports:\n{slowest}"
@@ -0,0 +1,110 @@
+import pytest
+
+from src.pipeline import ingest
+from src.datamodel import ParagraphChunk
+
+
+def test_failed_ingest_removes_uploaded_file(tmp_path, monkeypatch):
+    upload = tmp_path / "upload.pdf"
+    upload.write_bytes(b"%PDF-1.4")
+
+    def boom(*args, **kwargs):
+        raise RuntimeError("parse failed")
+
+    monkeypatch.setattr(ingest, "_run_stages", boom)
+    with pytest.raises(RuntimeError):
+        ingest.ingest_pdf(str(upload), {}, data_dir=str(tmp_path))
+    assert not upload.exists()
+
+
+class FakeEmbeddingManager:
+    def __init__(self, cfg, file_id):
+        self.stats = {"tokens_per_s": 0.0}
+        self.last_sync = None
+
+    def indexed_hashes(self):
+        return {}
+
+    def changed_documents(self, docs, indexed):
+        return list(docs)
+
+    def add_documents(self, docs):
+        pass
+
+    def finish_sync(self, docs, indexed, changed):
+        self.last_sync = {"reused": 0, "added": len(changed), "updated": 0, "removed": 0}
+        return self.last_sync
+
+
+def test_stream_resumes_from_block_log_and_writes_checkpoints(tmp_path, monkeypatch):
+    from src.pipeline.checkpoint import CONTENT_LIST, RAW_CHUNKS, FilterResultLog, StageCheckpoint
+
+    pages = [[{"type": "text", "text": f"定理 {p}.{i} 内容", "page_idx": p} for i in range(2)] for p in range(5)]
+    calls = {"starts": [], "caches": []}
+
+    def blocks(path, start_page=0, crash_at=None):
+        calls["starts"].append(start_page)
+        for p in range(start_page, 5):
+            for b in pages[p]:
+                if p == crash_at:
+                    raise RuntimeError("connection lost")
+                yield dict(b)
+
+    def fake_filter(chunks, cache=None, **kwargs):
+        calls["caches"].append(cache)
+        return list(chunks), []
+
+    monkeypatch.setattr(ingest, "EmbeddingManager", FakeEmbeddingManager)
+    monkeypatch.setattr(ingest, "filter_and_convert", fake_filter)
+    monkeypatch.setattr(ingest, "retry_failed", lambda *a, **k: [])
+    monkeypatch.setattr(ingest, "iter_mineru_blocks", lambda path, start_page=0: blocks(path, start_page, 3))
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    with pytest.raises(RuntimeError):
+        ingest.stream_stages(str(pdf), "fid", {}, data_dir=str(tmp_path), consume_source=False, micro_batch=2)
+
+    monkeypatch.setattr(ingest, "iter_mineru_blocks", lambda path, start_page=0: blocks(path, start_page))
+    _, results, _ = ingest.stream_stages(str(pdf), "fid", {}, data_dir=str(tmp_path),
+                                         consume_source=False, micro_batch=2)
+    # 第 0-2 页已完整写入 block log，最后一页可能不全，从第 2 页重新解析
+    assert calls["starts"] == [0, 2]
+    assert all(isinstance(c, FilterResultLog) for c in calls["caches"])
+    ckpt = StageCheckpoint("fid", base_dir=str(tmp_path / "relation_store"))
+    assert ckpt.load(CONTENT_LIST) == [b for page in pages for b in page]
+    assert len(ckpt.load(RAW_CHUNKS)) == len(results) == 10
+    assert not (ckpt.dir / "stream_blocks.jsonl").exists()
+
+
+def test_stream_reingest_reuses_unchanged_and_removes_stale_chunks(tmp_path, monkeypatch, local_embedding_cfg):
+    from src.rag.embedding import point_id
+
+    def blocks(n_pages):
+        for p in range(n_pages):
+            yield {"type": "title", "text": f"第 {p} 节", "text_level": 1, "page_idx": p}
+            yield {"type": "text", "text": f"定理 {p}：内容 {p}", "page_idx": p}
+
+    def fake_filter(chunks, cache=None, **kwargs):
+        # 过滤后的 chunk 正文为字符串
+        return [ParagraphChunk(id=c.id, page_content="\n".join(c.page_content), metadata=c.metadata)
+                for c in chunks], []
+
+    monkeypatch.setattr(ingest, "filter_and_convert", fake_filter)
+    monkeypatch.setattr(ingest, "retry_failed", lambda *a, **k: [])
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    reports = []
+
+    def run(n_pages):
+        monkeypatch.setattr(ingest, "iter_mineru_blocks", lambda path, start_page=0: blocks(n_pages))
+        return ingest.stream_stages(str(pdf), "fid", local_embedding_cfg, data_dir=str(tmp_path),
+                                    consume_source=False, micro_batch=2,
+                                    report=lambda stage, progress, info=None: reports.append((stage, info)))
+
+    _, first, emb_mgr = run(4)
+    assert emb_mgr.last_sync["added"] == len(first) == 4
+
+    _, second, emb_mgr = run(2)
+    assert emb_mgr.last_sync == {"reused": 2, "added": 0, "updated": 0, "removed": 2}
+    assert set(emb_mgr.indexed_hashes()) == {point_id(c.id) for c in second}
+    assert reports[-1] == ("done", {"file_id": "fid", "indexed": 2, "index": emb_mgr.last_sync,
+                                    "embed_tokens_per_s": emb_mgr.stats["tokens_per_s"]})
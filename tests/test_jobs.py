@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from src.pipeline.jobs import JobManager, JobQueueFull
+
+
+def wait_for(mgr, job_id, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        job = mgr.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_job_reports_stage_and_result():
+    mgr = JobManager(max_workers=1)
+
+    def work(report, x):
+        report("compute", 0.5)
+        return x * 2
+
+    job = mgr.submit("test", work, 21)
+    info = wait_for(mgr, job.id)
+    assert info["status"] == "done"
+    assert info["result"] == 42
+    assert info["stage"] == "compute"
+    assert info["progress"] == 1.0
+    mgr.shutdown()
+
+
+def test_job_failure_recorded():
+    mgr = JobManager(max_workers=1)
+
+    def work(report):
+        raise ValueError("boom")
+
+    job = mgr.submit("test", work)
+    info = wait_for(mgr, job.id)
+    assert info["status"] == "failed"
+    assert "boom" in info["error"]
+    mgr.shutdown()
+
+
+def test_queue_bound():
+    mgr = JobManager(max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    def work(report):
+        release.wait(5)
+
+    mgr.submit("test", work)
+    with pytest.raises(JobQueueFull):
+        mgr.submit("test", work)
+    release.set()
+    mgr.shutdown()
+
+
+def test_unknown_job():
+    mgr = JobManager()
+    assert mgr.get("missing") is None
+    mgr.shutdown()
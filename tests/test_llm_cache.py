@@ -0,0 +1,53 @@
+import time
+
+from src.utils.llm_cache import LLMCache, prompt_version
+
+
+def test_key_normalizes_input_and_separates_versions():
+    a = LLMCache.key("filter", "m", "v1", {"b": [" x  y "], "a": 1})
+    b = LLMCache.key("filter", "m", "v1", {"a": 1, "b": [" x  y "]})
+    assert a == b
+    assert LLMCache.key("relation", "m", "v1", "定理  1\n推论") == LLMCache.key("relation", "m", "v1", "定理 1 推论")
+    assert a != LLMCache.key("filter", "m", "v2", {"a": 1, "b": [" x  y "]})
+    assert a != LLMCache.key("filter", "m2", "v1", {"a": 1, "b": [" x  y "]})
+    assert prompt_version("p", {"t": 1}) != prompt_version("p2", {"t": 1})
+
+
+def test_get_put_stats_and_persistence(tmp_path):
+    path = tmp_path / "c.sqlite"
+    cache = LLMCache(path)
+    assert cache.get("k") is None
+    cache.put("k", {"state_code": "001"})
+    assert cache.get("k") == {"state_code": "001"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert LLMCache(path).get("k") == {"state_code": "001"}
+
+
+def test_ttl_and_size_eviction(tmp_path, monkeypatch):
+    from src.utils import llm_cache
+
+    cache = LLMCache(tmp_path / "c.sqlite", ttl=10)
+    cache.put("old", 1)
+    real = time.time
+    monkeypatch.setattr(llm_cache.time, "time", lambda: real() + 60)
+    assert cache.get("old") is None
+
+    monkeypatch.setattr(llm_cache, "EVICT_EVERY", 1)
+    cache = LLMCache(tmp_path / "s.sqlite", max_bytes=1000)
+    for i in range(30):
+        cache.put(f"k{i}", "x" * 98)
+    assert cache.stats()["bytes"] <= 1000
+    assert cache.get("k29") is not None and cache.get("k0") is None
+
+
+def test_bypass_skips_reads_but_refreshes(tmp_path):
+    path = tmp_path / "c.sqlite"
+    LLMCache(path).put("k", 1)
+    bypass = LLMCache(path, bypass=True)
+    assert bypass.get("k") is None
+    bypass.put("k", 2)
+    assert LLMCache(path).get("k") == 2
+    off = LLMCache(tmp_path / "off.sqlite", enabled=False)
+    off.put("k", 1)
+    assert off.get("k") is None and not (tmp_path / "off.sqlite").exists()
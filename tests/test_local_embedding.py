@@ -0,0 +1,44 @@
+from pathlib import Path
+
+import numpy as np
+
+from src.datamodel import ParagraphChunk
+from src.rag.local_embedding import LocalEmbedding, pool_hidden, resolve_runtime
+
+TINY = Path(__file__).parent / "data" / "tiny_embedder"
+
+
+def test_tiny_model_is_static_and_batches_keep_order():
+    assert resolve_runtime(TINY) == "static"
+    texts = ["定理 1 设函数连续", "群", "矩阵 线性映射 的 定义", "群", "例 2"]
+    batched = LocalEmbedding(str(TINY), batch_size=2, threads=2)
+    single = LocalEmbedding(str(TINY), batch_size=1, threads=1)
+    a, b = np.array(batched.embed_list(texts)), np.array(single.embed_list(texts))
+    assert a.shape == (5, 16) and batched.get_output_dim() == 16
+    assert np.allclose(a, b, atol=1e-6)
+    assert np.allclose(np.linalg.norm(a, axis=1), 1.0)
+    assert np.allclose(a[1], a[3])
+
+
+def test_pooling_modes():
+    hidden = np.arange(12, dtype=np.float32).reshape(1, 3, 4)
+    mask = np.array([[1, 1, 0]])
+    assert pool_hidden(hidden, mask, "cls").tolist() == [[0, 1, 2, 3]]
+    assert pool_hidden(hidden, mask, "mean").tolist() == [[2, 3, 4, 5]]
+
+
+def test_local_backend_indexes_and_retrieves_offline(local_embedding_cfg):
+    from src.rag.embedding import EmbeddingManager
+    from src.rag.retriever import RetrieverManager
+
+    mgr = EmbeddingManager(local_embedding_cfg, "tiny")
+    assert mgr.limiter is None and mgr.model_name == "local:tiny_embedder:static"
+    texts = ["设函数连续可导", "群 环 域", "矩阵 向量空间"]
+    docs = [
+        ParagraphChunk(id=f"00000000-0000-0000-0000-00000000000{i}", page_content=t,
+                       metadata={"file_id": "f", "page_num": 1, "chunk_id": str(i)})
+        for i, t in enumerate(texts)
+    ]
+    mgr.add_documents(docs)
+    hits = RetrieverManager(mgr, {"top_k": 1}).retrieve("群 环", top_k=1)
+    assert hits[0]["metadata"]["chunk_id"] == "1"
@@ -0,0 +1,154 @@
+from io import BytesIO
+
+from pypdf import PdfReader, PdfWriter
+
+from src.loaders import mineru_loader
+from src.loaders.mineru_loader import MineruLoader, page_windows
+
+
+def make_pdf(path, pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=100, height=100)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def test_page_windows():
+    assert page_windows(5, 2) == [(0, 2), (2, 4), (4, 5)]
+    assert page_windows(4, 4) == [(0, 4)]
+
+
+def test_sharded_parse_merges_page_idx(tmp_path, monkeypatch):
+    path = tmp_path / "book.pdf"
+    make_pdf(path, 5)
+    calls = []
+
+    def fake_post(url, name, fp, dump_md, draw_layout):
+        pages = len(PdfReader(BytesIO(fp.read())).pages)
+        calls.append((url, name, pages))
+        return [{"type": "text", "text": f"{name}:{i}", "page_idx": i} for i in range(pages)]
+
+    monkeypatch.setattr(mineru_loader, "_post_pdf", fake_post)
+    blocks = MineruLoader(str(path), url=["http://a", "http://b"], shard_pages=2, max_workers=3)
+
+    assert [b["page_idx"] for b in blocks] == [0, 1, 2, 3, 4]
+    assert sorted(c[2] for c in calls) == [1, 2, 2]
+    assert {c[0] for c in calls} == {"http://a", "http://b"}
+
+
+def test_small_file_not_sharded(tmp_path, monkeypatch):
+    path = tmp_path / "note.pdf"
+    make_pdf(path, 2)
+    calls = []
+
+    def fake_post(url, name, fp, dump_md, draw_layout):
+        calls.append(name)
+        return [{"type": "text", "text": "x", "page_idx": 1}]
+
+    monkeypatch.setattr(mineru_loader, "_post_pdf", fake_post)
+    blocks = MineruLoader(str(path), url="http://a", shard_pages=10)
+    assert calls == ["note.pdf"]
+    assert blocks[0]["page_idx"] == 1
+
+
+def test_post_retries_when_service_busy(tmp_path, monkeypatch):
+    import httpx
+
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(200, json=[{"type": "text", "text": "x", "page_idx": 0}]),
+    ]
+    sent = []
+
+    class FakeClient:
+        def post(self, url, files, data, timeout):
+            sent.append(files["file"][1].read())
+            resp = responses.pop(0)
+            resp.request = httpx.Request("POST", url)
+            return resp
+
+    monkeypatch.setattr(mineru_loader, "get_http_client", lambda: FakeClient())
+    monkeypatch.setattr(mineru_loader.time, "sleep", lambda s: None)
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"%PDF")
+    with path.open("rb") as f:
+        blocks = mineru_loader._post_pdf("http://a", "a.pdf", f, False, False)
+    assert blocks[0]["text"] == "x"
+    assert sent == [b"%PDF", b"%PDF"]
+
+
+def test_iter_mineru_blocks_reads_ndjson(tmp_path, monkeypatch):
+    import json
+    import httpx
+
+    pages = [
+        {"page_idx": 0, "blocks": [{"type": "text", "text": "a", "page_idx": 0}]},
+        {"page_idx": 1, "blocks": []},
+        {"page_idx": 2, "blocks": [{"type": "text", "text": "b", "page_idx": 2}]},
+    ]
+
+    def handler(request):
+        body = "".join(json.dumps(p) + "\n" for p in pages)
+        return httpx.Response(200, text=body)
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(mineru_loader, "get_http_client", lambda: client)
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"%PDF")
+    blocks = list(mineru_loader.iter_mineru_blocks(str(path), url="http://mineru/parse_stream"))
+    assert [b["text"] for b in blocks] == ["a", "b"]
+    assert [b["page_idx"] for b in blocks] == [0, 2]
+
+
+def test_ocr_image_prefers_direct_endpoint(monkeypatch):
+    import httpx
+
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        return httpx.Response(200, json={"formulas": [{"latex": "a^2"}, {"latex": "b_1"}]})
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(mineru_loader, "get_http_client", lambda: client)
+    assert mineru_loader.ocr_image(b"img") == "a^2\nb_1"
+    assert seen == ["/ocr_image"]
+
+
+def test_ocr_image_falls_back_to_pdf_parse(monkeypatch):
+    import httpx
+    from PIL import Image
+
+    def handler(request):
+        if request.url.path == "/ocr_image":
+            return httpx.Response(404)
+        return httpx.Response(200, json=[{"type": "text", "text": "x+1", "page_idx": 0}])
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(mineru_loader, "get_http_client", lambda: client)
+    buf = BytesIO()
+    Image.new("RGB", (4, 4)).save(buf, format="PNG")
+    assert mineru_loader.ocr_image(buf.getvalue()) == "x+1"
+
+
+def test_stream_shards_across_urls_and_resumes_at_page(tmp_path, monkeypatch):
+    path = tmp_path / "book.pdf"
+    make_pdf(path, 5)
+    calls = []
+
+    def fake_stream(url, name, fp, window_pages, max_busy_retries=10):
+        pages = len(PdfReader(BytesIO(fp.read())).pages)
+        calls.append((url, pages))
+        for i in range(pages):
+            yield {"type": "text", "text": f"{name}:{i}", "page_idx": i}
+
+    monkeypatch.setattr(mineru_loader, "_stream_pdf", fake_stream)
+    blocks = list(mineru_loader.iter_mineru_blocks(str(path), url=["http://a", "http://b"], shard_pages=2))
+    assert [b["page_idx"] for b in blocks] == [0, 1, 2, 3, 4]
+    assert {c[0] for c in calls} == {"http://a", "http://b"}
+
+    calls.clear()
+    resumed = list(mineru_loader.iter_mineru_blocks(str(path), url="http://a", start_page=3))
+    assert [b["page_idx"] for b in resumed] == [3, 4]
+    assert calls == [("http://a", 2)]
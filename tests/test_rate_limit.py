@@ -0,0 +1,138 @@
+import threading
+import time
+
+import httpx
+import pytest
+
+from src.utils.rate_limit import Priority, ProviderLimiter, TokenBucket
+
+
+def status_error(code, headers=None):
+    request = httpx.Request("POST", "http://llm/")
+    response = httpx.Response(code, headers=headers, request=request)
+    return httpx.HTTPStatusError(str(code), request=request, response=response)
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60)  # 每秒补充 1 个
+    now = time.monotonic()
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(2, now) == pytest.approx(2, abs=0.05)
+    assert TokenBucket(None).wait_time(10**9, now) == 0
+
+
+def test_interactive_requests_go_first():
+    limiter = ProviderLimiter("p/m", max_concurrency=1, interactive_reserve=0)
+    blocker = limiter.acquire(priority=Priority.INGEST)
+    order = []
+
+    def worker(priority):
+        permit = limiter.acquire(priority=priority)
+        order.append(priority)
+        limiter.release(permit, latency=0.0)
+
+    threads = []
+    for p in (Priority.BACKGROUND, Priority.INGEST, Priority.INTERACTIVE):
+        t = threading.Thread(target=worker, args=(p,))
+        t.start()
+        threads.append(t)
+        time.sleep(0.02)
+    limiter.release(blocker, latency=0.0)
+    for t in threads:
+        t.join(2)
+    assert order == [Priority.INTERACTIVE, Priority.INGEST, Priority.BACKGROUND]
+
+
+def test_reserve_keeps_a_slot_for_interactive():
+    limiter = ProviderLimiter("p/m", max_concurrency=2, interactive_reserve=1)
+    first = limiter.acquire(priority=Priority.INGEST)
+    got = []
+    t = threading.Thread(target=lambda: got.append(limiter.acquire(priority=Priority.BACKGROUND)))
+    t.start()
+    t.join(0.1)
+    assert not got  # 剩下的名额留给交互请求
+    interactive = limiter.acquire(priority=Priority.INTERACTIVE)
+    assert limiter.in_flight == 2
+    limiter.release(first, latency=0.0)
+    limiter.release(interactive, latency=0.0)
+    t.join(2)
+    assert got
+
+
+def test_429_halves_concurrency_and_honours_retry_after():
+    limiter = ProviderLimiter("p/m", max_concurrency=8, max_tries=3)
+    calls = []
+
+    def fn():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise status_error(429, {"retry-after": "0.2"})
+        return "ok"
+
+    assert limiter.call(fn) == "ok"
+    assert calls[1] - calls[0] >= 0.19
+    assert limiter.throttled == 1
+    assert limiter.limit == pytest.approx(4 + 1 / 4)
+
+
+def test_non_retryable_errors_raise_immediately():
+    limiter = ProviderLimiter("p/m", max_tries=5)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise status_error(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        limiter.call(fn)
+    assert len(calls) == 1 and limiter.in_flight == 0
+
+
+def test_slow_responses_lower_concurrency():
+    limiter = ProviderLimiter("p/m", max_concurrency=10, latency_target=1.0)
+    permit = limiter.acquire()
+    limiter.release(permit, latency=5.0)
+    assert limiter.limit == pytest.approx(9.0)
+    permit = limiter.acquire()
+    permit.used_tokens = 50
+    limiter.release(permit, latency=0.1)
+    assert limiter.limit == pytest.approx(9 + 1 / 9)
+
+
+def test_solve_goes_first_across_models_through_the_provider_gate(monkeypatch):
+    from src.utils import rate_limit
+
+    cfg = {"rate_limit": {"default": {"max_concurrency": 8, "interactive_reserve": 0},
+                          "gate": {"max_concurrency": 1, "interactive_reserve": 0}}}
+    monkeypatch.setattr(rate_limit, "load_config", lambda name: cfg)
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    monkeypatch.setattr(rate_limit, "_gates", {})
+    # 过滤、建图用 PROCESS_MODEL，解答用 GENERATE_MODEL：模型不同，闸门相同
+    process = rate_limit.get_limiter("SILICONFLOW", "process-model")
+    generate = rate_limit.get_limiter("SILICONFLOW", "generate-model")
+    assert process.gate is generate.gate is not None
+
+    release = threading.Event()
+    order = []
+
+    def ingest(tag):
+        def fn():
+            order.append(tag)
+            release.wait(2)
+        process.call(fn, priority=Priority.INGEST)
+
+    threads = [threading.Thread(target=ingest, args=(f"ingest{i}",)) for i in range(3)]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+    solve = threading.Thread(target=lambda: generate.call(lambda: order.append("solve"),
+                                                          priority=Priority.INTERACTIVE))
+    solve.start()
+    time.sleep(0.05)
+    assert order == ["ingest0"]  # 闸门已满，其余入库请求在闸门处排队
+    release.set()
+    for t in threads + [solve]:
+        t.join(2)
+    assert order == ["ingest0", "solve", "ingest1", "ingest2"]
+    assert generate.gate.in_flight == 0 and process.in_flight == 0
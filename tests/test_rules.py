@@ -0,0 +1,71 @@
+import pytest
+
+from src.datamodel import ParagraphChunk
+from src.pipeline.checkpoint import RAW_CHUNKS, StageCheckpoint
+from src.preprocessing.rules import classify_chunk, evaluate
+
+
+def item(*paragraphs, chunk_type="theorem"):
+    return {"chunk_type": chunk_type, "page_content": list(paragraphs)}
+
+
+def test_reference_and_incomplete_chunks():
+    r = classify_chunk(item("定理 1.2 的证明依赖于引理 1.1。"))
+    assert (r.state_code, r.rule) == ("003", "reference") and r.confidence < 0.9
+    r = classify_chunk(item("定义 2.1 (群) 满足以下条件：", "$$ G $$ 其中元素满足如下："))
+    assert (r.state_code, r.confidence) == ("002", 0.95)
+
+
+@pytest.mark.parametrize("head", [
+    "定理 3.1 中值定理 设 $f$ 在 $[a,b]$ 上连续。",
+    "定理 5.2 中心极限定理 设 $X_1, X_2, \\ldots$ 独立同分布。",
+    "定义 2.1 给出映射 $f: A \\to B$。",
+    "定理 4.3 得证的条件如下。",
+])
+def test_entries_starting_like_references_are_not_dropped(head):
+    assert classify_chunk(item(head)).rule != "reference"
+
+
+def test_statement_before_proof_is_settled():
+    r = classify_chunk(item("定理 3.2 (中值定理) 设 $f$ 在 $[a,b]$ 上连续，", "$$ f(b)-f(a)=f'(\\xi)(b-a) $$", "证明 取辅助函数。"))
+    assert r.state_code == "001" and r.confidence >= 0.9
+    assert r.number == "3.2" and r.summary == "中值定理"
+    assert r.content == "定理 3.2 (中值定理) 设 $f$ 在 $[a,b]$ 上连续，\n$$ f(b)-f(a)=f'(\\xi)(b-a) $$"
+
+
+def test_ambiguous_without_title_or_ending():
+    assert classify_chunk(item("定理 3.2 设 $f$ 连续。")).state_code == ""
+    assert classify_chunk(item("定理 3.2 (中值定理) 设 $f$ 连续并且")).state_code == ""
+    assert classify_chunk(item("定理 3.2 (中值定理) 设 $f$ 连续。", "其后段落")).confidence < 0.9
+
+
+def test_call_many_skips_llm_for_confident_rules(monkeypatch):
+    from src.preprocessing import filterer
+
+    sent = []
+    monkeypatch.setattr(filterer, "get_model", lambda: None)
+    monkeypatch.setattr(filterer, "_llm_call_once", lambda it: sent.append(it) or {
+        "state_code": "003", "content": "", "summary": "", "number": ""})
+    items = [item("定理 1 (甲) 成立。"), item("定理 2 设 $x$ 为")]
+    out = filterer.call_many(items, ["a", "b"], packed=False, rules=True)
+    assert out[0]["state_code"] == "001" and out[0]["number"] == "1"
+    assert out[1]["state_code"] == "003"
+    assert sent == [items[1]]
+
+
+def test_evaluate_uses_stored_filter_results(tmp_path):
+    ckpt = StageCheckpoint("f1", base_dir=str(tmp_path))
+    chunks = [
+        ParagraphChunk(id="c1", page_content=["定理 1 (甲) 成立。"], metadata={"chunk_type": "theorem"}),
+        ParagraphChunk(id="c2", page_content=["引理 2 的推论"], metadata={"chunk_type": "lemma"}),
+        ParagraphChunk(id="c3", page_content=["例 3 求解", "计算"], metadata={"chunk_type": "example"}),
+    ]
+    ckpt.save_chunks(RAW_CHUNKS, chunks)
+    ckpt.filter_log.put("main:0:c1", {"state_code": "001", "content": "", "summary": "", "number": "1"})
+    ckpt.filter_log.put("main:0:c2", {"state_code": "001", "content": "", "summary": "", "number": "2"})
+    ckpt.filter_log.put("main:0:c3", {"state_code": "001", "content": "", "summary": "", "number": "3"})
+    report = evaluate([str(tmp_path / "f1")], threshold=0.9)
+    # 引用规则的置信度低于阈值，只统计到混淆矩阵中
+    assert report["chunks"] == 3 and report["settled"] == 1
+    assert report["agreement"] == pytest.approx(1.0)
+    assert report["confusion"] == {"001->001": 1, "003->001": 1}
@@ -0,0 +1,39 @@
+import asyncio
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+
+from src.utils.upload import save_upload, read_upload, UploadTooLarge
+
+
+def make_upload(data: bytes) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename="a.pdf")
+
+
+def test_save_upload_writes_in_chunks():
+    data = os.urandom(10_000)
+    path = asyncio.run(save_upload(make_upload(data), ".pdf", chunk_size=1024))
+    try:
+        assert path.endswith(".pdf")
+        with open(path, "rb") as f:
+            assert f.read() == data
+    finally:
+        os.remove(path)
+
+
+def test_save_upload_rejects_large_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("TMPDIR", str(tmp_path))
+    import tempfile
+    monkeypatch.setattr(tempfile, "tempdir", None)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(save_upload(make_upload(b"x" * 5000), max_bytes=4096, chunk_size=1024))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_read_upload_returns_bytes_and_enforces_limit():
+    data = os.urandom(5000)
+    assert asyncio.run(read_upload(make_upload(data), chunk_size=1024)) == data
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(read_upload(make_upload(data), max_bytes=4096, chunk_size=1024))